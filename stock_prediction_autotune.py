@@ -0,0 +1,244 @@
+# Copyright 2020-2026 Jordi Corbilla. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import os
+import json
+import hashlib
+import argparse
+import platform
+import traceback
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import pandas as pd
+
+from stock_prediction_universe_training import _init_worker
+
+DEFAULT_BATCH_SIZES = (10, 16, 32, 64, 128, 256)
+
+
+def machine_key():
+    # host, core count and CPU model: a tuned setting only carries over to the same hardware
+    cpu_model = platform.processor() or platform.machine()
+    if os.path.exists('/proc/cpuinfo'):
+        with open('/proc/cpuinfo', 'r', encoding='utf-8') as cpuinfo:
+            for line in cpuinfo:
+                if line.startswith('model name'):
+                    cpu_model = line.split(':', 1)[1].strip()
+                    break
+    digest = hashlib.sha256(cpu_model.encode('utf-8')).hexdigest()[:8]
+    return platform.node() + '_' + str(os.cpu_count()) + 'cpu_' + digest
+
+
+def thread_candidates(cores=None):
+    # powers of two up to the core count, and the core count itself
+    cores = cores or os.cpu_count() or 1
+    candidates = []
+    threads = 1
+    while threads < cores:
+        candidates.append(threads)
+        threads *= 2
+    candidates.append(cores)
+    return candidates
+
+
+def inter_op_threads(intra_op):
+    return 2 if intra_op >= 4 else 1
+
+
+class AutotuneStore:
+    def __init__(self, folder=None):
+        self.folder = folder if folder is not None else os.path.join(os.getcwd(), 'autotune')
+        self.path = os.path.join(self.folder, 'autotune.json')
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'r', encoding='utf-8') as store_file:
+            return json.load(store_file)
+
+    def _modes(self, entries, model_version, machine):
+        # settings of one version per training mode; files written before the mode level existed
+        # hold the setting directly and are read as the mode it was tuned for
+        modes = entries.get(machine or machine_key(), {}).get(model_version, {})
+        if 'batch_size' in modes:
+            modes = {modes.get('training_mode', 'default'): modes}
+        return modes
+
+    def get(self, model_version, training_mode='default', machine=None):
+        return self._modes(self._load(), model_version, machine).get(training_mode)
+
+    def get_all(self, model_version, machine=None):
+        return self._modes(self._load(), model_version, machine)
+
+    def put(self, model_version, setting, machine=None):
+        os.makedirs(self.folder, exist_ok=True)
+        entries = self._load()
+        modes = self._modes(entries, model_version, machine)
+        modes[setting['training_mode']] = setting
+        entries.setdefault(machine or machine_key(), {})[model_version] = modes
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as store_file:
+            json.dump(entries, store_file, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+def _probe(task):
+    # runs in a fresh process whose TensorFlow thread pools were sized by _init_worker
+    from stock_prediction_class import StockPrediction
+    from stock_prediction_data_provider import create_provider
+    from stock_prediction_feature_store import FeatureStore
+    from stock_prediction_training_benchmark import TrainingBenchmark
+
+    results = []
+    os.makedirs(task['probe_folder'], exist_ok=True)
+    with open(os.path.join(task['probe_folder'], 'probe_' + str(task['intra_op']) + '.log'), 'w', encoding='utf-8') as log_file:
+        with contextlib.redirect_stdout(log_file), contextlib.redirect_stderr(log_file):
+            stock = StockPrediction(
+                task['ticker'], pd.to_datetime(task['start_date']), pd.to_datetime(task['validation_date']),
+                task['probe_folder'], '', task['epochs'], task['time_steps'], 'autotune', task['batch_sizes'][0], task['interval'],
+            )
+            benchmark = TrainingBenchmark(
+                stock, provider=create_provider(task['data_provider']), feature_store=FeatureStore(),
+                forecast_horizon=task['forecast_horizon'], trend_window=task['trend_window'],
+            )
+            for batch_size in task['batch_sizes']:
+                try:
+                    result = benchmark.run_one(task['model_version'], task['training_mode'], batch_size)
+                    result.update({'intra_op': task['intra_op'], 'inter_op': task['inter_op'], 'error': None})
+                except Exception as error:
+                    traceback.print_exc()
+                    result = {'batch_size': batch_size, 'intra_op': task['intra_op'], 'inter_op': task['inter_op'], 'error': str(error)}
+                results.append(result)
+    return results
+
+
+def choose_setting(probes, quality_tolerance=0.1):
+    # the fastest probe whose val_loss is within quality_tolerance of the best val_loss seen, so a
+    # batch size that trains faster but converges worse in the same epochs is not picked
+    probes = probes[probes['error'].isna()]
+    if probes.empty:
+        return None
+    bound = probes['val_loss'].min() * (1.0 + quality_tolerance)
+    admissible = probes[probes['val_loss'] <= bound]
+    return admissible.sort_values('samples_per_second', ascending=False).iloc[0]
+
+
+class Autotuner:
+    def __init__(self, settings, data_provider='yahoo', batch_sizes=DEFAULT_BATCH_SIZES, threads=None, epochs=3,
+                 quality_tolerance=0.1, store=None):
+        self.settings = settings
+        self.data_provider = data_provider
+        self.batch_sizes = list(batch_sizes)
+        self.threads = list(threads) if threads else thread_candidates()
+        self.epochs = epochs
+        self.quality_tolerance = quality_tolerance
+        self.store = store if store is not None else AutotuneStore()
+
+    def tune(self, model_version, training_mode='default'):
+        probe_folder = os.path.join(self.store.folder, 'probes', model_version)
+        context = multiprocessing.get_context('spawn')
+        results = []
+        for intra_op in self.threads:
+            inter_op = inter_op_threads(intra_op)
+            print('Autotune ' + model_version + ': probing batch sizes ' + str(self.batch_sizes) + ' with '
+                  + str(intra_op) + ' intra-op / ' + str(inter_op) + ' inter-op threads')
+            task = dict(self.settings, model_version=model_version, training_mode=training_mode, epochs=self.epochs,
+                        batch_sizes=self.batch_sizes, intra_op=intra_op, inter_op=inter_op,
+                        data_provider=self.data_provider, probe_folder=probe_folder)
+            # thread pools are fixed once TensorFlow starts, every thread count gets its own process
+            with ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=_init_worker,
+                                     initargs=(intra_op, inter_op)) as executor:
+                results.extend(executor.submit(_probe, task).result())
+        probes = pd.DataFrame(results)
+        probes.to_csv(os.path.join(probe_folder, 'probes_' + datetime.today().strftime("%Y%m%d_%H%M%S") + '.csv'), index=False)
+        with pd.option_context('display.max_columns', None, 'display.width', 200):
+            print(probes[[column for column in ('batch_size', 'intra_op', 'inter_op', 'samples_per_second', 'val_loss', 'error') if column in probes]])
+        best = choose_setting(probes, self.quality_tolerance)
+        if best is None:
+            print('Error: every autotune probe failed, see ' + probe_folder)
+            return None
+        setting = {
+            'batch_size': int(best['batch_size']),
+            'intra_op': int(best['intra_op']),
+            'inter_op': int(best['inter_op']),
+            'training_mode': training_mode,
+            'samples_per_second': float(best['samples_per_second']),
+            'val_loss': float(best['val_loss']),
+            'quality_tolerance': self.quality_tolerance,
+            'tuned_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        self.store.put(model_version, setting)
+        print('Autotune ' + model_version + ': batch_size=' + str(setting['batch_size']) + ', ' + str(setting['intra_op'])
+              + ' intra-op threads, ' + str(setting['samples_per_second']) + ' samples/s, saved for ' + machine_key())
+        return setting
+
+
+def apply_threads(setting):
+    # must run before TensorFlow executes its first op
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(setting['intra_op'])
+    tf.config.threading.set_inter_op_parallelism_threads(setting['inter_op'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=("parsing arguments"))
+    parser.add_argument("-ticker", default="^FTSE")
+    parser.add_argument("-start_date", default="2017-11-01")
+    parser.add_argument("-validation_date", default="2021-09-01")
+    parser.add_argument("-time_steps", default="3")
+    parser.add_argument("-forecast_horizon", default="10")
+    parser.add_argument("-trend_window", default="60")
+    parser.add_argument("-interval", default="1d")
+    parser.add_argument("-model_version", default="v1,v2,v3,v4,v5,v6,v7,v8")
+    parser.add_argument("-training_mode", default="default", choices=["default", "jit", "steps", "compiled", "bf16"])
+    parser.add_argument("-batch_sizes", default=",".join(str(size) for size in DEFAULT_BATCH_SIZES))
+    parser.add_argument("-threads", default=None)
+    parser.add_argument("-epochs", default="3")
+    parser.add_argument("-quality_tolerance", default="0.1")
+    parser.add_argument("-data_provider", default="yahoo", choices=["yahoo", "replay", "synthetic"])
+    parser.add_argument("-show", default="false")
+
+    args = parser.parse_args()
+
+    STORE = AutotuneStore()
+    VERSIONS = [version.strip() for version in args.model_version.split(',') if version.strip()]
+    if str(args.show).lower() in ("1", "true", "yes", "y"):
+        print(machine_key())
+        for VERSION in VERSIONS:
+            for MODE, SETTING in sorted(STORE.get_all(VERSION).items()):
+                print(VERSION + ' / ' + MODE + ': ' + str(SETTING))
+    else:
+        SETTINGS = {
+            'ticker': args.ticker,
+            'start_date': args.start_date,
+            'validation_date': args.validation_date,
+            'time_steps': int(args.time_steps),
+            'forecast_horizon': int(args.forecast_horizon),
+            'trend_window': int(args.trend_window),
+            'interval': args.interval,
+        }
+        tuner = Autotuner(
+            SETTINGS,
+            data_provider=args.data_provider,
+            batch_sizes=[int(size) for size in args.batch_sizes.split(',')],
+            threads=[int(threads) for threads in args.threads.split(',')] if args.threads else None,
+            epochs=int(args.epochs),
+            quality_tolerance=float(args.quality_tolerance),
+            store=STORE,
+        )
+        for VERSION in VERSIONS:
+            tuner.tune(VERSION, args.training_mode)
@@ -0,0 +1,288 @@
+# Copyright 2020-2026 Jordi Corbilla. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import os
+import sys
+import json
+import time
+import argparse
+import traceback
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from stock_prediction_class import StockPrediction
+from stock_prediction_data_provider import FrameProvider, create_provider
+from stock_prediction_numpy import StockData
+from stock_prediction_universe_training import split_threads, _init_worker
+
+METRICS = ('mae', 'rmse', 'mape', 'direction_accuracy')
+
+
+def walk_forward_folds(index, first_split, fold_months=6, n_folds=None, min_test_bars=1):
+    # Each fold trains on everything before its split date and is scored on the bars up to the
+    # next split, the split then rolls forward by fold_months.
+    folds = []
+    split = pd.Timestamp(first_split)
+    last = index.max()
+    while split <= last and (n_folds is None or len(folds) < n_folds):
+        end = min(split + pd.DateOffset(months=fold_months), last + pd.Timedelta(days=1))
+        if ((index >= split) & (index < end)).sum() < min_test_bars:
+            break
+        folds.append((split, end))
+        split = split + pd.DateOffset(months=fold_months)
+    return folds
+
+
+def fold_metrics(predicted, actual, previous_close):
+    # previous_close is the actual close before each bar, the direction is scored against it
+    predicted = np.asarray(predicted, dtype=np.float64)
+    actual = np.asarray(actual, dtype=np.float64)
+    previous_close = np.asarray(previous_close, dtype=np.float64)
+    errors = predicted - actual
+    return {
+        'mae': float(np.mean(np.abs(errors))),
+        'rmse': float(np.sqrt(np.mean(errors ** 2))),
+        'mape': float(np.mean(np.abs(errors) / np.abs(actual)) * 100.0),
+        'direction_accuracy': float(np.mean(np.sign(predicted - previous_close) == np.sign(actual - previous_close))),
+    }
+
+
+def _fold_frame(job):
+    close = job['close']
+    predictions = pd.read_csv(os.path.join(job['run_folder'], 'predictions.csv'), index_col=0, parse_dates=True)
+    frame = pd.DataFrame({'predicted': pd.to_numeric(predictions.iloc[:, 0], errors='coerce')})
+    frame['actual'] = close.reindex(frame.index)
+    frame['previous_close'] = close.shift(1).reindex(frame.index)
+    frame = frame[(frame.index >= job['split']) & (frame.index < job['end'])]
+    return frame.dropna()
+
+
+def _run_fold(job):
+    from stock_prediction_deep_learning import train_LSTM_network
+    from stock_prediction_feature_store import FeatureStore
+
+    run_folder = job['run_folder']
+    os.makedirs(run_folder, exist_ok=True)
+    result = {
+        'fold': job['fold'], 'split': job['split'].strftime("%Y-%m-%d"), 'end': job['end'].strftime("%Y-%m-%d"),
+        'status': 'failed', 'seconds': 0.0, 'bars': 0, 'epochs_run': 0, 'best_val_loss': None,
+        'run_folder': run_folder, 'error': None,
+    }
+    started = time.perf_counter()
+    with open(os.path.join(run_folder, 'train.log'), 'w', encoding='utf-8') as log_file:
+        with contextlib.redirect_stdout(log_file), contextlib.redirect_stderr(log_file):
+            try:
+                ticker = job['ticker']
+                stock = StockPrediction(
+                    ticker,
+                    pd.to_datetime(job['start_date']),
+                    job['split'],
+                    run_folder,
+                    '',
+                    int(job['epochs']),
+                    int(job['time_steps']),
+                    # the README generator resolves the token against the working directory
+                    os.path.relpath(run_folder),
+                    int(job['batch_size']),
+                    job['interval'],
+                )
+                # the fold only ever sees the bars before its end, served from the shared download
+                close = job['close']
+                provider = FrameProvider(close[close.index < job['end']].to_frame(ticker), info={ticker: job['info']})
+                history = train_LSTM_network(
+                    stock,
+                    use_returns=job['use_returns'],
+                    model_version=job['model_version'],
+                    forecast_horizon=int(job['forecast_horizon']),
+                    trend_window=int(job['trend_window']),
+                    provider=provider,
+                    feature_store=FeatureStore() if job['feature_store'] else None,
+                    plot_mode='none',
+                    init_weights_folder=job.get('init_weights_folder'),
+                    tflite=False,
+                    # the fold's scoring window must not steer training
+                    validation_fraction=float(job.get('validation_fraction', 0.1)),
+                )
+                if history is None:
+                    result['error'] = 'training did not run, see train.log'
+                else:
+                    frame = _fold_frame(job)
+                    frame.to_csv(os.path.join(run_folder, 'fold_predictions.csv'))
+                    val_loss = history.history.get('val_loss', [])
+                    result['status'] = 'ok'
+                    result['bars'] = len(frame)
+                    result['epochs_run'] = len(history.history.get('loss', []))
+                    result['best_val_loss'] = float(min(val_loss)) if val_loss else None
+                    result.update(fold_metrics(frame['predicted'], frame['actual'], frame['previous_close']))
+            except Exception as error:
+                result['error'] = str(error)
+                traceback.print_exc()
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    return result
+
+
+class WalkForwardBacktester:
+    def __init__(self, workers=2, cores=None, data_provider='yahoo', output_folder=None):
+        self.workers, self.intra_op, self.inter_op = split_threads(workers, cores)
+        self.data_provider = data_provider
+        self.output_folder = output_folder if output_folder is not None else os.path.join(os.getcwd(), 'backtests')
+
+    def _download(self, settings):
+        # one download for every fold, the folds are cut from it
+        stock = StockPrediction(
+            settings['ticker'], pd.to_datetime(settings['start_date']), pd.to_datetime(settings['first_split']),
+            self.output_folder, '', int(settings['epochs']), int(settings['time_steps']), '', int(settings['batch_size']),
+            settings['interval'],
+        )
+        data = StockData(stock, provider=create_provider(self.data_provider))
+        close = data.download_raw_data()['Close']
+        if isinstance(close, pd.DataFrame):
+            close = close.iloc[:, 0]
+        info = {'shortName': data.get_stock_short_name(), 'currency': data.get_stock_currency()}
+        return close.astype(np.float64), info
+
+    def run(self, settings, fold_months=6, n_folds=None, warm_start=False):
+        backtest_folder = os.path.join(self.output_folder, settings['ticker'] + '_' + datetime.today().strftime("%Y%m%d_%H%M%S"))
+        os.makedirs(backtest_folder, exist_ok=True)
+        close, info = self._download(settings)
+        min_test_bars = int(settings['time_steps']) + int(settings['forecast_horizon']) + 1
+        folds = walk_forward_folds(close.index, settings['first_split'], fold_months, n_folds, min_test_bars)
+        if not folds:
+            print('Error: no fold has enough bars after ' + str(settings['first_split']))
+            return None
+        jobs = [
+            dict(settings, fold=fold, split=split, end=end, close=close, info=info,
+                 run_folder=os.path.join(backtest_folder, 'fold_' + str(fold)))
+            for fold, (split, end) in enumerate(folds)
+        ]
+        # warm-started folds depend on each other and run one after the other with every core
+        workers, intra_op, inter_op = (split_threads(1, self.workers * self.intra_op) if warm_start
+                                       else (self.workers, self.intra_op, self.inter_op))
+        print('Backtesting ' + settings['ticker'] + ' over ' + str(len(jobs)) + ' folds on ' + str(workers) + ' workers'
+              + (', each fold warm-started from the previous one' if warm_start else ''))
+        started = time.perf_counter()
+        results = {}
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(intra_op, inter_op)) as executor:
+            if warm_start:
+                for job in jobs:
+                    previous = results.get(job['fold'] - 1)
+                    if previous is not None and previous['status'] == 'ok':
+                        job['init_weights_folder'] = previous['run_folder']
+                    results[job['fold']] = executor.submit(_run_fold, job).result()
+                    self._report(results[job['fold']])
+            else:
+                futures = {executor.submit(_run_fold, job): job['fold'] for job in jobs}
+                for future in as_completed(futures):
+                    results[futures[future]] = future.result()
+                    self._report(results[futures[future]])
+        folds_frame = pd.DataFrame([results[job['fold']] for job in jobs]).set_index('fold')
+        summary = self.summarise(folds_frame, backtest_folder)
+        summary['wall_seconds'] = round(time.perf_counter() - started, 3)
+        summary['settings'] = {key: value for key, value in settings.items()}
+        summary['fold_months'] = fold_months
+        summary['warm_start'] = warm_start
+        folds_frame.to_csv(os.path.join(backtest_folder, 'folds.csv'))
+        with open(os.path.join(backtest_folder, 'summary.json'), 'w', encoding='utf-8') as summary_file:
+            json.dump(summary, summary_file, indent=2, default=str)
+        self.print_summary(folds_frame, summary)
+        print('Backtest written to ' + backtest_folder)
+        return folds_frame, summary
+
+    def _report(self, result):
+        print('fold ' + str(result['fold']) + ' (' + result['split'] + ' to ' + result['end'] + '): ' + result['status']
+              + ' in ' + str(result['seconds']) + 's')
+
+    def summarise(self, folds_frame, backtest_folder):
+        ok = folds_frame[folds_frame['status'] == 'ok']
+        summary = {'folds': len(folds_frame), 'folds_ok': len(ok)}
+        for metric in METRICS:
+            if metric in ok:
+                summary[metric + '_mean'] = float(ok[metric].mean())
+                summary[metric + '_std'] = float(ok[metric].std()) if len(ok) > 1 else 0.0
+        # every out-of-sample bar of every fold scored together
+        frames = [pd.read_csv(os.path.join(folder, 'fold_predictions.csv'), index_col=0) for folder in ok['run_folder']]
+        if frames:
+            pooled = pd.concat(frames)
+            summary['pooled'] = fold_metrics(pooled['predicted'], pooled['actual'], pooled['previous_close'])
+            summary['pooled']['bars'] = len(pooled)
+        return summary
+
+    def print_summary(self, folds_frame, summary):
+        with pd.option_context('display.max_columns', None, 'display.width', 200):
+            print(folds_frame[['split', 'end', 'status', 'bars', 'epochs_run'] + [metric for metric in METRICS if metric in folds_frame]])
+        print('Walk-forward: ' + str(summary['folds_ok']) + '/' + str(summary['folds']) + ' folds ok')
+        for metric in METRICS:
+            if metric + '_mean' in summary:
+                print(metric + ': ' + f"{summary[metric + '_mean']:.4f}" + ' +/- ' + f"{summary[metric + '_std']:.4f}"
+                      + (', pooled ' + f"{summary['pooled'][metric]:.4f}" if 'pooled' in summary else ''))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=("parsing arguments"))
+    parser.add_argument("-ticker", default="^FTSE")
+    parser.add_argument("-start_date", default="2017-11-01")
+    parser.add_argument("-first_split", default="2021-09-01")
+    parser.add_argument("-fold_months", default="6")
+    parser.add_argument("-n_folds", default=None)
+    parser.add_argument("-warm_start", default="false")
+    parser.add_argument("-epochs", default="100")
+    parser.add_argument("-batch_size", default="10")
+    parser.add_argument("-time_steps", default="3")
+    parser.add_argument("-use_returns", default="false")
+    parser.add_argument("-model_version", default="v7")
+    parser.add_argument("-forecast_horizon", default="10")
+    parser.add_argument("-trend_window", default="60")
+    parser.add_argument("-interval", default="1d")
+    parser.add_argument("-data_provider", default="yahoo", choices=["yahoo", "replay", "synthetic"])
+    parser.add_argument("-feature_store", default="false")
+    parser.add_argument("-validation_fraction", default="0.1")
+    parser.add_argument("-workers", default="2")
+    parser.add_argument("-cores", default=None)
+
+    args = parser.parse_args()
+
+    SETTINGS = {
+        'ticker': args.ticker,
+        'start_date': args.start_date,
+        'first_split': args.first_split,
+        'epochs': int(args.epochs),
+        'batch_size': int(args.batch_size),
+        'time_steps': int(args.time_steps),
+        'use_returns': str(args.use_returns).lower() in ("1", "true", "yes", "y"),
+        'model_version': args.model_version,
+        'forecast_horizon': int(args.forecast_horizon),
+        'trend_window': int(args.trend_window),
+        'interval': args.interval,
+        'feature_store': str(args.feature_store).lower() in ("1", "true", "yes", "y"),
+        'validation_fraction': float(args.validation_fraction),
+    }
+    backtester = WalkForwardBacktester(
+        workers=int(args.workers),
+        cores=int(args.cores) if args.cores else None,
+        data_provider=args.data_provider,
+    )
+    RESULT = backtester.run(
+        SETTINGS,
+        fold_months=int(args.fold_months),
+        n_folds=int(args.n_folds) if args.n_folds else None,
+        warm_start=str(args.warm_start).lower() in ("1", "true", "yes", "y"),
+    )
+    sys.exit(0 if RESULT is not None and RESULT[1]['folds_ok'] == RESULT[1]['folds'] else 1)
@@ -0,0 +1,142 @@
+# Copyright 2020-2026 Jordi Corbilla. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import copy
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import pandas as pd
+
+from stock_prediction_data_provider import MarketDataProvider, YahooFinanceProvider
+from stock_prediction_price_cache import PriceCache
+
+
+class RateLimiter:
+    def __init__(self, requests_per_second):
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    def acquire(self):
+        if self.interval <= 0:
+            return
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class RateLimitedProvider(MarketDataProvider):
+    # Wraps a provider so every remote call waits for a slot of the shared limiter. Providers that
+    # split a download into several requests (Yahoo's intraday chunks) get the limiter themselves and
+    # take one slot per request. The wrapped provider name is kept so the price cache folders stay the same.
+    def __init__(self, provider, limiter):
+        self.limits_requests = provider.limits_requests
+        if self.limits_requests:
+            provider = copy.copy(provider)
+            provider.limiter = limiter
+        self.provider = provider
+        self.limiter = limiter
+        self.name = provider.name
+        self.cacheable = provider.cacheable
+
+    def download(self, ticker, start, end, interval='1d'):
+        if not self.limits_requests:
+            self.limiter.acquire()
+        return self.provider.download(ticker, start, end, interval)
+
+    def get_info(self, ticker):
+        if not self.limits_requests:
+            self.limiter.acquire()
+        return self.provider.get_info(ticker)
+
+
+class BulkDownloader:
+    def __init__(self, provider=None, cache_folder=None, max_workers=8, requests_per_second=2.0, max_retries=3, backoff_seconds=1.0):
+        provider = provider if provider is not None else YahooFinanceProvider()
+        self.limiter = RateLimiter(requests_per_second)
+        self.provider = RateLimitedProvider(provider, self.limiter)
+        self.price_cache = PriceCache(cache_folder=cache_folder, provider=self.provider)
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+
+    def _download_one(self, ticker, start, end, interval):
+        started = time.perf_counter()
+        error = None
+        attempts = 0
+        for attempt in range(self.max_retries + 1):
+            attempts = attempt + 1
+            try:
+                if self.provider.cacheable:
+                    self.price_cache.update(ticker, start, end, interval)
+                    data = self.price_cache.read(ticker, start, end, interval)
+                else:
+                    data = self.price_cache.get(ticker, start, end, interval)
+                error = None
+                break
+            except Exception as exc:
+                error = str(exc)
+                if attempt < self.max_retries:
+                    time.sleep(self.backoff_seconds * (2 ** attempt))
+        if error is not None:
+            # keep whatever an earlier run left in the cache
+            data = self.price_cache.read(ticker, start, end, interval) if self.provider.cacheable else None
+            status = 'stale' if data is not None and not data.empty else 'failed'
+        elif data.empty:
+            status = 'failed'
+            error = 'no data returned'
+        else:
+            status = 'ok'
+        report = {
+            'status': status,
+            'rows': 0 if data is None else int(len(data)),
+            'attempts': attempts,
+            'seconds': round(time.perf_counter() - started, 3),
+            'error': error,
+        }
+        return data, report
+
+    def download(self, tickers, start, end=None, interval='1d', field='Close', join='outer'):
+        if end is None:
+            end = datetime.today()
+        columns = {}
+        report = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._download_one, ticker, start, end, interval): ticker for ticker in tickers}
+            for future in as_completed(futures):
+                ticker = futures[future]
+                data, report[ticker] = future.result()
+                if data is not None and not data.empty:
+                    columns[ticker] = data[field]
+        report = {ticker: report[ticker] for ticker in tickers}
+        ordered = [ticker for ticker in tickers if ticker in columns]
+        if ordered:
+            frame = pd.concat([columns[ticker] for ticker in ordered], axis=1, keys=ordered, join=join).sort_index()
+        else:
+            frame = pd.DataFrame(index=pd.DatetimeIndex([], name='Date'))
+        frame.index.name = 'Date'
+        self.print_report(report)
+        return frame, report
+
+    def print_report(self, report):
+        failed = [ticker for ticker, entry in report.items() if entry['status'] != 'ok']
+        print('Bulk download: ' + str(len(report) - len(failed)) + '/' + str(len(report)) + ' tickers ok')
+        for ticker in failed:
+            entry = report[ticker]
+            print('  ' + ticker + ': ' + entry['status'] + ' after ' + str(entry['attempts']) + ' attempts (' + str(entry['error']) + ')')
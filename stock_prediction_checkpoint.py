@@ -0,0 +1,105 @@
+# Copyright 2020-2026 Jordi Corbilla. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import os
+import json
+import shutil
+
+import numpy as np
+import tensorflow as tf
+
+# counters of EarlyStopping / ReduceLROnPlateau that on_train_begin would otherwise reset
+_CALLBACK_STATE = ('wait', 'best', 'best_epoch', 'stopped_epoch', 'cooldown_counter')
+
+
+def _json_value(value):
+    if isinstance(value, (np.floating, np.integer)):
+        return value.item()
+    if hasattr(value, 'numpy'):
+        return np.asarray(value).item()
+    return value
+
+
+# Saves the model with its optimizer state, the epoch, the history so far and the state of the
+# other callbacks after every epoch, so a killed fit can continue where it stopped.
+class TrainingCheckpoint(tf.keras.callbacks.Callback):
+    def __init__(self, checkpoint_folder, callbacks=None):
+        super().__init__()
+        self.checkpoint_folder = checkpoint_folder
+        self.callbacks = callbacks or []
+        self._model_path = os.path.join(checkpoint_folder, 'model.keras')
+        self._state_path = os.path.join(checkpoint_folder, 'state.json')
+        self.state = {'epoch': 0, 'completed': False, 'history': {}, 'callbacks': {}}
+        if os.path.exists(self._state_path):
+            with open(self._state_path, 'r', encoding='utf-8') as state_file:
+                self.state = json.load(state_file)
+
+    def get_initial_epoch(self):
+        return self.state['epoch']
+
+    def is_completed(self):
+        return self.state['completed']
+
+    def restore_model(self, model):
+        # the checkpointed model replaces the freshly built one when there is something to resume
+        if self.state['epoch'] > 0 and os.path.exists(self._model_path):
+            print('Resuming ' + self.checkpoint_folder + ' from epoch ' + str(self.state['epoch']))
+            return tf.keras.models.load_model(self._model_path)
+        return model
+
+    def get_history(self):
+        history = tf.keras.callbacks.History()
+        history.history = {name: list(values) for name, values in self.state['history'].items()}
+        history.epoch = list(range(self.state['epoch']))
+        return history
+
+    def _callback_key(self, index, callback):
+        return str(index) + '_' + type(callback).__name__
+
+    def on_train_begin(self, logs=None):
+        # runs after the callbacks listed before it have reset themselves
+        for index, callback in enumerate(self.callbacks):
+            for name, value in self.state['callbacks'].get(self._callback_key(index, callback), {}).items():
+                setattr(callback, name, value)
+
+    def _save(self):
+        os.makedirs(self.checkpoint_folder, exist_ok=True)
+        tmp_state_path = self._state_path + '.tmp'
+        with open(tmp_state_path, 'w', encoding='utf-8') as state_file:
+            json.dump(self.state, state_file, indent=2)
+        os.replace(tmp_state_path, self._state_path)
+
+    def on_epoch_end(self, epoch, logs=None):
+        for name, value in (logs or {}).items():
+            self.state['history'].setdefault(name, []).append(float(value))
+        self.state['epoch'] = epoch + 1
+        self.state['callbacks'] = {
+            self._callback_key(index, callback): {
+                name: _json_value(getattr(callback, name)) for name in _CALLBACK_STATE if hasattr(callback, name)
+            }
+            for index, callback in enumerate(self.callbacks)
+        }
+        os.makedirs(self.checkpoint_folder, exist_ok=True)
+        tmp_model_path = os.path.join(self.checkpoint_folder, 'model.partial.keras')
+        self.model.save(tmp_model_path)
+        os.replace(tmp_model_path, self._model_path)
+        self._save()
+
+    def on_train_end(self, logs=None):
+        self.state['completed'] = True
+        self._save()
+
+
+def remove_checkpoints(project_folder):
+    shutil.rmtree(os.path.join(project_folder, 'checkpoints'), ignore_errors=True)
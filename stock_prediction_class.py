@@ -15,7 +15,7 @@
 
 
 class StockPrediction:
-    def __init__(self, ticker, start_date, validation_date, project_folder, github_url, epochs, time_steps, token, batch_size):
+    def __init__(self, ticker, start_date, validation_date, project_folder, github_url, epochs, time_steps, token, batch_size, interval='1d'):
         self._ticker = ticker
         self._start_date = start_date
         self._validation_date = validation_date
@@ -25,6 +25,7 @@ class StockPrediction:
         self._time_steps = time_steps
         self._token = token
         self._batch_size = batch_size
+        self._interval = interval
 
     def get_ticker(self):
         return self._ticker
@@ -66,4 +67,7 @@ class StockPrediction:
         return self._token     
     
     def get_batch_size(self):
-        return self._batch_size     
+        return self._batch_size
+
+    def get_interval(self):
+        return self._interval
@@ -0,0 +1,262 @@
+# Copyright 2020-2026 Jordi Corbilla. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import os
+import zlib
+
+import numpy as np
+import pandas as pd
+
+
+def normalise_price_frame(frame):
+    # yfinance returns (Price, Ticker) column pairs for single tickers, keep the price level only
+    if frame is None or frame.empty:
+        return pd.DataFrame(columns=['Close'], index=pd.DatetimeIndex([], name='Date'))
+    frame = frame.copy()
+    if isinstance(frame.columns, pd.MultiIndex):
+        frame.columns = frame.columns.get_level_values(0)
+    frame = frame.loc[:, ~frame.columns.duplicated()]
+    frame.index = pd.to_datetime(frame.index)
+    if frame.index.tz is not None:
+        frame.index = frame.index.tz_localize(None)
+    frame.index.name = 'Date'
+    return frame.sort_index()
+
+
+def interval_timedelta(interval):
+    # yfinance intervals: 1m, 2m, 5m, 15m, 30m, 60m, 90m, 1h, 1d, 5d, 1wk, 1mo, 3mo
+    if interval.endswith('mo'):
+        return pd.Timedelta(days=30 * int(interval[:-2]))
+    if interval.endswith('wk'):
+        return pd.Timedelta(weeks=int(interval[:-2]))
+    if interval.endswith('d'):
+        return pd.Timedelta(days=int(interval[:-1]))
+    if interval.endswith('h'):
+        return pd.Timedelta(hours=int(interval[:-1]))
+    if interval.endswith('m'):
+        return pd.Timedelta(minutes=int(interval[:-1]))
+    raise ValueError('Unknown interval: ' + str(interval))
+
+
+def is_intraday(interval):
+    return interval_timedelta(interval) < pd.Timedelta(days=1)
+
+
+# Yahoo caps how many days of intraday bars a single request may span
+_YAHOO_CHUNK_DAYS = {'1m': 7, '2m': 59, '5m': 59, '15m': 59, '30m': 59, '60m': 729, '90m': 59, '1h': 729}
+
+
+class ProviderError(Exception):
+    # a download or lookup the remote source could not serve: network failure, rate limit, unknown symbol
+    pass
+
+
+class MarketDataProvider:
+    name = 'base'
+    # local providers are already disk or memory backed, PriceCache serves them directly
+    cacheable = False
+    # remote providers acquire a slot of limiter before each request they send, so a download split
+    # into several requests is throttled request by request
+    limits_requests = False
+    limiter = None
+
+    def _acquire(self):
+        if self.limiter is not None:
+            self.limiter.acquire()
+
+    def download(self, ticker, start, end, interval='1d'):
+        raise NotImplementedError
+
+    def get_info(self, ticker):
+        raise NotImplementedError
+
+
+class YahooFinanceProvider(MarketDataProvider):
+    name = 'yahoo'
+    cacheable = True
+    limits_requests = True
+
+    def __init__(self, limiter=None):
+        self.limiter = limiter
+
+    def download(self, ticker, start, end, interval='1d'):
+        import yfinance as yf
+        # Ticker.history keeps its state per Ticker object, yf.download shares module level
+        # buffers and is not safe to call from several threads at once
+        sec = yf.Ticker(ticker)
+        start = pd.Timestamp(start)
+        end = pd.Timestamp(end)
+        chunk = pd.Timedelta(days=_YAHOO_CHUNK_DAYS[interval]) if interval in _YAHOO_CHUNK_DAYS else end - start
+        frames = []
+        chunk_start = start
+        while chunk_start < end:
+            chunk_end = min(chunk_start + chunk, end)
+            self._acquire()
+            try:
+                data = sec.history(start=chunk_start, end=chunk_end, interval=interval, auto_adjust=False, actions=False)
+            except Exception as error:
+                # yfinance surfaces network, HTTP and parsing failures as unrelated exception types
+                raise ProviderError('Yahoo download of ' + ticker + ' failed: ' + str(error)) from error
+            frames.append(normalise_price_frame(data))
+            chunk_start = chunk_end
+        if not frames:
+            return normalise_price_frame(None)
+        data = pd.concat(frames, axis=0)
+        return data[~data.index.duplicated(keep='last')]
+
+    def get_info(self, ticker):
+        import yfinance as yf
+        self._acquire()
+        return yf.Ticker(ticker).info
+
+
+class ReplayProvider(MarketDataProvider):
+    # Replays the downloaded_data_<TICKER>.csv files saved in previous run folders. When several
+    # run folders exist for a ticker they are merged, later folders taking precedence.
+    name = 'replay'
+
+    def __init__(self, search_folder=None, run_folder=None, short_name=None, currency='USD'):
+        if search_folder is None:
+            search_folder = os.getcwd()
+        self.search_folder = search_folder
+        self.run_folder = run_folder
+        self.short_name = short_name
+        self.currency = currency
+        self._frames = {}
+
+    def _csv_paths(self, ticker):
+        file_name = 'downloaded_data_' + ticker + '.csv'
+        if self.run_folder is not None:
+            return [os.path.join(self.search_folder, self.run_folder, file_name)]
+        paths = []
+        for folder in sorted(os.listdir(self.search_folder)):
+            if not folder.startswith(ticker + '_'):
+                continue
+            path = os.path.join(self.search_folder, folder, file_name)
+            if os.path.exists(path):
+                paths.append(path)
+        return paths
+
+    def _read_csv(self, path):
+        data = pd.read_csv(path)
+        # yfinance >= 0.2.51 writes an extra 'Ticker' header row
+        if len(data) > 0 and str(data.iloc[0, 0]) == 'Ticker':
+            data = data.iloc[1:]
+        data = data[['Date', 'Close']].copy()
+        data['Date'] = pd.to_datetime(data['Date'], errors='coerce')
+        data['Close'] = pd.to_numeric(data['Close'], errors='coerce')
+        return data.dropna().set_index('Date')
+
+    def _load(self, ticker):
+        if ticker not in self._frames:
+            paths = self._csv_paths(ticker)
+            if not paths:
+                raise FileNotFoundError('No downloaded_data_' + ticker + '.csv found under ' + self.search_folder)
+            frame = pd.concat([self._read_csv(path) for path in paths], axis=0)
+            frame = frame[~frame.index.duplicated(keep='last')]
+            self._frames[ticker] = normalise_price_frame(frame)
+        return self._frames[ticker]
+
+    def download(self, ticker, start, end, interval='1d'):
+        if interval != '1d':
+            raise ValueError('ReplayProvider only holds daily bars')
+        frame = self._load(ticker)
+        return frame[(frame.index >= pd.Timestamp(start)) & (frame.index < pd.Timestamp(end))]
+
+    def get_info(self, ticker):
+        short_name = self.short_name if self.short_name is not None else ticker
+        return {'shortName': short_name, 'currency': self.currency}
+
+
+class SyntheticProvider(MarketDataProvider):
+    # Geometric Brownian motion seeded per ticker. Paths are generated from a fixed origin so any
+    # date range of the same ticker returns the same bars. Intraday bars fill a 09:30-16:00 session
+    # with a Brownian bridge between consecutive daily closes, seeded per day.
+    name = 'synthetic'
+
+    def __init__(self, seed=42, start_price=100.0, drift=0.0002, volatility=0.01, origin='1990-01-01'):
+        self.seed = seed
+        self.start_price = start_price
+        self.drift = drift
+        self.volatility = volatility
+        self.origin = pd.Timestamp(origin)
+
+    def _ticker_seed(self, ticker):
+        return self.seed + zlib.crc32(ticker.encode('utf-8'))
+
+    def _daily(self, ticker, end):
+        dates = pd.bdate_range(self.origin, end - pd.Timedelta(days=1), name='Date')
+        rng = np.random.default_rng(self._ticker_seed(ticker))
+        log_returns = rng.normal(self.drift, self.volatility, size=len(dates))
+        close = self.start_price * np.exp(np.cumsum(log_returns))
+        return pd.DataFrame({'Close': close}, index=dates)
+
+    def _intraday(self, ticker, daily, start, end, interval):
+        step = interval_timedelta(interval)
+        offsets = pd.timedelta_range(pd.Timedelta(hours=9, minutes=30), pd.Timedelta(hours=16) - step, freq=step)
+        previous_close = np.concatenate(([self.start_price], daily['Close'].to_numpy()[:-1]))
+        first = int(np.searchsorted(daily.index, start.normalize()))
+        frames = []
+        for day, prev_close, close in zip(daily.index[first:], previous_close[first:], daily['Close'].to_numpy()[first:]):
+            rng = np.random.default_rng([self._ticker_seed(ticker), day.toordinal()])
+            steps = rng.normal(0.0, self.volatility / np.sqrt(len(offsets)), size=len(offsets))
+            path = np.cumsum(steps)
+            bridge = path - np.arange(1, len(offsets) + 1) / len(offsets) * (path[-1] - np.log(close / prev_close))
+            frames.append(pd.DataFrame({'Close': prev_close * np.exp(bridge)}, index=day + offsets))
+        if not frames:
+            return normalise_price_frame(None)
+        frame = pd.concat(frames, axis=0)
+        frame.index.name = 'Date'
+        return frame[(frame.index >= start) & (frame.index < end)]
+
+    def download(self, ticker, start, end, interval='1d'):
+        start = pd.Timestamp(start)
+        end = pd.Timestamp(end)
+        if is_intraday(interval):
+            return self._intraday(ticker, self._daily(ticker, end + pd.Timedelta(days=1)), start, end, interval)
+        if interval != '1d':
+            raise ValueError('SyntheticProvider only generates daily or intraday bars')
+        frame = self._daily(ticker, end)
+        return frame[frame.index >= start]
+
+    def get_info(self, ticker):
+        return {'shortName': ticker, 'currency': 'USD'}
+
+
+class FrameProvider(MarketDataProvider):
+    # Serves close prices from an aligned multi-ticker frame (one column per ticker), such as the
+    # one returned by BulkDownloader.download.
+    name = 'frame'
+
+    def __init__(self, frame, info=None):
+        self.frame = frame
+        self.info = info if info is not None else {}
+
+    def download(self, ticker, start, end, interval='1d'):
+        close = self.frame[ticker].dropna()
+        close = close[(close.index >= pd.Timestamp(start)) & (close.index < pd.Timestamp(end))]
+        return normalise_price_frame(close.rename('Close').to_frame())
+
+    def get_info(self, ticker):
+        return self.info.get(ticker, {'shortName': ticker, 'currency': 'USD'})
+
+
+def create_provider(name='yahoo', **kwargs):
+    if name == 'yahoo':
+        return YahooFinanceProvider()
+    if name == 'replay':
+        return ReplayProvider(**kwargs)
+    if name == 'synthetic':
+        return SyntheticProvider(**kwargs)
+    raise ValueError('Unknown data provider: ' + str(name))
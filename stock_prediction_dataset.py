@@ -0,0 +1,75 @@
+# Copyright 2020-2026 Jordi Corbilla. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import warnings
+
+import numpy as np
+
+warnings.filterwarnings("ignore", message=".*np.object.*", category=FutureWarning)
+
+import tensorflow as tf
+
+from stock_prediction_windows import window_series
+
+
+def _gather_windows(series, indices, width):
+    return tf.gather(series, indices[..., tf.newaxis] + tf.range(width, dtype=indices.dtype))
+
+
+def _target_series(y):
+    y = np.asarray(y)
+    if y.ndim == 2:
+        return tf.constant(window_series(y)), y.shape[1]
+    return tf.constant(y), None
+
+
+def _gather_targets(target, indices):
+    series, horizon = target
+    return tf.gather(series, indices) if horizon is None else _gather_windows(series, indices, horizon)
+
+
+def window_dataset(x, y, batch_size, shuffle_buffer=0, cache_path=None, seed=None, prefetch=True):
+    # Streams (x, y) batches for model.fit without materialising every window: only the underlying
+    # series is kept and each window is gathered inside the tf.data graph when its batch is needed.
+    # x are (rows, time_steps, features) windows, y are (rows,) targets or (rows, horizon) windows.
+    # y may also be a dict of such targets, one per output of a multi-head model.
+    rows, time_steps = x.shape[0], x.shape[1]
+    x_series = tf.constant(window_series(x))
+    if isinstance(y, dict):
+        targets = {name: _target_series(values) for name, values in y.items()}
+    else:
+        targets = _target_series(y)
+
+    def gather(indices):
+        x_batch = _gather_windows(x_series, indices, time_steps)
+        if isinstance(targets, dict):
+            y_batch = {name: _gather_targets(target, indices) for name, target in targets.items()}
+        else:
+            y_batch = _gather_targets(targets, indices)
+        return x_batch, y_batch
+
+    dataset = tf.data.Dataset.range(rows)
+    if cache_path is not None:
+        # windows are cut once, written to disk and replayed from there on the next epochs
+        dataset = dataset.map(gather, num_parallel_calls=tf.data.AUTOTUNE).cache(cache_path)
+        if shuffle_buffer > 0:
+            dataset = dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+        dataset = dataset.batch(batch_size)
+    else:
+        if shuffle_buffer > 0:
+            dataset = dataset.shuffle(shuffle_buffer, seed=seed, reshuffle_each_iteration=True)
+        dataset = dataset.batch(batch_size).map(gather, num_parallel_calls=tf.data.AUTOTUNE)
+    if prefetch:
+        dataset = dataset.prefetch(tf.data.AUTOTUNE)
+    return dataset
@@ -20,16 +20,24 @@ import pickle
 import numpy as np
 import json
 import warnings
+import tensorflow as tf
 from tensorflow.keras.losses import Huber
 from datetime import datetime
 
 warnings.filterwarnings("ignore", message=".*np.object.*", category=FutureWarning)
 
+from stock_prediction_autotune import AutotuneStore, Autotuner, apply_threads
+from stock_prediction_checkpoint import TrainingCheckpoint, remove_checkpoints
 from stock_prediction_class import StockPrediction
+from stock_prediction_data_provider import create_provider, is_intraday
+from stock_prediction_dataset import window_dataset
+from stock_prediction_feature_store import FeatureStore
 from stock_prediction_lstm import LongShortTermMemory
 from stock_prediction_numpy import StockData
 from stock_prediction_plotter import Plotter
+from stock_prediction_price_cache import PriceCache
 from stock_prediction_readme_generator import ReadmeGenerator
+from stock_prediction_tflite import export_tflite
 
 os.environ["PATH"] += os.pathsep + 'C:/Program Files (x86)/Graphviz2.38/bin/'
 
@@ -43,29 +51,190 @@ def _returns_to_prices(returns, start_price):
     return prices
 
 
-def train_LSTM_network(stock, use_returns=False, model_version='v7', forecast_horizon=1, trend_window=60):
-    use_deltas = model_version in ('v3', 'v5', 'v7')
+def _fit_model(model, stock, x_train, y_train, x_test, y_test, callbacks, streaming=False, shuffle_buffer=1024, cache_name=None, epochs=None, initial_epoch=0):
+    epochs = epochs if epochs is not None else stock.get_epochs()
+    if not streaming:
+        return model.fit(
+            x_train,
+            y_train,
+            epochs=epochs,
+            initial_epoch=initial_epoch,
+            batch_size=stock.get_batch_size(),
+            validation_data=(x_test, y_test),
+            callbacks=callbacks,
+        )
+    cache_path = None
+    if cache_name is not None:
+        cache_path = os.path.join(stock.get_project_folder(), cache_name + '_windows.cache')
+    train_dataset = window_dataset(x_train, y_train, stock.get_batch_size(), shuffle_buffer=shuffle_buffer, cache_path=cache_path)
+    test_dataset = window_dataset(x_test, y_test, stock.get_batch_size())
+    return model.fit(
+        train_dataset,
+        epochs=epochs,
+        initial_epoch=initial_epoch,
+        validation_data=test_dataset,
+        callbacks=callbacks,
+    )
+
+
+def get_data_modes(model_version):
+    use_deltas = model_version in ('v3', 'v5', 'v7', 'v8')
     use_trend_residual = model_version == 'v6'
-    if use_returns and (use_deltas or use_trend_residual):
-        print('Error: returns cannot be combined with delta or trend-residual modes.')
-        return
-    data = StockData(stock)
-    plotter = Plotter(True, stock.get_project_folder(), data.get_stock_short_name(), data.get_stock_currency(), stock.get_ticker())
-    if model_version == 'v7':
-        (x_train, y_dir_train, y_mag_train), (x_test, y_dir_test, y_mag_test), (training_data, test_data) = data.prepare_delta_direction_data(
+    return use_deltas, use_trend_residual
+
+
+def load_training_data(data, stock, model_version, use_returns=False, forecast_horizon=1, trend_window=60):
+    # v7/v8 targets come back as a dict {'direction': ..., 'magnitude': ...}
+    if model_version in ('v7', 'v8'):
+        (x_train, y_dir_train, y_mag_train), (x_test, y_dir_test, y_mag_test), frames = data.prepare_delta_direction_data(
             stock.get_time_steps(),
             stock.get_validation_date(),
         )
-    else:
-        (x_train, y_train), (x_test, y_test), (training_data, test_data) = data.download_transform_to_numpy(
-            stock.get_time_steps(),
-            stock.get_project_folder(),
-            use_returns=use_returns,
-            use_deltas=use_deltas,
-            use_trend_residual=use_trend_residual,
-            trend_window=trend_window,
-            forecast_horizon=forecast_horizon,
+        return (x_train, {'direction': y_dir_train, 'magnitude': y_mag_train}), (x_test, {'direction': y_dir_test, 'magnitude': y_mag_test}), frames
+    use_deltas, use_trend_residual = get_data_modes(model_version)
+    return data.download_transform_to_numpy(
+        stock.get_time_steps(),
+        stock.get_project_folder(),
+        use_returns=use_returns,
+        use_deltas=use_deltas,
+        use_trend_residual=use_trend_residual,
+        trend_window=trend_window,
+        forecast_horizon=forecast_horizon,
+    )
+
+
+def model_stages(model_version):
+    # Models a version trains, in order, as (name, callbacks version, target). target picks the entry
+    # of the direction/magnitude dict the model is fitted on, None fits all targets as they are.
+    if model_version == 'v7':
+        return [('direction', 'v4', 'direction'), ('magnitude', 'v4', 'magnitude')]
+    return [('model', model_version, None)]
+
+
+def compile_model(lstm, model_version, name, model):
+    if model_version == 'v7' and name == 'direction':
+        model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'], **lstm.get_compile_options())
+    elif model_version == 'v7':
+        model.compile(optimizer=lstm.get_optimizer('v4'), loss=Huber(), metrics=lstm.get_defined_metrics(), **lstm.get_compile_options())
+    elif model_version == 'v8':
+        # one trunk, two heads: a single fit on the sum of both losses
+        model.compile(
+            optimizer=lstm.get_optimizer(model_version),
+            loss=lstm.get_loss(model_version),
+            loss_weights=lstm.get_loss_weights(model_version),
+            metrics=lstm.get_metrics(model_version),
+            **lstm.get_compile_options(),
         )
+    else:
+        model.compile(optimizer=lstm.get_optimizer(model_version), loss=lstm.get_loss(model_version), metrics=lstm.get_defined_metrics(), **lstm.get_compile_options())
+    return model
+
+
+def build_models(lstm, model_version, x_train, forecast_horizon=1):
+    # Compiled models as (name, model, callbacks version, target), see model_stages
+    if model_version == 'v7':
+        models = {
+            'direction': lstm._create_model_v7(x_train, output_units=1, activation='sigmoid'),
+            'magnitude': lstm._create_model_v7(x_train, output_units=1, activation=None),
+        }
+    else:
+        output_units = forecast_horizon if model_version in ('v5', 'v6') else 1
+        models = {'model': lstm.create_model(x_train, version=model_version, output_units=output_units)}
+    return [
+        (name, compile_model(lstm, model_version, name, models[name]), callbacks_version, target)
+        for name, callbacks_version, target in model_stages(model_version)
+    ]
+
+
+def _previous_data_end(run_folder, config):
+    # last bar the previous run saw; older runs did not store it, read it from their outputs
+    if config.get('data_end'):
+        return pd.to_datetime(config['data_end'])
+    downloaded_path = os.path.join(run_folder, 'downloaded_data_' + str(config.get('ticker')) + '.csv')
+    if os.path.exists(downloaded_path):
+        return pd.to_datetime(pd.read_csv(downloaded_path)['Date']).max()
+    predictions_path = os.path.join(run_folder, 'predictions.csv')
+    if os.path.exists(predictions_path):
+        return pd.read_csv(predictions_path, index_col=0, parse_dates=True).index.max()
+    return None
+
+
+def load_previous_run(run_folder, lstm=None):
+    with open(os.path.join(run_folder, 'model_config.json'), 'r', encoding='utf-8') as config_file:
+        config = json.load(config_file)
+    model_version = config.get('model_version', 'v1')
+    lstm = lstm if lstm is not None else LongShortTermMemory(run_folder)
+    models = {}
+    for name, _, _ in model_stages(model_version):
+        model_path = os.path.join(run_folder, model_file_name(name))
+        if name == 'model' and not os.path.exists(model_path):
+            model_path = os.path.join(run_folder, 'model_weights.h5')
+        # keep the saved optimizer state when there is one
+        model = tf.keras.models.load_model(model_path)
+        if getattr(model, 'optimizer', None) is None:
+            model = compile_model(lstm, model_version, name, model)
+        models[name] = model
+    scalers = {}
+    for scaler_name in ('min_max_scaler', 'input_scaler'):
+        scaler_path = os.path.join(run_folder, scaler_name + '.pkl')
+        if os.path.exists(scaler_path):
+            with open(scaler_path, 'rb') as scaler_file:
+                scalers[scaler_name] = pickle.load(scaler_file)
+    return {
+        'config': config,
+        'models': models,
+        'min_max': scalers.get('min_max_scaler'),
+        'input_scaler': scalers.get('input_scaler'),
+        'data_end': _previous_data_end(run_folder, config),
+    }
+
+
+def _slice_rows(values, start, stop=None):
+    if isinstance(values, dict):
+        return {name: rows[start:stop] for name, rows in values.items()}
+    return values[start:stop]
+
+
+def select_targets(y, target):
+    return y if target is None else y[target]
+
+
+def model_file_name(name):
+    return 'model.keras' if name == 'model' else 'model_' + name + '.keras'
+
+
+def train_LSTM_network(stock, use_returns=False, model_version='v7', forecast_horizon=1, trend_window=60, provider=None, streaming=False, shuffle_buffer=1024, cache_windows=False, feature_store=None, dtype='float32', warm_start_folder=None, finetune_epochs=5, checkpoint=True, resume=False, training_mode='default', plot_mode='interactive', init_weights_folder=None, tflite=True, offline=False, validation_fraction=None):
+    previous = None
+    if warm_start_folder is not None:
+        previous = load_previous_run(warm_start_folder)
+        previous_config = previous['config']
+        # the architecture and the preprocessing are those of the run being continued
+        model_version = previous_config.get('model_version', 'v1')
+        use_returns = bool(previous_config.get('use_returns', use_returns))
+        forecast_horizon = int(previous_config.get('forecast_horizon', forecast_horizon))
+        trend_window = int(previous_config.get('trend_window', trend_window))
+        if int(previous_config.get('time_steps', stock.get_time_steps())) != stock.get_time_steps():
+            print('Error: time_steps does not match the warm start run (' + str(previous_config.get('time_steps')) + ').')
+            return
+        if previous['data_end'] is None or previous['min_max'] is None:
+            print('Error: ' + warm_start_folder + ' has no data end date or scaler to continue from.')
+            return
+        print('Warm start from ' + warm_start_folder + ', ' + model_version + ' trained on bars up to ' + str(previous['data_end']))
+    use_deltas, use_trend_residual = get_data_modes(model_version)
+    if use_returns and (use_deltas or use_trend_residual):
+        print('Error: returns cannot be combined with delta or trend-residual modes.')
+        return
+    spill_folder = os.path.join(stock.get_project_folder(), 'spill') if is_intraday(stock.get_interval()) else None
+    data = StockData(
+        stock, provider=provider, price_cache=PriceCache(offline=True, provider=provider) if offline else None, spill_folder=spill_folder, feature_store=feature_store, dtype=dtype,
+        min_max=previous['min_max'] if previous is not None else None,
+        input_scaler=previous['input_scaler'] if previous is not None else None,
+    )
+    short_name = data.get_stock_short_name()
+    plotter = Plotter(True, stock.get_project_folder(), short_name, data.get_stock_currency(), stock.get_ticker(), mode=plot_mode)
+    (x_train, y_train), (x_test, y_test), (training_data, test_data) = load_training_data(
+        data, stock, model_version, use_returns=use_returns, forecast_horizon=forecast_horizon, trend_window=trend_window,
+    )
     plotter.plot_histogram_data_split(training_data, test_data, stock.get_validation_date())
     scaler_path = os.path.join(stock.get_project_folder(), 'min_max_scaler.pkl')
     with open(scaler_path, 'wb') as scaler_file:
@@ -85,75 +254,101 @@ def train_LSTM_network(stock, use_returns=False, model_version='v7', forecast_ho
         'ticker': stock.get_ticker(),
         'start_date': stock.get_start_date().strftime("%Y-%m-%d"),
         'validation_date': stock.get_validation_date().strftime("%Y-%m-%d"),
+        'interval': stock.get_interval(),
+        'dtype': dtype,
+        'training_mode': training_mode,
+        'epochs': stock.get_epochs(),
+        'batch_size': stock.get_batch_size(),
+        'data_end': str(training_data.index.append(test_data.index).max()),
     }
+    if warm_start_folder is not None:
+        config['warm_start_from'] = os.path.abspath(warm_start_folder)
+    if init_weights_folder is not None:
+        config['init_weights_from'] = os.path.abspath(init_weights_folder)
     config_path = os.path.join(stock.get_project_folder(), 'model_config.json')
     with open(config_path, 'w', encoding='utf-8') as config_file:
         json.dump(config, config_file, indent=2)
 
-    lstm = LongShortTermMemory(stock.get_project_folder())
-    if model_version == 'v7':
-        dir_model = lstm._create_model_v7(x_train, output_units=1, activation='sigmoid')
-        dir_model.compile(optimizer='adam', loss='binary_crossentropy', metrics=['accuracy'])
-        dir_history = dir_model.fit(
-            x_train,
-            y_dir_train,
-            epochs=stock.get_epochs(),
-            batch_size=stock.get_batch_size(),
-            validation_data=(x_test, y_dir_test),
-            callbacks=lstm.get_callbacks('v4'),
-        )
-        mag_model = lstm._create_model_v7(x_train, output_units=1, activation=None)
-        mag_model.compile(optimizer=lstm.get_optimizer('v4'), loss=Huber(), metrics=lstm.get_defined_metrics())
-        mag_history = mag_model.fit(
-            x_train,
-            y_mag_train,
-            epochs=stock.get_epochs(),
-            batch_size=stock.get_batch_size(),
-            validation_data=(x_test, y_mag_test),
-            callbacks=lstm.get_callbacks('v4'),
-        )
-        print("saving models")
-        dir_model.save(os.path.join(stock.get_project_folder(), 'model_direction.keras'))
-        mag_model.save(os.path.join(stock.get_project_folder(), 'model_magnitude.keras'))
-        history = mag_history
+    lstm = LongShortTermMemory(stock.get_project_folder(), training_mode=training_mode)
+    if previous is None:
+        stages = build_models(lstm, model_version, x_train, forecast_horizon)
+        fit_x, fit_y, val_x, val_y, epochs = x_train, y_train, x_test, y_test, None
+        if validation_fraction:
+            # early stopping and the LR schedule watch the last training rows instead of the test
+            # rows, which stay unseen until the predictions are scored
+            split = int(len(x_train) * (1.0 - validation_fraction))
+            fit_x, fit_y = _slice_rows(x_train, 0, split), _slice_rows(y_train, 0, split)
+            val_x, val_y = _slice_rows(x_train, split), _slice_rows(y_train, split)
     else:
-        output_units = forecast_horizon if model_version in ('v5', 'v6') else 1
-        model = lstm.create_model(x_train, version=model_version, output_units=output_units)
-        model.compile(optimizer=lstm.get_optimizer(model_version), loss=lstm.get_loss(model_version), metrics=lstm.get_defined_metrics())
-        history = model.fit(
-            x_train,
-            y_train,
-            epochs=stock.get_epochs(),
-            batch_size=stock.get_batch_size(),
-            validation_data=(x_test, y_test),
-            callbacks=lstm.get_callbacks(model_version),
+        # Test row k targets test_data.index[k]. The rows past the previous run's last bar are the
+        # only ones fine-tuned on, the earlier test rows keep validating the model as before.
+        first_new = int(np.searchsorted(test_data.index[:len(x_test)], previous['data_end'], side='right'))
+        if first_new >= len(x_test):
+            print('No new bars since ' + str(previous['data_end']) + ', nothing to fine-tune.')
+            return
+        print('Fine-tuning on ' + str(len(x_test) - first_new) + ' new bars for ' + str(finetune_epochs) + ' epochs')
+        stages = [(name, previous['models'][name], callbacks_version, target) for name, callbacks_version, target in model_stages(model_version)]
+        fit_x, fit_y = _slice_rows(x_test, first_new), _slice_rows(y_test, first_new)
+        val_x, val_y = (_slice_rows(x_test, 0, first_new), _slice_rows(y_test, 0, first_new)) if first_new > 0 else (fit_x, fit_y)
+        epochs = finetune_epochs
+    if not resume:
+        remove_checkpoints(stock.get_project_folder())
+    models = {}
+    histories = {}
+    for name, model, callbacks_version, target in stages:
+        callbacks = lstm.get_callbacks(callbacks_version, stage=name, batch_size=stock.get_batch_size(), samples=len(fit_x))
+        if init_weights_folder is not None and previous is None:
+            # start from the weights of a run with the same architecture, e.g. the previous walk-forward fold
+            model.set_weights(tf.keras.models.load_model(os.path.join(init_weights_folder, model_file_name(name)), compile=False).get_weights())
+        training_checkpoint = None
+        if checkpoint:
+            training_checkpoint = TrainingCheckpoint(os.path.join(stock.get_project_folder(), 'checkpoints', name), callbacks)
+            model = training_checkpoint.restore_model(model)
+            if training_checkpoint.is_completed():
+                print(name + ' finished before the interruption, skipping its training')
+                models[name] = model
+                histories[name] = training_checkpoint.get_history()
+                continue
+            callbacks = callbacks + [training_checkpoint]
+        histories[name] = _fit_model(
+            model, stock, fit_x, select_targets(fit_y, target), val_x, select_targets(val_y, target), callbacks,
+            streaming=streaming, shuffle_buffer=shuffle_buffer, cache_name=name if cache_windows else None, epochs=epochs,
+            initial_epoch=training_checkpoint.get_initial_epoch() if training_checkpoint is not None else 0,
         )
-        print("saving model")
-        model.save(os.path.join(stock.get_project_folder(), 'model.keras'))
+        if training_checkpoint is not None:
+            # the full history, including the epochs run before a resume
+            histories[name] = training_checkpoint.get_history()
+        models[name] = model
+    print("saving model")
+    for name, model in models.items():
+        model.save(os.path.join(stock.get_project_folder(), model_file_name(name)))
+    # v7 reports the magnitude model, the one whose output is in price units
+    history = histories['magnitude'] if model_version == 'v7' else histories['model']
 
     plotter.plot_loss(history)
-    plotter.plot_mse(history)
+    plotter.plot_mse(history, 'magnitude_MSE' if model_version == 'v8' else 'MSE')
 
     print("display the content of the model")
     if model_version == 'v7':
-        baseline_results = mag_model.evaluate(x_test, y_mag_test, verbose=2)
-        for name, value in zip(mag_model.metrics_names, baseline_results):
-            print(name, ': ', value)
+        baseline_results = models['magnitude'].evaluate(x_test, y_test['magnitude'], verbose=2, return_dict=True)
     else:
-        baseline_results = model.evaluate(x_test, y_test, verbose=2)
-        for name, value in zip(model.metrics_names, baseline_results):
-            print(name, ': ', value)
+        baseline_results = models['model'].evaluate(x_test, y_test, verbose=2, return_dict=True)
+    for name, value in baseline_results.items():
+        print(name, ': ', value)
     print()
 
     print("plotting prediction results")
-    if model_version == 'v7':
-        dir_pred = dir_model.predict(x_test)
-        mag_pred = mag_model.predict(x_test)
+    if model_version in ('v7', 'v8'):
+        if model_version == 'v8':
+            dir_pred, mag_pred = models['model'].predict(x_test)
+        else:
+            dir_pred = models['direction'].predict(x_test)
+            mag_pred = models['magnitude'].predict(x_test)
         mag_pred = data.get_min_max().inverse_transform(mag_pred).flatten()
         direction = (dir_pred.flatten() >= 0.5).astype(np.float32)
         test_predictions_baseline = mag_pred * np.where(direction > 0, 1.0, -1.0)
     else:
-        test_predictions_baseline = model.predict(x_test)
+        test_predictions_baseline = models['model'].predict(x_test)
         test_predictions_baseline = data.get_min_max().inverse_transform(test_predictions_baseline)
         if model_version not in ('v5', 'v6'):
             test_predictions_baseline = test_predictions_baseline.flatten()
@@ -173,8 +368,6 @@ def train_LSTM_network(stock, use_returns=False, model_version='v7', forecast_ho
             predicted_prices = base_close.to_numpy().flatten() + test_predictions_baseline.flatten()
         predictions_df = pd.DataFrame({stock.get_ticker() + '_predicted': predicted_prices}, index=test_data.index)
     elif use_trend_residual:
-        full_series = pd.concat([training_data['Close'], test_data['Close']])
-        residuals = data._compute_trend_residuals(full_series, trend_window)
         base_close = test_data['Close'].shift(1)
         base_close.iloc[0] = training_data['Close'].iloc[-1]
         if model_version == 'v6':
@@ -195,10 +388,16 @@ def train_LSTM_network(stock, use_returns=False, model_version='v7', forecast_ho
     predictions_df.to_csv(os.path.join(stock.get_project_folder(), 'predictions.csv'))
     plotter.project_plot_predictions(predictions_df, test_data)
 
-    generator = ReadmeGenerator(stock.get_github_url(), stock.get_token(), data.get_stock_short_name())
+    if tflite:
+        export_tflite(stock.get_project_folder(), models, x_test)
+
+    generator = ReadmeGenerator(stock.get_github_url(), stock.get_token(), short_name)
     generator.write()
+    remove_checkpoints(stock.get_project_folder())
+    plotter.wait()
 
     print("prediction is finished")
+    return history
 
 
 # The Main function requires 3 major variables
@@ -218,6 +417,23 @@ if __name__ == '__main__':
     parser.add_argument("-model_version", default="v7")
     parser.add_argument("-forecast_horizon", default="10")
     parser.add_argument("-trend_window", default="60")
+    parser.add_argument("-interval", default="1d")
+    parser.add_argument("-data_provider", default="yahoo", choices=["yahoo", "replay", "synthetic"])
+    parser.add_argument("-streaming", default="false")
+    parser.add_argument("-shuffle_buffer", default="1024")
+    parser.add_argument("-cache_windows", default="false")
+    parser.add_argument("-feature_store", default="false")
+    parser.add_argument("-dtype", default="float32", choices=["float32", "float64"])
+    parser.add_argument("-warm_start", default=None)
+    parser.add_argument("-finetune_epochs", default="5")
+    parser.add_argument("-checkpoint", default="true")
+    parser.add_argument("-resume", default=None)
+    parser.add_argument("-training_mode", default="default", choices=["default", "jit", "steps", "compiled", "bf16"])
+    parser.add_argument("-plot_mode", default="interactive", choices=["interactive", "background", "none"])
+    parser.add_argument("-autotune", default="false", choices=["false", "true", "refresh"])
+    parser.add_argument("-distill", default="false", choices=["false", "gru", "conv"])
+    parser.add_argument("-tflite", default="true")
+    parser.add_argument("-offline", default="false")
     
     args = parser.parse_args()
     
@@ -231,15 +447,79 @@ if __name__ == '__main__':
     MODEL_VERSION = args.model_version
     FORECAST_HORIZON = int(args.forecast_horizon)
     TREND_WINDOW = int(args.trend_window)
+    DATA_PROVIDER = args.data_provider
+    INTERVAL = args.interval
+    STREAMING = str(args.streaming).lower() in ("1", "true", "yes", "y")
+    SHUFFLE_BUFFER = int(args.shuffle_buffer)
+    CACHE_WINDOWS = str(args.cache_windows).lower() in ("1", "true", "yes", "y")
+    USE_FEATURE_STORE = str(args.feature_store).lower() in ("1", "true", "yes", "y")
+    DTYPE = args.dtype
+    WARM_START = args.warm_start
+    FINETUNE_EPOCHS = int(args.finetune_epochs)
+    CHECKPOINT = str(args.checkpoint).lower() in ("1", "true", "yes", "y")
+    RESUME = args.resume
+    TRAINING_MODE = args.training_mode
+    PLOT_MODE = args.plot_mode
+    AUTOTUNE = args.autotune
+    DISTILL = args.distill
+    TFLITE = str(args.tflite).lower() in ("1", "true", "yes", "y")
+    # train on the price cache as it is, without contacting the provider
+    OFFLINE = str(args.offline).lower() in ("1", "true", "yes", "y")
+    if RESUME:
+        # an interrupted run continues with the settings it was started with
+        with open(os.path.join(RESUME, 'model_config.json'), 'r', encoding='utf-8') as resume_config_file:
+            RESUME_CONFIG = json.load(resume_config_file)
+        STOCK_TICKER = RESUME_CONFIG.get('ticker', STOCK_TICKER)
+        STOCK_START_DATE = pd.to_datetime(RESUME_CONFIG.get('start_date', STOCK_START_DATE))
+        STOCK_VALIDATION_DATE = pd.to_datetime(RESUME_CONFIG.get('validation_date', STOCK_VALIDATION_DATE))
+        EPOCHS = int(RESUME_CONFIG.get('epochs', EPOCHS))
+        BATCH_SIZE = int(RESUME_CONFIG.get('batch_size', BATCH_SIZE))
+        TIME_STEPS = int(RESUME_CONFIG.get('time_steps', TIME_STEPS))
+        USE_RETURNS = bool(RESUME_CONFIG.get('use_returns', USE_RETURNS))
+        MODEL_VERSION = RESUME_CONFIG.get('model_version', MODEL_VERSION)
+        FORECAST_HORIZON = int(RESUME_CONFIG.get('forecast_horizon', FORECAST_HORIZON))
+        TREND_WINDOW = int(RESUME_CONFIG.get('trend_window', TREND_WINDOW))
+        INTERVAL = RESUME_CONFIG.get('interval', INTERVAL)
+        DTYPE = RESUME_CONFIG.get('dtype', DTYPE)
+        TRAINING_MODE = RESUME_CONFIG.get('training_mode', TRAINING_MODE)
+        WARM_START = RESUME_CONFIG.get('warm_start_from', WARM_START)
+        CHECKPOINT = True
+    if WARM_START:
+        # the window length and the split are fixed by the run being continued
+        with open(os.path.join(WARM_START, 'model_config.json'), 'r', encoding='utf-8') as previous_config_file:
+            PREVIOUS_CONFIG = json.load(previous_config_file)
+        TIME_STEPS = int(PREVIOUS_CONFIG.get('time_steps', TIME_STEPS))
+        STOCK_VALIDATION_DATE = pd.to_datetime(PREVIOUS_CONFIG.get('validation_date', STOCK_VALIDATION_DATE))
+    if AUTOTUNE != 'false':
+        # the tuned batch size and thread counts of this machine, probed first if there are none yet
+        TUNED = AutotuneStore().get(MODEL_VERSION, TRAINING_MODE) if AUTOTUNE == 'true' else None
+        if TUNED is None:
+            TUNED = Autotuner({
+                'ticker': STOCK_TICKER,
+                'start_date': STOCK_START_DATE.strftime("%Y-%m-%d"),
+                'validation_date': STOCK_VALIDATION_DATE.strftime("%Y-%m-%d"),
+                'time_steps': TIME_STEPS,
+                'forecast_horizon': FORECAST_HORIZON,
+                'trend_window': TREND_WINDOW,
+                'interval': INTERVAL,
+            }, data_provider=DATA_PROVIDER).tune(MODEL_VERSION, TRAINING_MODE)
+        if TUNED is not None:
+            apply_threads(TUNED)
+            # a resumed run keeps the batch size it was started with
+            if not RESUME:
+                BATCH_SIZE = TUNED['batch_size']
+            print('Autotuned: batch_size=' + str(BATCH_SIZE) + ', ' + str(TUNED['intra_op']) + ' intra-op / ' + str(TUNED['inter_op']) + ' inter-op threads')
     TODAY_RUN = datetime.today().strftime("%Y%m%d")
     TOKEN = STOCK_TICKER + '_' + TODAY_RUN + '_' + secrets.token_hex(16)
+    if RESUME:
+        TOKEN = os.path.basename(os.path.normpath(RESUME))
     GITHUB_URL = args.github_url
     print('Ticker: ' + STOCK_TICKER)
     print('Start Date: ' + STOCK_START_DATE.strftime("%Y-%m-%d"))
     print('Validation Date: ' + STOCK_START_DATE.strftime("%Y-%m-%d"))
     print('Test Run Folder: ' + TOKEN)
     # create project run folder
-    PROJECT_FOLDER = os.path.join(os.getcwd(), TOKEN)
+    PROJECT_FOLDER = os.path.abspath(RESUME) if RESUME else os.path.join(os.getcwd(), TOKEN)
     if not os.path.exists(PROJECT_FOLDER):
         os.makedirs(PROJECT_FOLDER)
 
@@ -251,7 +531,8 @@ if __name__ == '__main__':
                                        EPOCHS,
                                        TIME_STEPS,
                                        TOKEN,
-                                       BATCH_SIZE)
+                                       BATCH_SIZE,
+                                       INTERVAL)
     # Execute Deep Learning model
     train_LSTM_network(
         stock_prediction,
@@ -259,4 +540,22 @@ if __name__ == '__main__':
         model_version=MODEL_VERSION,
         forecast_horizon=FORECAST_HORIZON,
         trend_window=TREND_WINDOW,
+        provider=create_provider(DATA_PROVIDER),
+        streaming=STREAMING,
+        shuffle_buffer=SHUFFLE_BUFFER,
+        cache_windows=CACHE_WINDOWS,
+        feature_store=FeatureStore() if USE_FEATURE_STORE else None,
+        dtype=DTYPE,
+        warm_start_folder=WARM_START,
+        finetune_epochs=FINETUNE_EPOCHS,
+        checkpoint=CHECKPOINT,
+        resume=bool(RESUME),
+        training_mode=TRAINING_MODE,
+        plot_mode=PLOT_MODE,
+        tflite=TFLITE,
+        offline=OFFLINE,
     )
+    if DISTILL != 'false':
+        # imported here, the distillation module builds on this one
+        from stock_prediction_distillation import Distiller
+        Distiller(PROJECT_FOLDER, kind=DISTILL, epochs=EPOCHS, batch_size=BATCH_SIZE, provider=create_provider(DATA_PROVIDER)).train()
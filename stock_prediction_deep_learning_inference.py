@@ -13,10 +13,10 @@
 # limitations under the License.
 # ==============================================================================
 import os
+import time
 import warnings
 from absl import app
 import pandas as pd
-import matplotlib.pyplot as plt
 import numpy as np
 import pickle
 import json
@@ -26,7 +26,13 @@ warnings.filterwarnings("ignore", message=".*np.object.*", category=FutureWarnin
 import tensorflow as tf
 
 from stock_prediction_class import StockPrediction
+from stock_prediction_data_provider import create_provider, interval_timedelta, is_intraday
 from stock_prediction_numpy import StockData
+from stock_prediction_plotter import Plotter
+from stock_prediction_price_cache import PriceCache
+from stock_prediction_rollout import GraphRollout, StatefulRollout
+from stock_prediction_tflite import load_tflite_models
+from stock_prediction_trend import TrendResiduals
 from datetime import timedelta, datetime
 from pandas.tseries.offsets import BDay
 
@@ -57,12 +63,31 @@ def _load_config(inference_folder):
         return json.load(config_file)
 
 
-def _future_dates(last_date, forecast_days, use_business_days):
+def _future_dates(last_date, forecast_days, use_business_days, interval='1d', history_index=None):
+    if is_intraday(interval):
+        return _future_bar_times(last_date, forecast_days, use_business_days, interval, history_index)
     if use_business_days:
         return pd.bdate_range(last_date + BDay(1), periods=forecast_days)
     return pd.date_range(last_date + timedelta(1), periods=forecast_days)
 
 
+def _future_bar_times(last_date, periods, use_business_days, interval, history_index):
+    # Continue the intraday session pattern seen in the recent history (bar times within a day)
+    step = interval_timedelta(interval)
+    if history_index is not None and len(history_index) > 0:
+        recent = history_index[history_index >= history_index[-1].normalize() - pd.Timedelta(days=30)]
+        offsets = sorted(set(recent - recent.normalize()))
+    else:
+        offsets = list(pd.timedelta_range(pd.Timedelta(0), pd.Timedelta(days=1) - step, freq=step))
+    times = []
+    day = last_date.normalize()
+    while len(times) < periods:
+        if not use_business_days or day.dayofweek < 5:
+            times.extend(day + offset for offset in offsets if day + offset > last_date)
+        day = day + pd.Timedelta(days=1)
+    return pd.DatetimeIndex(times[:periods])
+
+
 def _returns_to_prices(returns, start_price):
     prices = []
     current_price = start_price
@@ -148,6 +173,15 @@ class InferenceRunner:
         stochastic_seed,
         stochastic_sigma_mult,
         stochastic_lookback,
+        provider=None,
+        interval='1d',
+        plot_mode='interactive',
+        use_student=False,
+        tflite=None,
+        rollout='graph',
+        monte_carlo=False,
+        mc_dropout=False,
+        offline=False,
     ):
         self.run_folder = run_folder
         self.ticker = ticker
@@ -171,10 +205,31 @@ class InferenceRunner:
         self.stochastic_seed = stochastic_seed
         self.stochastic_sigma_mult = stochastic_sigma_mult
         self.stochastic_lookback = stochastic_lookback
+        self.provider = provider
+        self.interval = interval
+        self.plot_mode = plot_mode
+        self.use_student = use_student
+        # None runs the .keras models, 'float16' or 'int8' the TFLite files exported by training
+        self.tflite = tflite
+        # 'graph' rolls the forecast out in one compiled call, 'stateful' does the same carrying the
+        # LSTM state between steps, 'loop' calls predict once per step
+        self.rollout = rollout
+        # roll the stochastic paths through the model instead of adding noise to one forecast
+        self.monte_carlo = monte_carlo
+        self.mc_dropout = mc_dropout
+        # forecast from the cached bars only, without contacting the provider
+        self.offline = offline
 
     def run(self):
         print(tf.version.VERSION)
         inference_folder = os.path.join(os.getcwd(), self.run_folder)
+        config = _load_config(inference_folder)
+        # the bars must be the ones the model was trained on, the stored interval wins
+        interval = self.interval
+        if config is not None:
+            interval = config.get('interval', interval)
+            if interval != self.interval:
+                print('Warning: INTERVAL overridden by model_config.json')
         stock = StockPrediction(
             self.ticker,
             self.start_date,
@@ -185,9 +240,11 @@ class InferenceRunner:
             self.time_steps,
             self.token,
             self.batch_size,
+            interval,
         )
 
-        data = StockData(stock)
+        price_cache = PriceCache(offline=True, provider=self.provider) if self.offline else None
+        data = StockData(stock, provider=self.provider, price_cache=price_cache)
 
         raw_data = data.download_raw_data()
         if raw_data.empty:
@@ -203,7 +260,6 @@ class InferenceRunner:
         print(latest_date)
 
         scaler = _load_scaler(inference_folder)
-        config = _load_config(inference_folder)
         use_returns = self.use_returns
         use_deltas = self.use_deltas
         use_trend_residual = False
@@ -220,7 +276,23 @@ class InferenceRunner:
             if use_returns != self.use_returns:
                 print('Warning: USE_RETURNS overridden by model_config.json')
 
-        if model_version == 'v7':
+        # v8 and the dual-head students distilled from v7/v8 return both heads from one call
+        shared_heads = model_version == 'v8'
+        if self.use_student:
+            model = tf.keras.models.load_model(os.path.join(inference_folder, 'student.keras'), compile=False)
+            model.summary()
+            model_time_steps = model.input_shape[1]
+            shared_heads = model_version in ('v7', 'v8')
+        elif self.tflite is not None:
+            lite_models = load_tflite_models(inference_folder, ('direction', 'magnitude') if model_version == 'v7' else ('model',), self.tflite)
+            print('Running the ' + self.tflite + ' TFLite models through the interpreter')
+            if model_version == 'v7':
+                dir_model, mag_model = lite_models['direction'], lite_models['magnitude']
+                model_time_steps = dir_model.input_shape[1]
+            else:
+                model = lite_models['model']
+                model_time_steps = model.input_shape[1]
+        elif model_version == 'v7':
             model_dir_path = os.path.join(inference_folder, 'model_direction.keras')
             model_mag_path = os.path.join(inference_folder, 'model_magnitude.keras')
             dir_model = tf.keras.models.load_model(model_dir_path, compile=False)
@@ -268,7 +340,10 @@ class InferenceRunner:
                 deltas = close_series.diff().dropna().rename('Close')
                 scaler.fit(deltas.to_frame())
             elif use_trend_residual:
-                residuals = data._compute_trend_residuals(close_series, trend_window).rename('Close')
+                # the scaler is fitted on the residuals of the history; the same state would carry on
+                # with trend.extend() for bars that arrive after it
+                trend = TrendResiduals(trend_window)
+                residuals = pd.Series(trend.extend(close_series.to_numpy()), index=close_series.index[1:], name='Close')
                 scaler.fit(residuals.to_frame())
             else:
                 scaler.fit(close_series.to_frame())
@@ -277,9 +352,10 @@ class InferenceRunner:
             window_scaled = _scale_input(input_scaler, recent_window)
         else:
             window_scaled = _scale_input(scaler, recent_window)
-        window_scaled = window_scaled.reshape(1, time_steps, 1)
+        # the rolling window is a single float32 buffer updated in place, the dtype the model runs in
+        window_scaled = np.ascontiguousarray(window_scaled.reshape(1, time_steps, 1), dtype=np.float32)
 
-        future_dates = _future_dates(latest_date, self.forecast_days, self.use_business_days)
+        future_dates = _future_dates(latest_date, self.forecast_days, self.use_business_days, interval, raw_data.index)
         predictions = []
         current_close = latest_close_price
 
@@ -291,43 +367,69 @@ class InferenceRunner:
         else:
             mag_clip_value = None
 
-        while step_index < steps:
-            if step_index % max(1, steps // 10) == 0:
-                print(f'Inference progress: {step_index}/{steps}')
-            if model_version == 'v7':
-                dir_prob = dir_model.predict(window_scaled, verbose=0)[0][0]
-                mag_scaled = mag_model.predict(window_scaled, verbose=0)[0][0]
-                mag_value = scaler.inverse_transform([[mag_scaled]])[0][0]
-                if mag_clip_value is not None:
-                    mag_value = min(mag_value, mag_clip_value)
-                pred_values = [mag_value if dir_prob >= self.direction_threshold else -mag_value]
-                pred_scaled = [mag_scaled]
-            else:
-                pred_scaled = model.predict(window_scaled, verbose=0)[0]
-                if model_version in ('v5', 'v6'):
-                    pred_scaled = pred_scaled[:forecast_horizon]
-                else:
-                    pred_scaled = [pred_scaled[0]]
-                pred_values = scaler.inverse_transform(np.array(pred_scaled).reshape(-1, 1)).flatten()
-            if step_index == 0:
-                print(f'Predicted batch size: {len(pred_values)}')
-            if len(pred_values) == 0:
-                print('Error: model returned empty prediction batch. Check model_version and forecast_horizon.')
-                return
-            for idx, pred_value in enumerate(pred_values):
-                if step_index >= steps:
-                    break
-                predictions.append(pred_value)
-                if use_deltas or use_trend_residual:
-                    current_close = current_close + pred_value
-                    next_scaled = _scale_input(input_scaler, pd.DataFrame({'Close': [current_close]}))
-                    window_scaled = np.concatenate([window_scaled[:, 1:, :], next_scaled.reshape(1, 1, 1)], axis=1)
+        rollout = None
+        if self.rollout in ('graph', 'stateful') and self.tflite is None:
+            # the whole horizon in one compiled call, see GraphRollout and StatefulRollout
+            rollout_models = {'direction': dir_model, 'magnitude': mag_model} if model_version == 'v7' and not self.use_student else {'model': model}
+            rollout_options = dict(
+                input_scaler=input_scaler, use_deltas=use_deltas, use_trend_residual=use_trend_residual,
+                forecast_horizon=forecast_horizon, direction_threshold=self.direction_threshold, mag_clip_value=mag_clip_value,
+            )
+            if self.rollout == 'stateful':
+                try:
+                    rollout = StatefulRollout(rollout_models, model_version, scaler, **rollout_options)
+                except ValueError as error:
+                    print('Warning: ' + str(error) + '. Using the windowed graph rollout.')
+            if rollout is None:
+                rollout = GraphRollout(rollout_models, model_version, scaler, **rollout_options)
+        if rollout is not None:
+            rollout_started = time.perf_counter()
+            predictions = list(rollout.run(window_scaled, latest_close_price, steps)[0])
+            print(f'Rolled out {steps} steps in one graph call: {(time.perf_counter() - rollout_started) * 1000.0:.1f} ms')
+        else:
+            while step_index < steps:
+                if step_index % max(1, steps // 10) == 0:
+                    print(f'Inference progress: {step_index}/{steps}')
+                if model_version in ('v7', 'v8'):
+                    if shared_heads:
+                        dir_out, mag_out = model.predict(window_scaled, verbose=0)
+                        dir_prob = dir_out[0][0]
+                        mag_scaled = mag_out[0][0]
+                    else:
+                        dir_prob = dir_model.predict(window_scaled, verbose=0)[0][0]
+                        mag_scaled = mag_model.predict(window_scaled, verbose=0)[0][0]
+                    mag_value = scaler.inverse_transform([[mag_scaled]])[0][0]
+                    if mag_clip_value is not None:
+                        mag_value = min(mag_value, mag_clip_value)
+                    pred_values = [mag_value if dir_prob >= self.direction_threshold else -mag_value]
+                    pred_scaled = [mag_scaled]
                 else:
-                    pred_scaled_value = float(pred_scaled[idx])
-                    window_scaled = np.concatenate([window_scaled[:, 1:, :], [[[pred_scaled_value]]]], axis=1)
-                step_index += 1
-            if step_index > 0 and step_index % max(1, steps // 10) == 0:
-                print(f'Inference progress: {step_index}/{steps}')
+                    pred_scaled = model.predict(window_scaled, verbose=0)[0]
+                    if model_version in ('v5', 'v6'):
+                        pred_scaled = pred_scaled[:forecast_horizon]
+                    else:
+                        pred_scaled = [pred_scaled[0]]
+                    pred_values = scaler.inverse_transform(np.array(pred_scaled).reshape(-1, 1)).flatten()
+                if step_index == 0:
+                    print(f'Predicted batch size: {len(pred_values)}')
+                if len(pred_values) == 0:
+                    print('Error: model returned empty prediction batch. Check model_version and forecast_horizon.')
+                    return
+                for idx, pred_value in enumerate(pred_values):
+                    if step_index >= steps:
+                        break
+                    predictions.append(pred_value)
+                    if use_deltas or use_trend_residual:
+                        current_close = current_close + pred_value
+                        next_scaled = _scale_input(input_scaler, pd.DataFrame({'Close': [current_close]}))
+                        next_value = float(next_scaled.reshape(-1)[0])
+                    else:
+                        next_value = float(pred_scaled[idx])
+                    window_scaled[:, :-1, :] = window_scaled[:, 1:, :]
+                    window_scaled[0, -1, 0] = next_value
+                    step_index += 1
+                if step_index > 0 and step_index % max(1, steps // 10) == 0:
+                    print(f'Inference progress: {step_index}/{steps}')
 
         if use_returns:
             predicted_prices_raw = _returns_to_prices(predictions, latest_close_price)
@@ -339,14 +441,30 @@ class InferenceRunner:
                 predicted_prices_raw = np.maximum(predicted_prices_raw, 0)
 
         predicted_prices = self._blend_predictions(predicted_prices_raw, latest_close_price)
-        stochastic_paths = self._build_stochastic_paths(
-            predictions,
-            latest_close_price,
-            use_returns,
-            use_deltas,
-            use_trend_residual,
-            close_series,
-        )
+        if self.monte_carlo and rollout is not None:
+            if self.mc_dropout:
+                rollout = type(rollout)(rollout_models, model_version, scaler, mc_dropout=True, **rollout_options)
+            stochastic_paths = self._monte_carlo_paths(
+                rollout,
+                window_scaled,
+                latest_close_price,
+                steps,
+                use_returns,
+                use_deltas,
+                use_trend_residual,
+                close_series,
+            )
+        else:
+            if self.monte_carlo:
+                print('Warning: Monte Carlo paths need the graph or stateful rollout. Adding noise to the forecast instead.')
+            stochastic_paths = self._build_stochastic_paths(
+                predictions,
+                latest_close_price,
+                use_returns,
+                use_deltas,
+                use_trend_residual,
+                close_series,
+            )
 
         stochastic_summary = {}
         if stochastic_paths is not None and len(stochastic_paths) > 0:
@@ -379,38 +497,12 @@ class InferenceRunner:
             print('Sanity check - next day delta: ' + f'{delta_pct:.2f}%')
 
         history = close_series.tail(self.plot_history_days)
-        in_sample = _load_in_sample_predictions(inference_folder, self.ticker).tail(self.plot_history_days)
-        plt.figure(figsize=(14, 5))
-        plt.plot(history.index, history, color='green', label='Actual [' + self.ticker + '] price')
-        if in_sample is not None and not in_sample.empty:
-            plt.plot(in_sample.index, in_sample.iloc[:, 0], color='orange', label='In-sample [' + self.ticker + '] predicted')
-        if stochastic_paths is not None and len(stochastic_paths) > 0:
-            max_paths = min(len(stochastic_paths), 20)
-            for idx in range(max_paths):
-                plt.plot(
-                    forecast_df.index,
-                    stochastic_paths[idx],
-                    color='gray',
-                    alpha=0.2,
-                    linewidth=1,
-                    label='Stochastic paths' if idx == 0 else None,
-                )
-            if {'Predicted_Price_P10', 'Predicted_Price_P90'}.issubset(forecast_df.columns):
-                plt.fill_between(
-                    forecast_df.index,
-                    forecast_df['Predicted_Price_P10'],
-                    forecast_df['Predicted_Price_P90'],
-                    color='gray',
-                    alpha=0.15,
-                    label='P10-P90 band',
-                )
-        plt.plot(forecast_df.index, forecast_df['Predicted_Price'], color='red', label='Predicted [' + self.ticker + '] price')
-        plt.xlabel('Time')
-        plt.ylabel('Price [USD]')
-        plt.legend()
-        plt.title('Actual vs Predicted Prices')
-        plt.savefig(os.path.join(inference_folder, self.ticker + '_future_forecast.png'))
-        plt.show()
+        in_sample = _load_in_sample_predictions(inference_folder, self.ticker)
+        if in_sample is not None:
+            in_sample = in_sample.tail(self.plot_history_days)
+        plotter = Plotter(True, inference_folder, self.ticker, 'USD', self.ticker, mode=self.plot_mode)
+        plotter.plot_forecast(history, in_sample, forecast_df, stochastic_paths)
+        plotter.wait()
 
     def _blend_predictions(self, predictions, anchor_price):
         if self.blend_alpha >= 1.0:
@@ -423,6 +515,47 @@ class InferenceRunner:
             current = blended_value
         return np.asarray(blended)
 
+    def _monte_carlo_paths(
+        self,
+        rollout,
+        window_scaled,
+        latest_close_price,
+        steps,
+        use_returns,
+        use_deltas,
+        use_trend_residual,
+        close_series,
+    ):
+        if self.stochastic_paths <= 0:
+            return None
+        noise_std = _estimate_noise_std(
+            close_series,
+            use_returns,
+            use_deltas,
+            use_trend_residual,
+            self.stochastic_lookback,
+        ) * max(self.stochastic_sigma_mult, 0.0)
+        if noise_std <= 0 and not self.mc_dropout:
+            print('Warning: stochastic noise std is 0. Skipping stochastic paths.')
+            return None
+        # every path perturbs each predicted step and feeds the perturbed value back to the model,
+        # all paths go through the model together as one batch
+        rng = np.random.default_rng(self.stochastic_seed)
+        noise = rng.normal(0.0, noise_std, size=(self.stochastic_paths, steps))
+        started = time.perf_counter()
+        values = rollout.run(np.repeat(window_scaled, self.stochastic_paths, axis=0), latest_close_price, steps, noise=noise)
+        print(f'Rolled out {self.stochastic_paths} Monte Carlo paths of {steps} steps: {(time.perf_counter() - started) * 1000.0:.1f} ms')
+        paths = []
+        for path_values in values:
+            if use_returns:
+                prices = _returns_to_prices(path_values, latest_close_price)
+            elif use_deltas or use_trend_residual:
+                prices = latest_close_price + np.cumsum(path_values)
+            else:
+                prices = path_values
+            paths.append(self._blend_predictions(prices, latest_close_price))
+        return np.asarray(paths)
+
     def _build_stochastic_paths(
         self,
         predictions,
@@ -493,6 +626,15 @@ def main(argv):
         stochastic_seed=STOCHASTIC_SEED,
         stochastic_sigma_mult=STOCHASTIC_SIGMA_MULT,
         stochastic_lookback=STOCHASTIC_LOOKBACK,
+        provider=create_provider(DATA_PROVIDER),
+        interval=INTERVAL,
+        plot_mode=PLOT_MODE,
+        use_student=USE_STUDENT,
+        tflite=TFLITE,
+        rollout=ROLLOUT,
+        monte_carlo=MONTE_CARLO,
+        mc_dropout=MC_DROPOUT,
+        offline=OFFLINE,
         )
         runner.run()
 
@@ -522,4 +664,13 @@ if __name__ == '__main__':
     STOCHASTIC_SEED = 42
     STOCHASTIC_SIGMA_MULT = 0.6
     STOCHASTIC_LOOKBACK = 120
+    DATA_PROVIDER = 'yahoo'
+    INTERVAL = '1d'
+    PLOT_MODE = 'interactive'
+    USE_STUDENT = False
+    TFLITE = None
+    ROLLOUT = 'graph'
+    MONTE_CARLO = False
+    MC_DROPOUT = False
+    OFFLINE = False
     app.run(main)
@@ -0,0 +1,197 @@
+# Copyright 2020-2026 Jordi Corbilla. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import os
+import json
+import argparse
+
+import numpy as np
+import pandas as pd
+from tensorflow.keras.optimizers import Adam
+
+from stock_prediction_class import StockPrediction
+from stock_prediction_data_provider import ReplayProvider, create_provider, is_intraday
+from stock_prediction_deep_learning import load_previous_run, load_training_data
+from stock_prediction_lstm import LongShortTermMemory
+from stock_prediction_numpy import StockData
+from stock_prediction_telemetry import latency_ms
+
+STUDENT_FILE = 'student.keras'
+
+
+class Distiller:
+    def __init__(self, run_folder, kind='gru', epochs=50, batch_size=32, alpha=1.0, provider=None):
+        self.run_folder = run_folder
+        self.kind = kind
+        self.epochs = epochs
+        self.batch_size = batch_size
+        # weight of the teacher's outputs in the targets, the rest is the ground truth
+        self.alpha = alpha
+        self.previous = load_previous_run(run_folder)
+        self.config = self.previous['config']
+        self.model_version = self.config.get('model_version', 'v1')
+        self.dual_head = self.model_version in ('v7', 'v8')
+        downloaded_path = os.path.join(run_folder, 'downloaded_data_' + self.config['ticker'] + '.csv')
+        if os.path.exists(downloaded_path) and not is_intraday(self.config.get('interval', '1d')):
+            # the bars the teacher was trained on, as saved in its run folder; provider is only
+            # used for runs that did not save them
+            run_folder = os.path.abspath(run_folder)
+            provider = ReplayProvider(search_folder=os.path.dirname(run_folder), run_folder=os.path.basename(run_folder))
+        self.provider = provider
+
+    def _training_data(self):
+        folder = os.path.join(self.run_folder, 'distillation')
+        os.makedirs(folder, exist_ok=True)
+        stock = StockPrediction(
+            self.config['ticker'],
+            pd.to_datetime(self.config['start_date']),
+            pd.to_datetime(self.config['validation_date']),
+            folder,
+            '',
+            self.epochs,
+            int(self.config['time_steps']),
+            os.path.relpath(folder),
+            self.batch_size,
+            self.config.get('interval', '1d'),
+        )
+        # the teacher's scalers, so the student sees exactly the teacher's inputs
+        data = StockData(stock, provider=self.provider, min_max=self.previous['min_max'], input_scaler=self.previous['input_scaler'])
+        (x_train, y_train), (x_test, y_test), (training_data, test_data) = load_training_data(
+            data, stock, self.model_version,
+            use_returns=bool(self.config.get('use_returns', False)),
+            forecast_horizon=int(self.config.get('forecast_horizon', 1)),
+            trend_window=int(self.config.get('trend_window', 60)),
+        )
+        # close before each test bar, what a predicted return or delta is applied to
+        base_close = test_data['Close'].shift(1)
+        base_close.iloc[0] = training_data['Close'].iloc[-1]
+        return x_train, y_train, x_test, y_test, base_close.to_numpy(dtype=np.float64)
+
+    def teacher_outputs(self, x):
+        models = self.previous['models']
+        if self.model_version == 'v7':
+            return {'direction': models['direction'].predict(x, verbose=0), 'magnitude': models['magnitude'].predict(x, verbose=0)}
+        if self.model_version == 'v8':
+            direction, magnitude = models['model'].predict(x, verbose=0)
+            return {'direction': direction, 'magnitude': magnitude}
+        return models['model'].predict(x, verbose=0)
+
+    def _blend(self, teacher, truth):
+        if isinstance(teacher, dict):
+            return {name: self._blend(teacher[name], truth[name]) for name in teacher}
+        return (self.alpha * teacher + (1.0 - self.alpha) * np.reshape(truth, teacher.shape)).astype(np.float32)
+
+    def train(self):
+        x_train, y_train, x_test, y_test, base_close = self._training_data()
+        teacher_train = self.teacher_outputs(x_train)
+        teacher_test = self.teacher_outputs(x_test)
+        lstm = LongShortTermMemory(self.run_folder, telemetry=False)
+        output_units = 1 if self.dual_head else teacher_train.shape[-1]
+        student = lstm.create_student_model(x_train, kind=self.kind, output_units=output_units, dual_head=self.dual_head)
+        student.compile(
+            optimizer=Adam(learning_rate=0.001),
+            loss={'direction': 'binary_crossentropy', 'magnitude': 'mean_squared_error'} if self.dual_head else 'mean_squared_error',
+        )
+        student.fit(
+            x_train,
+            self._blend(teacher_train, y_train),
+            epochs=self.epochs,
+            batch_size=self.batch_size,
+            validation_data=(x_test, self._blend(teacher_test, y_test)),
+            callbacks=[lstm.get_callback()],
+        )
+        student.save(os.path.join(self.run_folder, STUDENT_FILE))
+        report = self.report(student, x_test, y_test, teacher_test, base_close)
+        with open(os.path.join(self.run_folder, 'distillation.json'), 'w', encoding='utf-8') as report_file:
+            json.dump(report, report_file, indent=2)
+        self.print_report(report)
+        return student, report
+
+    def _prices(self, values, base_close=None):
+        values = self.previous['min_max'].inverse_transform(np.reshape(values, (-1, 1))).flatten()
+        if self.config.get('use_returns', False) and not self.dual_head and base_close is not None:
+            # returns runs predict log returns, each one is applied to the actual previous close (as
+            # deltas are in train_LSTM_network) so errors do not compound over the test window
+            return base_close[:len(values)] * np.exp(values)
+        return values
+
+    def report(self, student, x_test, y_test, teacher_test, base_close=None):
+        student_test = student.predict(x_test, verbose=0)
+        if self.dual_head:
+            student_test = dict(zip(('direction', 'magnitude'), student_test))
+        value_name = 'magnitude' if self.dual_head else None
+        truth = self._prices(y_test[value_name] if value_name else y_test, base_close)
+        teacher_values = self._prices(teacher_test[value_name] if value_name else teacher_test, base_close)
+        student_values = self._prices(student_test[value_name] if value_name else student_test, base_close)
+        report = {
+            'model_version': self.model_version,
+            'student': self.kind,
+            'alpha': self.alpha,
+            'teacher_params': int(sum(model.count_params() for model in self.previous['models'].values())),
+            'student_params': int(student.count_params()),
+            'teacher_mae': float(np.mean(np.abs(teacher_values - truth))),
+            'student_mae': float(np.mean(np.abs(student_values - truth))),
+            # how closely the student follows the teacher, in price units
+            'student_teacher_mae': float(np.mean(np.abs(student_values - teacher_values))),
+        }
+        if self.dual_head:
+            direction_truth = np.reshape(y_test['direction'], (-1,)) >= 0.5
+            teacher_direction = teacher_test['direction'].flatten() >= 0.5
+            student_direction = student_test['direction'].flatten() >= 0.5
+            report['teacher_direction_accuracy'] = float(np.mean(teacher_direction == direction_truth))
+            report['student_direction_accuracy'] = float(np.mean(student_direction == direction_truth))
+            report['direction_agreement'] = float(np.mean(student_direction == teacher_direction))
+        # per-call latency of one window, through predict as InferenceRunner does and as a direct call
+        window = np.ascontiguousarray(x_test[-1:], dtype=np.float32)
+        teachers = list(self.previous['models'].values())
+        report['teacher_predict_ms'] = latency_ms(lambda batch: [model.predict(batch, verbose=0) for model in teachers], window)
+        report['student_predict_ms'] = latency_ms(lambda batch: student.predict(batch, verbose=0), window)
+        report['teacher_call_ms'] = latency_ms(lambda batch: [model(batch, training=False) for model in teachers], window)
+        report['student_call_ms'] = latency_ms(lambda batch: student(batch, training=False), window)
+        report['call_speedup'] = report['teacher_call_ms'] / report['student_call_ms']
+        return report
+
+    def print_report(self, report):
+        print('Distilled ' + report['model_version'] + ' into a ' + report['student'] + ' student: '
+              + str(report['student_params']) + ' parameters against ' + str(report['teacher_params']))
+        print('MAE teacher ' + f"{report['teacher_mae']:.4f}" + ', student ' + f"{report['student_mae']:.4f}"
+              + ', student vs teacher ' + f"{report['student_teacher_mae']:.4f}")
+        if 'student_direction_accuracy' in report:
+            print('Direction accuracy teacher ' + f"{report['teacher_direction_accuracy']:.3f}" + ', student '
+                  + f"{report['student_direction_accuracy']:.3f}" + ', agreement ' + f"{report['direction_agreement']:.3f}")
+        print('Latency per window: predict ' + f"{report['teacher_predict_ms']:.2f}" + ' -> ' + f"{report['student_predict_ms']:.2f}"
+              + ' ms, direct call ' + f"{report['teacher_call_ms']:.2f}" + ' -> ' + f"{report['student_call_ms']:.2f}"
+              + ' ms (' + f"{report['call_speedup']:.1f}" + 'x)')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=("parsing arguments"))
+    parser.add_argument("-run_folder", required=True)
+    parser.add_argument("-student", default="gru", choices=["gru", "conv"])
+    parser.add_argument("-epochs", default="50")
+    parser.add_argument("-batch_size", default="32")
+    parser.add_argument("-alpha", default="1.0")
+    parser.add_argument("-data_provider", default=None, choices=["yahoo", "replay", "synthetic"])
+
+    args = parser.parse_args()
+
+    distiller = Distiller(
+        args.run_folder,
+        kind=args.student,
+        epochs=int(args.epochs),
+        batch_size=int(args.batch_size),
+        alpha=float(args.alpha),
+        provider=create_provider(args.data_provider) if args.data_provider else None,
+    )
+    distiller.train()
@@ -14,23 +14,17 @@
 # ==============================================================================
 
 import pandas as pd
-import yfinance as yf
 import datetime
 
-# show data for different tickers
-start = pd.to_datetime('2004-08-01')
-stock = ['ETH-USD']
-data = yf.download(stock, start=start, end=datetime.date.today())
-print(data)
-
-stock = ['GOOG']
-data = yf.download(stock, start=start, end=datetime.date.today())
-print(data)
+from stock_prediction_bulk_download import BulkDownloader
+from stock_prediction_metadata_cache import MetadataCache
 
-stock = ['FB']
-data = yf.download(stock, start=start, end=datetime.date.today())
+# show data for different tickers, downloaded concurrently and aligned on date
+start = pd.to_datetime('2004-08-01')
+tickers = ['ETH-USD', 'GOOG', 'FB', 'TSLA']
+downloader = BulkDownloader(max_workers=4, requests_per_second=2.0)
+data, report = downloader.download(tickers, start, datetime.date.today())
 print(data)
 
-stock = ['TSLA']
-data = yf.download(stock, start=start, end=datetime.date.today())
-print(data)
+# warm the ticker metadata used for chart titles and currencies
+MetadataCache().fill(tickers, max_workers=4, requests_per_second=2.0)
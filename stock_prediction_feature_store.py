@@ -0,0 +1,147 @@
+# Copyright 2020-2026 Jordi Corbilla. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import os
+import json
+import time
+import pickle
+import shutil
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from stock_prediction_windows import input_windows, target_windows, window_series
+
+# bump when the preprocessing output changes so older entries are no longer matched
+FEATURE_STORE_VERSION = 1
+
+
+def fingerprint(data, params):
+    digest = hashlib.sha256()
+    digest.update(str(FEATURE_STORE_VERSION).encode('utf-8'))
+    digest.update(json.dumps(params, sort_keys=True, default=str).encode('utf-8'))
+    frame = data.set_index('Date') if 'Date' in data.columns else data
+    digest.update(pd.DatetimeIndex(frame.index).asi8.tobytes())
+    digest.update(np.ascontiguousarray(frame['Close'].to_numpy(dtype=np.float64)).tobytes())
+    return digest.hexdigest()
+
+
+# Persists the outputs of StockData preprocessing together with the fitted scalers. Window arrays
+# are stored as the series they were cut from and rebuilt as views on load. Every save evicts the
+# least recently used entries beyond max_bytes and those unused for max_age_days (None disables).
+class FeatureStore:
+    def __init__(self, folder=None, max_bytes=2 * 1024 ** 3, max_age_days=30):
+        if folder is None:
+            folder = os.path.join(os.getcwd(), 'feature_store')
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+
+    def _entry_folder(self, key):
+        return os.path.join(self.folder, key)
+
+    def _save_leaf(self, folder, index, leaf):
+        name = 'leaf_' + str(index)
+        if isinstance(leaf, pd.DataFrame):
+            leaf.to_pickle(os.path.join(folder, name + '.pkl'))
+            return {'kind': 'frame', 'name': name}
+        leaf = np.asarray(leaf)
+        if leaf.ndim == 3:
+            np.save(os.path.join(folder, name + '.npy'), window_series(leaf))
+            return {'kind': 'input_windows', 'name': name, 'rows': int(leaf.shape[0]), 'width': int(leaf.shape[1])}
+        if leaf.ndim == 2:
+            np.save(os.path.join(folder, name + '.npy'), window_series(leaf))
+            return {'kind': 'target_windows', 'name': name, 'rows': int(leaf.shape[0]), 'width': int(leaf.shape[1])}
+        np.save(os.path.join(folder, name + '.npy'), leaf)
+        return {'kind': 'array', 'name': name}
+
+    def _load_leaf(self, folder, spec):
+        if spec['kind'] == 'frame':
+            return pd.read_pickle(os.path.join(folder, spec['name'] + '.pkl'))
+        values = np.load(os.path.join(folder, spec['name'] + '.npy'), mmap_mode='r')
+        if spec['kind'] == 'input_windows':
+            return input_windows(values, spec['width'], spec['width'], spec['rows'] + spec['width'])
+        if spec['kind'] == 'target_windows':
+            return target_windows(values, 0, spec['rows'], horizon=spec['width'])
+        return values
+
+    def save(self, key, result, scalers, params=None):
+        folder = self._entry_folder(key)
+        tmp_folder = folder + '.tmp'
+        shutil.rmtree(tmp_folder, ignore_errors=True)
+        os.makedirs(tmp_folder)
+        layout = []
+        index = 0
+        for group in result:
+            group_layout = []
+            for leaf in group:
+                group_layout.append(self._save_leaf(tmp_folder, index, leaf))
+                index += 1
+            layout.append(group_layout)
+        with open(os.path.join(tmp_folder, 'scalers.pkl'), 'wb') as scaler_file:
+            pickle.dump(scalers, scaler_file)
+        with open(os.path.join(tmp_folder, 'layout.json'), 'w', encoding='utf-8') as layout_file:
+            json.dump({'layout': layout, 'params': params}, layout_file, indent=2, default=str)
+        shutil.rmtree(folder, ignore_errors=True)
+        os.replace(tmp_folder, folder)
+        self.prune(keep=key)
+
+    def load(self, key):
+        folder = self._entry_folder(key)
+        layout_path = os.path.join(folder, 'layout.json')
+        try:
+            with open(layout_path, 'r', encoding='utf-8') as layout_file:
+                layout = json.load(layout_file)['layout']
+            # the layout's modification time is the entry's last use, which prune evicts by
+            os.utime(layout_path)
+            with open(os.path.join(folder, 'scalers.pkl'), 'rb') as scaler_file:
+                scalers = pickle.load(scaler_file)
+            result = tuple(tuple(self._load_leaf(folder, spec) for spec in group) for group in layout)
+        except FileNotFoundError:
+            # missing, or evicted by another process while it was being read
+            return None
+        return result, scalers
+
+    def _entries(self):
+        # (last use, bytes, key) of every complete entry
+        entries = []
+        if not os.path.isdir(self.folder):
+            return entries
+        for key in os.listdir(self.folder):
+            folder = self._entry_folder(key)
+            layout_path = os.path.join(folder, 'layout.json')
+            if key.endswith('.tmp') or not os.path.exists(layout_path):
+                continue
+            size = sum(os.path.getsize(os.path.join(folder, name)) for name in os.listdir(folder))
+            entries.append((os.path.getmtime(layout_path), size, key))
+        return entries
+
+    def prune(self, keep=None):
+        entries = sorted(self._entries(), reverse=True)
+        cutoff = None if self.max_age_days is None else time.time() - self.max_age_days * 86400.0
+        total = 0
+        removed = []
+        for last_used, size, key in entries:
+            total += size
+            if key == keep:
+                continue
+            if (cutoff is not None and last_used < cutoff) or (self.max_bytes is not None and total > self.max_bytes):
+                # an entry another process still has memory-mapped is removed once it is closed
+                shutil.rmtree(self._entry_folder(key), ignore_errors=True)
+                total -= size
+                removed.append(key)
+        if removed:
+            print('Feature store: evicted ' + str(len(removed)) + ' entries, ' + str(round(total / (1024.0 * 1024.0), 1)) + ' MB kept')
+        return removed
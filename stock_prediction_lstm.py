@@ -14,19 +14,69 @@
 # ==============================================================================
 import os
 import warnings
+import functools
 
 warnings.filterwarnings("ignore", message=".*np.object.*", category=FutureWarning)
 
 import tensorflow as tf
-from tensorflow.keras import Sequential
-from tensorflow.keras.layers import Dropout, Dense, LSTM, Input
+from tensorflow.keras import Model, Sequential
+from tensorflow.keras.layers import Dropout, Dense, LSTM, GRU, Conv1D, Flatten, Input
 from tensorflow.keras.losses import Huber
 from tensorflow.keras.optimizers import Adam
 
+from stock_prediction_telemetry import TelemetryCallback
+
+# jit_compile: XLA compiles the train step, which Keras leaves off on CPU-only machines
+# steps_per_execution: batches run per call into the compiled function, fewer Python round trips
+# mixed_precision: bfloat16 compute with float32 weights and outputs, only used when the CPU has it
+TRAINING_MODES = {
+    'default': {'jit_compile': False, 'steps_per_execution': 1, 'mixed_precision': False},
+    'jit': {'jit_compile': True, 'steps_per_execution': 1, 'mixed_precision': False},
+    'steps': {'jit_compile': False, 'steps_per_execution': 32, 'mixed_precision': False},
+    'compiled': {'jit_compile': True, 'steps_per_execution': 32, 'mixed_precision': False},
+    'bf16': {'jit_compile': True, 'steps_per_execution': 32, 'mixed_precision': True},
+}
+
+
+def bf16_supported():
+    # native bfloat16 arithmetic (AVX512-BF16 or AMX), emulating it is slower than float32
+    try:
+        with open('/proc/cpuinfo', 'r', encoding='utf-8') as cpuinfo:
+            flags = cpuinfo.read()
+    except OSError:
+        return False
+    return 'avx512_bf16' in flags or 'amx_bf16' in flags
+
+
+def _scoped_policy(build):
+    # layers take the global dtype policy when they are created: set the mode's policy for the
+    # build only and give the caller back whatever was set before
+    @functools.wraps(build)
+    def wrapper(self, *args, **kwargs):
+        previous = tf.keras.mixed_precision.global_policy()
+        tf.keras.mixed_precision.set_global_policy('mixed_bfloat16' if self.mode['mixed_precision'] else 'float32')
+        try:
+            return build(self, *args, **kwargs)
+        finally:
+            tf.keras.mixed_precision.set_global_policy(previous)
+    return wrapper
+
 
 class LongShortTermMemory:
-    def __init__(self, project_folder):
+    def __init__(self, project_folder, training_mode='default', telemetry=True):
         self.project_folder = project_folder
+        self.training_mode = training_mode
+        self.telemetry = telemetry
+        self.mode = dict(TRAINING_MODES[training_mode])
+        if self.mode['mixed_precision'] and not bf16_supported():
+            print('bfloat16 is not supported by this CPU, training in float32')
+            self.mode['mixed_precision'] = False
+
+    def get_training_mode(self):
+        return self.training_mode
+
+    def get_compile_options(self):
+        return {'jit_compile': self.mode['jit_compile'], 'steps_per_execution': self.mode['steps_per_execution']}
 
     def get_defined_metrics(self):
         defined_metrics = [
@@ -38,9 +88,9 @@ class LongShortTermMemory:
         callback = tf.keras.callbacks.EarlyStopping(monitor='val_loss', patience=3, mode='min', verbose=1)
         return callback
 
-    def get_callbacks(self, version='v1'):
+    def get_callbacks(self, version='v1', stage=None, batch_size=None, samples=None):
         callbacks = [self.get_callback()]
-        if version == 'v4':
+        if version in ('v4', 'v8'):
             callbacks.append(
                 tf.keras.callbacks.ReduceLROnPlateau(
                     monitor='val_loss',
@@ -50,8 +100,14 @@ class LongShortTermMemory:
                     verbose=1,
                 )
             )
+        if self.telemetry:
+            callbacks.append(TelemetryCallback(
+                self.project_folder, model_version=version, stage=stage, batch_size=batch_size, samples=samples,
+                training_mode=self.training_mode,
+            ))
         return callbacks
 
+    @_scoped_policy
     def create_model(self, x_train, version='v1', output_units=1):
         if version in ('v2', 'v3'):
             return self._create_model_v2(x_train)
@@ -61,8 +117,11 @@ class LongShortTermMemory:
             return self._create_model_v5(x_train, output_units)
         if version == 'v7':
             return self._create_model_v7(x_train, output_units)
+        if version == 'v8':
+            return self._create_model_v8(x_train)
         return self._create_model_v1(x_train)
 
+    @_scoped_policy
     def _create_model_v1(self, x_train):
         model = Sequential()
         model.add(Input(shape=(x_train.shape[1], x_train.shape[2])))
@@ -74,10 +133,11 @@ class LongShortTermMemory:
         model.add(Dropout(0.5))
         model.add(LSTM(units=50))
         model.add(Dropout(0.5))
-        model.add(Dense(units=1))
+        model.add(Dense(units=1, dtype='float32'))
         model.summary()
         return model
 
+    @_scoped_policy
     def _create_model_v2(self, x_train):
         model = Sequential()
         model.add(Input(shape=(x_train.shape[1], x_train.shape[2])))
@@ -85,10 +145,11 @@ class LongShortTermMemory:
         model.add(Dropout(0.2))
         model.add(LSTM(units=32))
         model.add(Dropout(0.2))
-        model.add(Dense(units=1))
+        model.add(Dense(units=1, dtype='float32'))
         model.summary()
         return model
 
+    @_scoped_policy
     def _create_model_v4(self, x_train):
         model = Sequential()
         model.add(Input(shape=(x_train.shape[1], x_train.shape[2])))
@@ -96,10 +157,11 @@ class LongShortTermMemory:
         model.add(Dropout(0.1))
         model.add(LSTM(units=64))
         model.add(Dropout(0.2))
-        model.add(Dense(units=1))
+        model.add(Dense(units=1, dtype='float32'))
         model.summary()
         return model
 
+    @_scoped_policy
     def _create_model_v5(self, x_train, output_units):
         model = Sequential()
         model.add(Input(shape=(x_train.shape[1], x_train.shape[2])))
@@ -107,10 +169,11 @@ class LongShortTermMemory:
         model.add(Dropout(0.1))
         model.add(LSTM(units=64))
         model.add(Dropout(0.2))
-        model.add(Dense(units=output_units))
+        model.add(Dense(units=output_units, dtype='float32'))
         model.summary()
         return model
 
+    @_scoped_policy
     def _create_model_v7(self, x_train, output_units, activation=None):
         model = Sequential()
         model.add(Input(shape=(x_train.shape[1], x_train.shape[2])))
@@ -118,16 +181,61 @@ class LongShortTermMemory:
         model.add(Dropout(0.1))
         model.add(LSTM(units=64))
         model.add(Dropout(0.2))
-        model.add(Dense(units=output_units, activation=activation))
+        model.add(Dense(units=output_units, activation=activation, dtype='float32'))
+        model.summary()
+        return model
+
+    @_scoped_policy
+    def _create_model_v8(self, x_train):
+        # v7 with a single LSTM trunk shared by the direction and magnitude heads
+        inputs = Input(shape=(x_train.shape[1], x_train.shape[2]))
+        trunk = LSTM(units=128, return_sequences=True)(inputs)
+        trunk = Dropout(0.1)(trunk)
+        trunk = LSTM(units=64)(trunk)
+        trunk = Dropout(0.2)(trunk)
+        direction = Dense(units=1, activation='sigmoid', name='direction', dtype='float32')(trunk)
+        magnitude = Dense(units=1, name='magnitude', dtype='float32')(trunk)
+        model = Model(inputs=inputs, outputs=[direction, magnitude])
+        model.summary()
+        return model
+
+    @_scoped_policy
+    def create_student_model(self, x_train, kind='gru', output_units=1, dual_head=False):
+        # small distillation student: one 16 unit GRU, or two causal convolutions over the window
+        inputs = Input(shape=(x_train.shape[1], x_train.shape[2]))
+        if kind == 'conv':
+            trunk = Conv1D(filters=16, kernel_size=3, padding='causal', activation='relu')(inputs)
+            trunk = Conv1D(filters=16, kernel_size=3, padding='causal', dilation_rate=2, activation='relu')(trunk)
+            trunk = Flatten()(trunk)
+        else:
+            trunk = GRU(units=16)(inputs)
+        if dual_head:
+            direction = Dense(units=1, activation='sigmoid', name='direction', dtype='float32')(trunk)
+            magnitude = Dense(units=1, name='magnitude', dtype='float32')(trunk)
+            model = Model(inputs=inputs, outputs=[direction, magnitude], name='student_' + kind)
+        else:
+            model = Model(inputs=inputs, outputs=Dense(units=output_units, dtype='float32')(trunk), name='student_' + kind)
         model.summary()
         return model
 
     def get_loss(self, version='v1'):
+        if version == 'v8':
+            return {'direction': 'binary_crossentropy', 'magnitude': Huber()}
         if version in ('v2', 'v3', 'v4', 'v5'):
             return Huber()
         return 'mean_squared_error'
 
+    def get_loss_weights(self, version='v1', magnitude_weight=1.0):
+        if version == 'v8':
+            return {'direction': 1.0, 'magnitude': magnitude_weight}
+        return None
+
+    def get_metrics(self, version='v1'):
+        if version == 'v8':
+            return {'direction': ['accuracy'], 'magnitude': self.get_defined_metrics()}
+        return self.get_defined_metrics()
+
     def get_optimizer(self, version='v1'):
-        if version in ('v4', 'v5'):
+        if version in ('v4', 'v5', 'v8'):
             return Adam(learning_rate=0.001)
         return 'adam'
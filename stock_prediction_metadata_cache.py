@@ -0,0 +1,136 @@
+# Copyright 2020-2026 Jordi Corbilla. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import os
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from stock_prediction_bulk_download import RateLimiter, RateLimitedProvider
+from stock_prediction_data_provider import YahooFinanceProvider
+from stock_prediction_file_lock import file_lock, tmp_path_for
+
+
+# Ticker.info is a slow remote call, keep the fields the project uses on disk and refresh them
+# once they are older than ttl_hours.
+class MetadataCache:
+    def __init__(self, cache_folder=None, provider=None, ttl_hours=24 * 7, fields=('shortName', 'longName', 'currency', 'exchange', 'quoteType')):
+        if cache_folder is None:
+            cache_folder = os.path.join(os.getcwd(), 'price_cache')
+        self.cache_folder = cache_folder
+        self.provider = provider if provider is not None else YahooFinanceProvider()
+        self.ttl = timedelta(hours=ttl_hours)
+        self.fields = fields
+        self._lock = threading.Lock()
+        self._entries = None
+
+    def _cache_path(self):
+        return os.path.join(self.cache_folder, self.provider.name, 'metadata.json')
+
+    def _read_file(self, path):
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, 'r', encoding='utf-8') as cache_file:
+                return json.load(cache_file)
+        except ValueError as error:
+            # a damaged file only costs a refetch, it must not stop the run
+            print('Warning: ignoring unreadable metadata cache ' + path + '. ' + str(error))
+            return {}
+
+    def _load(self):
+        if self._entries is None:
+            self._entries = self._read_file(self._cache_path()) if self.provider.cacheable else {}
+        return self._entries
+
+    def _save(self):
+        if not self.provider.cacheable:
+            return
+        path = self._cache_path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with file_lock(path):
+            # other processes may have written since this one loaded the file: merge, newest entry wins
+            entries = self._read_file(path)
+            for ticker, entry in self._load().items():
+                if ticker not in entries or entries[ticker]['fetched_at'] <= entry['fetched_at']:
+                    entries[ticker] = entry
+            tmp_path = tmp_path_for(path)
+            with open(tmp_path, 'w', encoding='utf-8') as cache_file:
+                json.dump(entries, cache_file, indent=2, sort_keys=True)
+            os.replace(tmp_path, path)
+        self._entries = entries
+
+    def _is_fresh(self, entry):
+        fetched_at = datetime.strptime(entry['fetched_at'], "%Y-%m-%d %H:%M:%S")
+        return datetime.now() - fetched_at < self.ttl
+
+    def _fetch(self, ticker, provider):
+        info = provider.get_info(ticker) or {}
+        return {
+            'fetched_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'info': {field: info.get(field) for field in self.fields if field in info},
+        }
+
+    def _refresh(self, ticker, provider):
+        try:
+            entry = self._fetch(ticker, provider)
+        except Exception as error:
+            with self._lock:
+                entry = self._load().get(ticker)
+            if entry is None:
+                raise
+            print('Warning: metadata refresh failed for ' + ticker + ', using cached values. ' + str(error))
+            return entry
+        with self._lock:
+            self._load()[ticker] = entry
+        return entry
+
+    def get(self, ticker):
+        with self._lock:
+            entry = self._load().get(ticker)
+        if entry is None or not self._is_fresh(entry):
+            entry = self._refresh(ticker, self.provider)
+            with self._lock:
+                self._save()
+        return entry['info']
+
+    def get_short_name(self, ticker):
+        info = self.get(ticker)
+        return info.get('shortName') or info.get('longName') or ticker
+
+    def get_currency(self, ticker):
+        return self.get(ticker).get('currency') or 'USD'
+
+    def fill(self, tickers, max_workers=8, requests_per_second=2.0):
+        with self._lock:
+            entries = self._load()
+            stale = [ticker for ticker in tickers if ticker not in entries or not self._is_fresh(entries[ticker])]
+        if not stale:
+            return {}
+        provider = RateLimitedProvider(self.provider, RateLimiter(requests_per_second))
+        failures = {}
+
+        def refresh(ticker):
+            try:
+                self._refresh(ticker, provider)
+            except Exception as error:
+                failures[ticker] = str(error)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(refresh, stale))
+        with self._lock:
+            self._save()
+        print('Metadata cache: refreshed ' + str(len(stale) - len(failures)) + '/' + str(len(stale)) + ' tickers')
+        return failures
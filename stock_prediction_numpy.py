@@ -20,15 +20,34 @@ import random
 import pandas as pd
 from sklearn.preprocessing import MinMaxScaler
 from datetime import datetime
-import yfinance as yf
+
+from stock_prediction_data_provider import YahooFinanceProvider
+from stock_prediction_feature_store import fingerprint
+from stock_prediction_metadata_cache import MetadataCache
+from stock_prediction_price_cache import PriceCache
+from stock_prediction_trend import rolling_trend_residuals
+from stock_prediction_windows import input_windows, target_windows, print_window_memory, print_stage_memory
 
 
 class StockData:
-    def __init__(self, stock):
+    def __init__(self, stock, price_cache=None, provider=None, metadata_cache=None, spill_folder=None, chunk_size=250000, feature_store=None, dtype=np.float32, min_max=None, input_scaler=None):
         self._stock = stock
-        self._sec = yf.Ticker(self._stock.get_ticker())
-        self._min_max = MinMaxScaler(feature_range=(0, 1))
-        self._input_scaler = MinMaxScaler(feature_range=(0, 1))
+        # every scaled series, and therefore every window and target, is produced in this dtype so
+        # Keras does not keep a cast copy of the training set next to ours
+        self._dtype = np.dtype(dtype)
+        self._feature_store = feature_store
+        self._spill_folder = spill_folder
+        self._chunk_size = chunk_size
+        if provider is None:
+            provider = price_cache.provider if price_cache is not None else YahooFinanceProvider()
+        self._provider = provider
+        self._price_cache = price_cache if price_cache is not None else PriceCache(provider=provider)
+        self._metadata_cache = metadata_cache if metadata_cache is not None else MetadataCache(provider=provider)
+        # scalers passed in are already fitted (warm start) and are only applied, never refitted, so
+        # new bars are scaled exactly as the data the model was trained on
+        self._frozen_scalers = [scaler for scaler in (min_max, input_scaler) if scaler is not None]
+        self._min_max = min_max if min_max is not None else MinMaxScaler(feature_range=(0, 1))
+        self._input_scaler = input_scaler if input_scaler is not None else MinMaxScaler(feature_range=(0, 1))
 
     def __data_verification(self, train):
         print('mean:', train.mean(axis=0))
@@ -37,7 +56,7 @@ class StockData:
         print('Std dev:', train.std(axis=0))
 
     def get_stock_short_name(self):
-        return self._sec.info['shortName']
+        return self._metadata_cache.get_short_name(self._stock.get_ticker())
 
     def get_min_max(self):
         return self._min_max
@@ -45,8 +64,52 @@ class StockData:
     def get_input_scaler(self):
         return self._input_scaler
 
+    def get_dtype(self):
+        return self._dtype
+
     def get_stock_currency(self):
-        return self._sec.info['currency']
+        return self._metadata_cache.get_currency(self._stock.get_ticker())
+
+    def _is_frozen(self, scaler):
+        return any(scaler is frozen for frozen in self._frozen_scalers)
+
+    def _align_features(self, scaler, data):
+        # scalers from older runs were fitted on a column named after the ticker, or on a bare array
+        feature_names = getattr(scaler, 'feature_names_in_', None)
+        if feature_names is None:
+            return data.to_numpy()
+        if list(data.columns) != list(feature_names):
+            return data.set_axis(list(feature_names), axis=1)
+        return data
+
+    def _transform(self, scaler, data, name, fit=False):
+        if self._is_frozen(scaler):
+            fit = False
+            data = self._align_features(scaler, data)
+        # Long (intraday) series are scaled chunk by chunk into a memory-mapped .npy file so the
+        # windows built on top of them are views over disk instead of RAM.
+        if self._spill_folder is None or len(data) <= self._chunk_size:
+            scaled = scaler.fit_transform(data) if fit else scaler.transform(data)
+            scaled = np.ascontiguousarray(scaled, dtype=self._dtype)
+            print_stage_memory(name, [scaled])
+            return scaled
+        if fit:
+            scaler.fit(data[:self._chunk_size])
+            for start in range(self._chunk_size, len(data), self._chunk_size):
+                scaler.partial_fit(data[start:start + self._chunk_size])
+        os.makedirs(self._spill_folder, exist_ok=True)
+        path = os.path.join(self._spill_folder, name + '.npy')
+        spilled = np.lib.format.open_memmap(path, mode='w+', dtype=self._dtype, shape=(len(data), data.shape[1]))
+        for start in range(0, len(data), self._chunk_size):
+            spilled[start:start + self._chunk_size] = scaler.transform(data[start:start + self._chunk_size])
+        spilled.flush()
+        del spilled
+        spilled = np.load(path, mmap_mode='r')
+        print_stage_memory(name + ' (memory-mapped)', [spilled])
+        return spilled
+
+    def _fit_transform(self, scaler, data, name):
+        return self._transform(scaler, data, name, fit=True)
 
     def _compute_log_returns(self, series):
         return np.log(series).diff().dropna()
@@ -55,18 +118,7 @@ class StockData:
         return series.diff().dropna()
 
     def _compute_trend_residuals(self, series, window):
-        values = series.to_numpy()
-        residuals = []
-        for i in range(1, len(values)):
-            start = max(0, i - window)
-            y = values[start:i]
-            if len(y) < 2:
-                residuals.append(values[i] - values[i - 1])
-                continue
-            x = np.arange(len(y))
-            slope, intercept = np.polyfit(x, y, 1)
-            trend_next = slope * len(y) + intercept
-            residuals.append(values[i] - trend_next)
+        residuals = rolling_trend_residuals(series.to_numpy(), window)
         return pd.Series(residuals, index=series.index[1:])
 
     def _ensure_series(self, series_or_frame):
@@ -79,22 +131,63 @@ class StockData:
             return series_or_frame.to_frame()
         return series_or_frame
 
+    def get_price_cache(self):
+        return self._price_cache
+
+    def get_provider(self):
+        return self._provider
+
+    def get_feature_store(self):
+        return self._feature_store
+
+    def _cached_features(self, name, data, params, build):
+        # Preprocessing is a pure function of the downloaded prices and these parameters, so its
+        # output and the fitted scalers can be reused by any later run with the same inputs.
+        if self._feature_store is None:
+            return build()
+        params = dict(params, method=name, ticker=self._stock.get_ticker(), interval=self._stock.get_interval(), dtype=self._dtype.name)
+        if self._frozen_scalers:
+            params['frozen_scalers'] = [[scaler.data_min_.tolist(), scaler.data_max_.tolist()] for scaler in self._frozen_scalers]
+        key = fingerprint(data, params)
+        cached = self._feature_store.load(key)
+        if cached is not None:
+            result, scalers = cached
+            self._min_max = scalers['min_max']
+            self._input_scaler = scalers['input_scaler']
+            print('Feature store: loaded ' + name + ' features ' + key[:12])
+            return result
+        result = build()
+        self._feature_store.save(key, result, {'min_max': self._min_max, 'input_scaler': self._input_scaler}, params)
+        print('Feature store: saved ' + name + ' features ' + key[:12])
+        return result
+
     def download_raw_data(self, end_date=None):
         if end_date is None:
             end_date = datetime.today()
-        data = yf.download(self._stock.get_ticker(), start=self._stock.get_start_date(), end=end_date, progress=False, auto_adjust=False)[['Close']]
-        data = data.reset_index()
-        data = data.set_index('Date')
+        data = self._price_cache.get(self._stock.get_ticker(), self._stock.get_start_date(), end_date, self._stock.get_interval())[['Close']]
         return data
 
     def download_transform_to_numpy(self, time_steps, project_folder, use_returns=False, use_deltas=False, use_trend_residual=False, trend_window=60, forecast_horizon=1):
         end_date = datetime.today()
         print('End Date: ' + end_date.strftime("%Y-%m-%d"))
-        data = yf.download(self._stock.get_ticker(), start=self._stock.get_start_date(), end=end_date, progress=False, auto_adjust=False)[['Close']]
+        data = self.download_raw_data(end_date)
         data = data.reset_index()
         data.to_csv(os.path.join(project_folder, 'downloaded_data_'+self._stock.get_ticker()+'.csv'))
         #print(data)
-
+        print_stage_memory('raw', [data])
+        params = {
+            'time_steps': time_steps,
+            'use_returns': use_returns,
+            'use_deltas': use_deltas,
+            'use_trend_residual': use_trend_residual,
+            'trend_window': trend_window,
+            'forecast_horizon': forecast_horizon,
+            'validation_date': self._stock.get_validation_date(),
+        }
+        return self._cached_features('transform', data, params, lambda: self._transform_to_numpy(
+            data, time_steps, use_returns, use_deltas, use_trend_residual, trend_window, forecast_horizon))
+
+    def _transform_to_numpy(self, data, time_steps, use_returns, use_deltas, use_trend_residual, trend_window, forecast_horizon):
         training_data = data[data['Date'] < self._stock.get_validation_date()].copy()
         test_data = data[data['Date'] >= self._stock.get_validation_date()].copy()
         training_data = training_data.set_index('Date')
@@ -113,15 +206,15 @@ class StockData:
             returns = self._compute_log_returns(full_series).rename('Close')
             training_returns = returns[returns.index < self._stock.get_validation_date()]
             test_returns = returns[returns.index >= self._stock.get_validation_date()]
-            train_scaled = self._min_max.fit_transform(training_returns.to_frame())
+            train_scaled = self._fit_transform(self._min_max, training_returns.to_frame(), 'train_returns')
         elif use_deltas:
             full_series = data.set_index('Date')[['Close']]
             full_series = self._ensure_series(full_series)
             deltas = self._compute_deltas(full_series).rename('Close')
             training_deltas = deltas[deltas.index < self._stock.get_validation_date()]
             test_deltas = deltas[deltas.index >= self._stock.get_validation_date()]
-            close_scaled = self._input_scaler.fit_transform(training_data)
-            delta_scaled = self._min_max.fit_transform(training_deltas.to_frame())
+            close_scaled = self._fit_transform(self._input_scaler, training_data, 'train_close')
+            delta_scaled = self._fit_transform(self._min_max, training_deltas.to_frame(), 'train_deltas')
             train_scaled = close_scaled
         elif use_trend_residual:
             full_series = data.set_index('Date')[['Close']]
@@ -129,56 +222,46 @@ class StockData:
             residuals = self._compute_trend_residuals(full_series, trend_window).rename('Close')
             training_residuals = residuals[residuals.index < self._stock.get_validation_date()]
             test_residuals = residuals[residuals.index >= self._stock.get_validation_date()]
-            close_scaled = self._input_scaler.fit_transform(training_data)
-            residual_scaled = self._min_max.fit_transform(training_residuals.to_frame())
+            close_scaled = self._fit_transform(self._input_scaler, training_data, 'train_close')
+            residual_scaled = self._fit_transform(self._min_max, training_residuals.to_frame(), 'train_residuals')
             train_scaled = close_scaled
         else:
-            train_scaled = self._min_max.fit_transform(training_data)
+            train_scaled = self._fit_transform(self._min_max, training_data, 'train_close')
         self.__data_verification(train_scaled)
 
         # Training Data Transformation
-        x_train = []
-        y_train = []
-        if use_deltas:
+        if use_deltas or use_trend_residual:
+            target_scaled = delta_scaled if use_deltas else residual_scaled
             close_scaled_aligned = close_scaled[1:]
-            for i in range(time_steps, close_scaled_aligned.shape[0] - forecast_horizon + 1):
-                x_train.append(close_scaled_aligned[i - time_steps:i])
-                y_train.append(delta_scaled[i:i + forecast_horizon, 0])
-        elif use_trend_residual:
-            close_scaled_aligned = close_scaled[1:]
-            for i in range(time_steps, close_scaled_aligned.shape[0] - forecast_horizon + 1):
-                x_train.append(close_scaled_aligned[i - time_steps:i])
-                y_train.append(residual_scaled[i:i + forecast_horizon, 0])
+            stop = close_scaled_aligned.shape[0] - forecast_horizon + 1
+            x_train = input_windows(close_scaled_aligned, time_steps, time_steps, stop)
+            y_train = target_windows(target_scaled, time_steps, stop, horizon=forecast_horizon)
         else:
-            for i in range(time_steps, train_scaled.shape[0]):
-                x_train.append(train_scaled[i - time_steps:i])
-                y_train.append(train_scaled[i, 0])
-
-        x_train, y_train = np.array(x_train), np.array(y_train)
-        x_train = np.reshape(x_train, (x_train.shape[0], x_train.shape[1], 1))
+            x_train = input_windows(train_scaled, time_steps, time_steps, train_scaled.shape[0])
+            y_train = target_windows(train_scaled, time_steps, train_scaled.shape[0])
 
         if use_returns:
             total_returns = pd.concat((training_returns, test_returns), axis=0)
             inputs = total_returns[len(total_returns) - len(test_returns) - time_steps:]
-            test_scaled = self._min_max.transform(inputs.to_frame())
+            test_scaled = self._transform(self._min_max, inputs.to_frame(), 'test_returns')
         elif use_deltas:
             total_data = pd.concat((training_data, test_data), axis=0)
-            total_close_scaled = self._input_scaler.transform(total_data)
+            total_close_scaled = self._transform(self._input_scaler, total_data, 'total_close')
             total_close_aligned = total_close_scaled[1:]
 
             total_deltas = pd.concat((training_deltas, test_deltas), axis=0)
-            total_deltas_scaled = self._min_max.transform(total_deltas.to_frame())
+            total_deltas_scaled = self._transform(self._min_max, total_deltas.to_frame(), 'total_deltas')
 
             test_start = len(training_deltas)
             inputs_x = total_close_aligned
             inputs_y = total_deltas_scaled
         elif use_trend_residual:
             total_data = pd.concat((training_data, test_data), axis=0)
-            total_close_scaled = self._input_scaler.transform(total_data)
+            total_close_scaled = self._transform(self._input_scaler, total_data, 'total_close')
             total_close_aligned = total_close_scaled[1:]
 
             total_residuals = pd.concat((training_residuals, test_residuals), axis=0)
-            total_residuals_scaled = self._min_max.transform(total_residuals.to_frame())
+            total_residuals_scaled = self._transform(self._min_max, total_residuals.to_frame(), 'total_residuals')
 
             test_start = len(training_residuals)
             inputs_x = total_close_aligned
@@ -186,34 +269,27 @@ class StockData:
         else:
             total_data = pd.concat((training_data, test_data), axis=0)
             inputs = total_data[len(total_data) - len(test_data) - time_steps:]
-            test_scaled = self._min_max.transform(inputs)
+            test_scaled = self._transform(self._min_max, inputs, 'test_close')
 
         # Testing Data Transformation
-        x_test = []
-        y_test = []
-        if use_deltas:
-            for i in range(test_start, inputs_y.shape[0] - forecast_horizon + 1):
-                x_test.append(inputs_x[i - time_steps:i])
-                y_test.append(inputs_y[i:i + forecast_horizon, 0])
-        elif use_trend_residual:
-            for i in range(test_start, inputs_y.shape[0] - forecast_horizon + 1):
-                x_test.append(inputs_x[i - time_steps:i])
-                y_test.append(inputs_y[i:i + forecast_horizon, 0])
+        if use_deltas or use_trend_residual:
+            stop = inputs_y.shape[0] - forecast_horizon + 1
+            x_test = input_windows(inputs_x, time_steps, test_start, stop)
+            y_test = target_windows(inputs_y, test_start, stop, horizon=forecast_horizon)
         else:
-            for i in range(time_steps, test_scaled.shape[0]):
-                x_test.append(test_scaled[i - time_steps:i])
-                y_test.append(test_scaled[i, 0])
-
-        x_test, y_test = np.array(x_test), np.array(y_test)
-        x_test = np.reshape(x_test, (x_test.shape[0], x_test.shape[1], 1))
+            x_test = input_windows(test_scaled, time_steps, time_steps, test_scaled.shape[0])
+            y_test = target_windows(test_scaled, time_steps, test_scaled.shape[0])
+        print_window_memory('Training/test', [x_train, y_train, x_test, y_test])
         return (x_train, y_train), (x_test, y_test), (training_data, test_data)
 
     def prepare_delta_direction_data(self, time_steps, validation_date):
         end_date = datetime.today()
-        data = yf.download(self._stock.get_ticker(), start=self._stock.get_start_date(), end=end_date, progress=False, auto_adjust=False)[['Close']]
-        data = data.reset_index()
-        data = data.set_index('Date')
+        data = self.download_raw_data(end_date)
+        print_stage_memory('raw', [data])
+        params = {'time_steps': time_steps, 'validation_date': validation_date}
+        return self._cached_features('delta_direction', data, params, lambda: self._delta_direction_data(data, time_steps, validation_date))
 
+    def _delta_direction_data(self, data, time_steps, validation_date):
         training_data = data[data.index < validation_date].copy()
         test_data = data[data.index >= validation_date].copy()
 
@@ -222,45 +298,31 @@ class StockData:
         training_deltas = deltas[deltas.index < validation_date]
         test_deltas = deltas[deltas.index >= validation_date]
 
-        close_scaled_train = self._input_scaler.fit_transform(training_data)
-        close_scaled_all = self._input_scaler.transform(pd.concat((training_data, test_data), axis=0))
+        if not self._is_frozen(self._input_scaler):
+            self._input_scaler.fit(training_data)
+        close_scaled_all = self._transform(self._input_scaler, pd.concat((training_data, test_data), axis=0), 'total_close')
         close_scaled_aligned = close_scaled_all[1:]
 
         magnitude = training_deltas.abs()
-        mag_scaled = self._min_max.fit_transform(self._ensure_frame(magnitude))
+        mag_scaled = self._fit_transform(self._min_max, self._ensure_frame(magnitude), 'train_magnitude')
 
         total_magnitude = pd.concat((training_deltas.abs(), test_deltas.abs()), axis=0)
-        total_mag_scaled = self._min_max.transform(self._ensure_frame(total_magnitude))
-
-        direction = (training_deltas > 0).astype(np.float32)
-        total_direction = (pd.concat((training_deltas, test_deltas), axis=0) > 0).astype(np.float32)
-
-        x_train = []
-        y_dir_train = []
-        y_mag_train = []
-        for i in range(time_steps, len(training_deltas)):
-            x_train.append(close_scaled_aligned[i - time_steps:i])
-            y_dir_train.append(direction.iloc[i])
-            y_mag_train.append(mag_scaled[i, 0])
-
-        x_test = []
-        y_dir_test = []
-        y_mag_test = []
-        test_start = len(training_deltas)
-        for i in range(test_start, len(total_magnitude)):
-            x_test.append(close_scaled_aligned[i - time_steps:i])
-            y_dir_test.append(total_direction.iloc[i])
-            y_mag_test.append(total_mag_scaled[i, 0])
+        total_mag_scaled = self._transform(self._min_max, self._ensure_frame(total_magnitude), 'total_magnitude')
 
-        x_train = np.array(x_train)
-        y_dir_train = np.array(y_dir_train)
-        y_mag_train = np.array(y_mag_train)
-        x_test = np.array(x_test)
-        y_dir_test = np.array(y_dir_test)
-        y_mag_test = np.array(y_mag_test)
+        direction = (training_deltas > 0).astype(self._dtype)
+        total_direction = (pd.concat((training_deltas, test_deltas), axis=0) > 0).astype(self._dtype)
 
-        x_train = np.reshape(x_train, (x_train.shape[0], x_train.shape[1], 1))
-        x_test = np.reshape(x_test, (x_test.shape[0], x_test.shape[1], 1))
+        test_start = len(training_deltas)
+        direction_values = direction.to_numpy()
+        total_direction_values = total_direction.to_numpy()
+        x_train = input_windows(close_scaled_aligned, time_steps, time_steps, len(training_deltas))
+        y_dir_train = target_windows(direction_values, time_steps, len(training_deltas))
+        y_mag_train = target_windows(mag_scaled, time_steps, len(training_deltas))
+
+        x_test = input_windows(close_scaled_aligned, time_steps, test_start, len(total_magnitude))
+        y_dir_test = target_windows(total_direction_values, test_start, len(total_magnitude))
+        y_mag_test = target_windows(total_mag_scaled, test_start, len(total_magnitude))
+        print_window_memory('Direction/magnitude', [x_train, y_dir_train, y_mag_train, x_test, y_dir_test, y_mag_test])
 
         return (x_train, y_dir_train, y_mag_train), (x_test, y_dir_test, y_mag_test), (training_data, test_data)
 
@@ -299,18 +361,7 @@ class StockData:
         test_data = pd.DataFrame({'Date': x_future, 'Close': y_future})
         test_data = test_data.set_index('Date')
 
-        test_scaled = min_max.fit_transform(test_data)
-        x_test = []
-        y_test = []
-        #print(test_scaled.shape[0])
-        for i in range(time_steps, test_scaled.shape[0]):
-            x_test.append(test_scaled[i - time_steps:i])
-            y_test.append(test_scaled[i, 0])
-            #print(i - time_steps)
-
-        x_test, y_test = np.array(x_test), np.array(y_test)
-        x_test = np.reshape(x_test, (x_test.shape[0], x_test.shape[1], 1))
+        test_scaled = np.ascontiguousarray(min_max.fit_transform(test_data), dtype=self._dtype)
+        x_test = input_windows(test_scaled, time_steps, time_steps, test_scaled.shape[0])
+        y_test = target_windows(test_scaled, time_steps, test_scaled.shape[0])
         return x_test, y_test, test_data
-
-
-
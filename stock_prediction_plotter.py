@@ -13,59 +13,190 @@
 # limitations under the License.
 # ==============================================================================
 import os
+import pickle
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait
+
 import pandas as pd
-import matplotlib.pyplot as plt
+
+# interactive: draw with pyplot and show the windows, as before
+# background: write the plot data and render the PNGs in a worker process, never blocks
+# none: no plots, matplotlib is never imported
+PLOT_MODES = ('interactive', 'background', 'none')
+
+_RENDER_POOL = None
+
+
+def _draw_price_split(figure, data):
+    axes = figure.subplots()
+    axes.plot(data['training_close'], color='green')
+    axes.plot(data['test_close'], color='red')
+    axes.set_ylabel('Price [' + data['currency'] + ']')
+    axes.set_xlabel("Date")
+    axes.legend(["Training Data", "Validation Data >= " + data['validation_date'].strftime("%Y-%m-%d")])
+    axes.set_title(data['short_name'])
+
+
+def _draw_histogram(figure, data):
+    axes = figure.subplots()
+    data['training_data'].hist(ax=axes)
+
+
+def _draw_history(figure, data):
+    axes = figure.subplots()
+    axes.plot(data['values'], label=data['label'])
+    axes.plot(data['val_values'], label='val_' + data['label'])
+    axes.set_xlabel('Epoch')
+    axes.set_ylabel(data['ylabel'])
+    axes.set_title(data['title'])
+    axes.legend(loc='upper right')
+
+
+def _draw_predictions(figure, data):
+    axes = figure.subplots()
+    axes.plot(data['predicted'], color='red', label='Predicted [' + data['short_name'] + '] price')
+    axes.plot(data['actual'], color='green', label='Actual [' + data['short_name'] + '] price')
+    axes.set_xlabel('Time')
+    axes.set_ylabel('Price [' + data['currency'] + ']')
+    axes.legend()
+    axes.set_title('Prediction')
+
+
+def _draw_forecast(figure, data):
+    axes = figure.subplots()
+    forecast_df = data['forecast']
+    history = data['history']
+    in_sample = data['in_sample']
+    stochastic_paths = data['stochastic_paths']
+    axes.plot(history.index, history, color='green', label='Actual [' + data['ticker'] + '] price')
+    if in_sample is not None and not in_sample.empty:
+        axes.plot(in_sample.index, in_sample.iloc[:, 0], color='orange', label='In-sample [' + data['ticker'] + '] predicted')
+    if stochastic_paths is not None and len(stochastic_paths) > 0:
+        max_paths = min(len(stochastic_paths), 20)
+        for idx in range(max_paths):
+            axes.plot(
+                forecast_df.index,
+                stochastic_paths[idx],
+                color='gray',
+                alpha=0.2,
+                linewidth=1,
+                label='Stochastic paths' if idx == 0 else None,
+            )
+        if {'Predicted_Price_P10', 'Predicted_Price_P90'}.issubset(forecast_df.columns):
+            axes.fill_between(
+                forecast_df.index,
+                forecast_df['Predicted_Price_P10'],
+                forecast_df['Predicted_Price_P90'],
+                color='gray',
+                alpha=0.15,
+                label='P10-P90 band',
+            )
+    axes.plot(forecast_df.index, forecast_df['Predicted_Price'], color='red', label='Predicted [' + data['ticker'] + '] price')
+    axes.set_xlabel('Time')
+    axes.set_ylabel('Price [USD]')
+    axes.legend()
+    axes.set_title('Actual vs Predicted Prices')
+
+
+_RENDERERS = {
+    'price_split': _draw_price_split,
+    'histogram': _draw_histogram,
+    'history': _draw_history,
+    'predictions': _draw_predictions,
+    'forecast': _draw_forecast,
+}
+
+
+def _init_render_worker():
+    os.environ['MPLBACKEND'] = 'Agg'
+
+
+def render_plot(data_path):
+    # runs in the render worker: a bare Figure needs no GUI and no pyplot state
+    from matplotlib.figure import Figure
+    with open(data_path, 'rb') as data_file:
+        plot = pickle.load(data_file)
+    figure = Figure(figsize=plot['figsize'])
+    _RENDERERS[plot['kind']](figure, plot['data'])
+    figure.savefig(plot['path'])
+    return plot['path']
+
+
+def _render_pool(workers=1):
+    global _RENDER_POOL
+    if _RENDER_POOL is None:
+        _RENDER_POOL = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=_init_render_worker)
+    return _RENDER_POOL
 
 
 class Plotter:
-    def __init__(self, blocking, project_folder, short_name, currency, stock_ticker):
+    def __init__(self, blocking, project_folder, short_name, currency, stock_ticker, mode='interactive'):
         self.blocking = blocking
         self.project_folder = project_folder
         self.short_name = short_name
         self.currency = currency
         self.stock_ticker = stock_ticker
+        self.mode = mode
+        self._pending = []
 
-    def plot_histogram_data_split(self, training_data, test_data, validation_date):
-        print("plotting Data and Histogram")
-        plt.figure(figsize=(12, 5))
-        plt.plot(training_data.Close, color='green')
-        plt.plot(test_data.Close, color='red')
-        plt.ylabel('Price [' + self.currency + ']')
-        plt.xlabel("Date")
-        plt.legend(["Training Data", "Validation Data >= " + validation_date.strftime("%Y-%m-%d")])
-        plt.title(self.short_name)
-        plt.savefig(os.path.join(self.project_folder, self.short_name.strip().replace('.', '') + '_price.png'))
-
-        fig, ax = plt.subplots()
-        training_data.hist(ax=ax)
-        fig.savefig(os.path.join(self.project_folder, self.short_name.strip().replace('.', '') + '_hist.png'))
-
+    def _plot(self, kind, file_name, data, figsize=None):
+        path = os.path.join(self.project_folder, file_name)
+        if self.mode == 'none':
+            return
+        if self.mode == 'background':
+            data_folder = os.path.join(self.project_folder, 'plot_data')
+            os.makedirs(data_folder, exist_ok=True)
+            data_path = os.path.join(data_folder, os.path.splitext(file_name)[0] + '.pkl')
+            with open(data_path, 'wb') as data_file:
+                pickle.dump({'kind': kind, 'path': path, 'figsize': figsize, 'data': data}, data_file)
+            self._pending.append(_render_pool().submit(render_plot, data_path))
+            return
+        import matplotlib.pyplot as plt
+        figure = plt.figure(figsize=figsize)
+        _RENDERERS[kind](figure, data)
+        figure.savefig(path)
         plt.pause(0.001)
         plt.show(block=self.blocking)
 
+    def wait(self):
+        # blocks until the background renders are written, a failed render is reported, not raised
+        done, _ = wait(self._pending)
+        for future in done:
+            if future.exception() is not None:
+                print('Plot rendering failed: ' + str(future.exception()))
+        self._pending = []
+
+    def plot_histogram_data_split(self, training_data, test_data, validation_date):
+        print("plotting Data and Histogram")
+        file_prefix = self.short_name.strip().replace('.', '')
+        self._plot('price_split', file_prefix + '_price.png', {
+            'training_close': training_data.Close,
+            'test_close': test_data.Close,
+            'currency': self.currency,
+            'validation_date': validation_date,
+            'short_name': self.short_name,
+        }, figsize=(12, 5))
+        self._plot('histogram', file_prefix + '_hist.png', {'training_data': training_data})
+
     def plot_loss(self, history):
         print("plotting loss")
-        plt.plot(history.history['loss'], label='loss')
-        plt.plot(history.history['val_loss'], label='val_loss')
-        plt.xlabel('Epoch')
-        plt.ylabel('Loss')
-        plt.title('Loss/Validation Loss')
-        plt.legend(loc='upper right')
-        plt.savefig(os.path.join(self.project_folder, 'loss.png'))
-        plt.pause(0.001)
-        plt.show(block=self.blocking)
+        self._plot('history', 'loss.png', {
+            'values': history.history['loss'],
+            'val_values': history.history['val_loss'],
+            'label': 'loss',
+            'ylabel': 'Loss',
+            'title': 'Loss/Validation Loss',
+        })
 
-    def plot_mse(self, history):
+    def plot_mse(self, history, metric='MSE'):
         print("plotting MSE")
-        plt.plot(history.history['MSE'], label='MSE')
-        plt.plot(history.history['val_MSE'], label='val_MSE')
-        plt.xlabel('Epoch')
-        plt.ylabel('MSE')
-        plt.title('MSE/Validation MSE')
-        plt.legend(loc='upper right')
-        plt.savefig(os.path.join(self.project_folder, 'MSE.png'))
-        plt.pause(0.001)
-        plt.show(block=self.blocking)
+        self._plot('history', 'MSE.png', {
+            'values': history.history[metric],
+            'val_values': history.history['val_' + metric],
+            'label': 'MSE',
+            'ylabel': 'MSE',
+            'title': 'MSE/Validation MSE',
+        })
 
     def project_plot_predictions(self, price_predicted, test_data):
         print("plotting predictions")
@@ -74,13 +205,19 @@ class Plotter:
         if isinstance(actual_values, pd.DataFrame):
             actual_values = actual_values.iloc[:, 0]
         actual_series = pd.to_numeric(actual_values, errors='coerce')
-        plt.figure(figsize=(14, 5))
-        plt.plot(predicted_series.to_numpy(), color='red', label='Predicted [' + self.short_name + '] price')
-        plt.plot(actual_series.to_numpy(), color='green', label='Actual [' + self.short_name + '] price')
-        plt.xlabel('Time')
-        plt.ylabel('Price [' + self.currency + ']')
-        plt.legend()
-        plt.title('Prediction')
-        plt.savefig(os.path.join(self.project_folder, self.short_name.strip().replace('.', '') + '_prediction.png'))
-        plt.pause(0.001)
-        plt.show(block=self.blocking)
+        self._plot('predictions', self.short_name.strip().replace('.', '') + '_prediction.png', {
+            'predicted': predicted_series.to_numpy(),
+            'actual': actual_series.to_numpy(),
+            'short_name': self.short_name,
+            'currency': self.currency,
+        }, figsize=(14, 5))
+
+    def plot_forecast(self, history, in_sample, forecast_df, stochastic_paths):
+        print("plotting forecast")
+        self._plot('forecast', self.stock_ticker + '_future_forecast.png', {
+            'history': history,
+            'in_sample': in_sample,
+            'forecast': forecast_df,
+            'stochastic_paths': stochastic_paths,
+            'ticker': self.stock_ticker,
+        }, figsize=(14, 5))
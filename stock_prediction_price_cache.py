@@ -0,0 +1,221 @@
+# Copyright 2020-2026 Jordi Corbilla. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import io
+import os
+import json
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from stock_prediction_data_provider import ProviderError, YahooFinanceProvider, normalise_price_frame
+from stock_prediction_file_lock import file_lock, tmp_path_for
+
+
+# Columnar price store: <cache_folder>/<provider>/<interval>/<ticker>/<column>.npy plus a Date.npy index,
+# so date-range reads only memory-map the slices they need. Writes and reads of a ticker hold its
+# folder lock, so processes sharing the cache never see a half-written column.
+class PriceCache:
+    def __init__(self, cache_folder=None, offline=False, provider=None):
+        if cache_folder is None:
+            cache_folder = os.path.join(os.getcwd(), 'price_cache')
+        self.cache_folder = cache_folder
+        self.offline = offline
+        self.provider = provider if provider is not None else YahooFinanceProvider()
+
+    def _key_folder(self, ticker, interval):
+        safe_ticker = ticker.replace('/', '_').replace('\\', '_')
+        return os.path.join(self.cache_folder, self.provider.name, interval, safe_ticker)
+
+    def _load_meta(self, folder):
+        meta_path = os.path.join(folder, 'meta.json')
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, 'r', encoding='utf-8') as meta_file:
+            return json.load(meta_file)
+
+    def _save_meta(self, folder, meta):
+        meta_path = os.path.join(folder, 'meta.json')
+        tmp_path = tmp_path_for(meta_path)
+        with open(tmp_path, 'w', encoding='utf-8') as meta_file:
+            json.dump(meta, meta_file, indent=2)
+        os.replace(tmp_path, meta_path)
+
+    def _save_column(self, folder, name, values):
+        column_path = os.path.join(folder, name + '.npy')
+        tmp_path = tmp_path_for(column_path)
+        with open(tmp_path, 'wb') as column_file:
+            np.save(column_file, values)
+        os.replace(tmp_path, column_path)
+
+    def _write_frame(self, folder, meta, frame):
+        self._save_column(folder, 'Date', frame.index.to_numpy(dtype='datetime64[ns]'))
+        for name in frame.columns:
+            self._save_column(folder, name, frame[name].to_numpy(dtype=np.float64))
+        meta['columns'] = [str(name) for name in frame.columns]
+        meta['rows'] = int(len(frame))
+
+    def _write_tail(self, folder, name, start_row, values):
+        # overwrites the column from start_row on and grows it to start_row + len(values), writing
+        # only the new rows and the header; False when the column has to be rewritten whole
+        column_path = os.path.join(folder, name + '.npy')
+        with open(column_path, 'r+b') as column_file:
+            version = np.lib.format.read_magic(column_file)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(column_file)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(column_file)
+            data_offset = column_file.tell()
+            if dtype != values.dtype or fortran_order or len(shape) != 1 or start_row > shape[0]:
+                return False
+            header = io.BytesIO()
+            header_fields = {'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': False, 'shape': (start_row + len(values),)}
+            if version == (1, 0):
+                np.lib.format.write_array_header_1_0(header, header_fields)
+            else:
+                np.lib.format.write_array_header_2_0(header, header_fields)
+            if len(header.getvalue()) != data_offset:
+                return False
+            # rows first, header last: an interrupted write leaves the old shape over valid rows
+            column_file.seek(data_offset + start_row * dtype.itemsize)
+            column_file.write(np.ascontiguousarray(values).tobytes())
+            column_file.truncate()
+            column_file.seek(0)
+            column_file.write(header.getvalue())
+        return True
+
+    def _fetch(self, ticker, start, end, interval):
+        return normalise_price_frame(self.provider.download(ticker, start, end, interval))
+
+    def _read(self, folder, meta, start=None, end=None):
+        dates = np.load(os.path.join(folder, 'Date.npy'), mmap_mode='r')
+        # meta is written last, rows past its count belong to a write that did not finish
+        rows = min(len(dates), int(meta.get('rows', len(dates))))
+        lo = 0 if start is None else int(np.searchsorted(dates[:rows], np.datetime64(pd.Timestamp(start)), side='left'))
+        hi = rows if end is None else int(np.searchsorted(dates[:rows], np.datetime64(pd.Timestamp(end)), side='left'))
+        columns = {}
+        for name in meta['columns']:
+            values = np.load(os.path.join(folder, name + '.npy'), mmap_mode='r')
+            columns[name] = np.array(values[lo:hi])
+        if not columns:
+            columns['Close'] = np.empty(hi - lo, dtype=np.float64)
+        index = pd.DatetimeIndex(np.array(dates[lo:hi]), name='Date')
+        return pd.DataFrame(columns, index=index)
+
+    def read(self, ticker, start=None, end=None, interval='1d'):
+        folder = self._key_folder(ticker, interval)
+        if not os.path.isdir(folder):
+            return pd.DataFrame(columns=['Close'], index=pd.DatetimeIndex([], name='Date'))
+        with file_lock(folder):
+            meta = self._load_meta(folder)
+            if meta is None:
+                return pd.DataFrame(columns=['Close'], index=pd.DatetimeIndex([], name='Date'))
+            return self._read(folder, meta, start, end)
+
+    def _append_tail(self, folder, meta, frame):
+        # a frame that starts inside the cached range and covers every cached bar from there on (the
+        # usual refresh of the last bars) only rewrites that suffix, not the whole history
+        if len(frame) == 0 or [str(name) for name in frame.columns] != meta['columns']:
+            return False
+        dates = np.load(os.path.join(folder, 'Date.npy'), mmap_mode='r')
+        rows = min(len(dates), int(meta.get('rows', len(dates))))
+        first = np.datetime64(frame.index[0])
+        if rows == 0 or first <= dates[0]:
+            return False
+        start_row = int(np.searchsorted(dates[:rows], first, side='left'))
+        if not np.isin(np.array(dates[start_row:rows]), frame.index.to_numpy(dtype='datetime64[ns]')).all():
+            return False
+        if not self._write_tail(folder, 'Date', start_row, frame.index.to_numpy(dtype='datetime64[ns]')):
+            return False
+        for name in frame.columns:
+            if not self._write_tail(folder, name, start_row, frame[name].to_numpy(dtype=np.float64)):
+                return False
+        meta['rows'] = start_row + len(frame)
+        return True
+
+    def append(self, ticker, frame, interval='1d', fetched_from=None, fetched_until=None):
+        folder = self._key_folder(ticker, interval)
+        os.makedirs(folder, exist_ok=True)
+        frame = normalise_price_frame(frame)
+        frame = frame[~frame.index.duplicated(keep='last')].sort_index()
+        with file_lock(folder):
+            # the meta is re-read under the lock, another process may have appended since update read it
+            meta = self._load_meta(folder)
+            if meta is None:
+                meta = {}
+                self._write_frame(folder, meta, frame)
+            elif not self._append_tail(folder, meta, frame):
+                cached = self._read(folder, meta)
+                frame = pd.concat([cached, frame], axis=0)
+                frame = frame[~frame.index.duplicated(keep='last')].sort_index()
+                self._write_frame(folder, meta, frame)
+
+            if fetched_from is not None:
+                previous = meta.get('fetched_from')
+                fetched_from = pd.Timestamp(fetched_from)
+                if previous is not None:
+                    fetched_from = min(fetched_from, pd.Timestamp(previous))
+                meta['fetched_from'] = fetched_from.strftime("%Y-%m-%d %H:%M:%S")
+            if fetched_until is not None:
+                previous = meta.get('fetched_until')
+                fetched_until = pd.Timestamp(fetched_until)
+                if previous is not None:
+                    fetched_until = max(fetched_until, pd.Timestamp(previous))
+                meta['fetched_until'] = fetched_until.strftime("%Y-%m-%d %H:%M:%S")
+            self._save_meta(folder, meta)
+
+    def update(self, ticker, start, end=None, interval='1d'):
+        if end is None:
+            end = datetime.today()
+        start = pd.Timestamp(start)
+        end = pd.Timestamp(end)
+        if self.offline:
+            return
+        folder = self._key_folder(ticker, interval)
+        meta = self._load_meta(folder)
+        if meta is None:
+            print('Price cache: downloading ' + ticker + ' ' + interval + ' bars from ' + start.strftime("%Y-%m-%d"))
+            self.append(ticker, self._fetch(ticker, start, end, interval), interval, fetched_from=start, fetched_until=end)
+            return
+
+        fetched_from = pd.Timestamp(meta['fetched_from'])
+        fetched_until = pd.Timestamp(meta['fetched_until'])
+        if start < fetched_from:
+            print('Price cache: back-filling ' + ticker + ' from ' + start.strftime("%Y-%m-%d"))
+            self.append(ticker, self._fetch(ticker, start, fetched_from, interval), interval, fetched_from=start)
+        if end > fetched_until:
+            dates = np.load(os.path.join(folder, 'Date.npy'), mmap_mode='r')
+            rows = min(len(dates), int(meta.get('rows', len(dates))))
+            tail_start = fetched_until
+            if rows > 0:
+                # refetch from the last cached bar itself: it may have been stored while still
+                # in progress, and append keeps the newly fetched version of it
+                tail_start = min(tail_start, pd.Timestamp(dates[rows - 1]))
+            print('Price cache: appending ' + ticker + ' from ' + tail_start.strftime("%Y-%m-%d"))
+            self.append(ticker, self._fetch(ticker, tail_start, end, interval), interval, fetched_until=end)
+
+    def get(self, ticker, start, end=None, interval='1d'):
+        if end is None:
+            end = datetime.today()
+        if not self.provider.cacheable:
+            return self._fetch(ticker, pd.Timestamp(start), pd.Timestamp(end), interval)
+        if self.offline and self._load_meta(self._key_folder(ticker, interval)) is None:
+            print('Warning: offline and no cached ' + interval + ' bars for ' + ticker)
+        try:
+            self.update(ticker, start, end, interval)
+        except (ProviderError, OSError) as error:
+            # network and provider failures fall back to the cache, anything else is a bug
+            print('Warning: price download failed for ' + ticker + ', using cached data. ' + str(error))
+        return self.read(ticker, start, end, interval)
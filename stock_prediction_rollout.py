@@ -0,0 +1,181 @@
+# Copyright 2020-2026 Jordi Corbilla. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import copy
+
+import numpy as np
+import tensorflow as tf
+
+
+# layers that only look at the current timestep, or carry state across them
+STEPPABLE_LAYERS = ('InputLayer', 'LSTM', 'GRU', 'SimpleRNN', 'Dropout', 'Dense')
+
+
+def scaler_affine(scaler):
+    # a fitted MinMaxScaler transforms x into x * scale_ + min_
+    if not hasattr(scaler, 'scale_') or not hasattr(scaler, 'min_'):
+        raise ValueError('Graph rollout needs fitted MinMaxScaler scalers, got ' + type(scaler).__name__)
+    return float(scaler.scale_[0]), float(scaler.min_[0])
+
+
+def to_stateful(model, batch_size=1):
+    # the trained architecture with stateful recurrent layers, a fixed batch and any number of
+    # timesteps per call, carrying the trained weights
+    config = copy.deepcopy(model.get_config())
+    config.pop('build_input_shape', None)
+    class_names = [layer['class_name'] for layer in config['layers']]
+    if 'InputLayer' not in class_names or any(name not in STEPPABLE_LAYERS for name in class_names):
+        raise ValueError('Stateful inference needs a recurrent model with an input layer, got ' + ', '.join(class_names))
+    for layer in config['layers']:
+        # the saved build shapes have a dynamic batch, which stateful layers do not accept
+        layer.pop('build_config', None)
+        if layer['class_name'] == 'InputLayer':
+            layer['config']['batch_shape'] = [batch_size, None] + list(layer['config']['batch_shape'][2:])
+        elif layer['class_name'] in ('LSTM', 'GRU', 'SimpleRNN'):
+            layer['config']['stateful'] = True
+    stateful = model.__class__.from_config(config)
+    stateful.set_weights(model.get_weights())
+    return stateful
+
+
+def reset_states(models):
+    for model in models.values():
+        for layer in model.layers:
+            if getattr(layer, 'stateful', False):
+                layer.reset_state()
+
+
+# Rolls a forecast forward autoregressively inside one tf.function: every model call, the inverse
+# scaling of its output, the v7/v8 direction and magnitude clipping, the delta/trend-residual close
+# accumulation and the re-scaling of the value fed back into the window stay in the graph, so a
+# whole horizon is one graph invocation instead of one or two predict calls per step. It follows
+# the per-step loop of InferenceRunner exactly. Windows are batched: every row of the batch is
+# rolled forward independently, which is how Monte Carlo paths share one model call per step.
+class GraphRollout:
+    def __init__(self, models, model_version, scaler, input_scaler=None, use_deltas=False, use_trend_residual=False,
+                 forecast_horizon=1, direction_threshold=0.5, mag_clip_value=None, mc_dropout=False):
+        self.models = models
+        self.model_version = model_version
+        self.dual_head = model_version in ('v7', 'v8')
+        # v5/v6 emit up to forecast_horizon steps per call, all fed back before the next call
+        self.per_call = 1
+        if model_version in ('v5', 'v6'):
+            self.per_call = max(1, min(forecast_horizon, int(models['model'].output_shape[-1])))
+        # deltas and trend residuals are accumulated on the close, which is re-scaled with the input scaler
+        self.feedback_close = use_deltas or use_trend_residual
+        self.scale, self.offset = scaler_affine(scaler)
+        if self.feedback_close:
+            self.input_scale, self.input_offset = scaler_affine(input_scaler)
+        self.direction_threshold = direction_threshold
+        self.mag_clip_value = mag_clip_value
+        # MC dropout: the dropout layers stay active, every row of the batch draws its own masks
+        self.mc_dropout = mc_dropout
+        self._compiled = tf.function(self._rollout)
+
+    def _predict(self, window):
+        # the next per_call values in price units (float64) and the scaled outputs they came from
+        if self.dual_head:
+            if 'direction' in self.models:
+                direction = self.models['direction'](window, training=self.mc_dropout)
+                magnitude = self.models['magnitude'](window, training=self.mc_dropout)
+            else:
+                direction, magnitude = self.models['model'](window, training=self.mc_dropout)
+            magnitude_value = (tf.cast(magnitude, tf.float64) - self.offset) / self.scale
+            if self.mag_clip_value is not None:
+                magnitude_value = tf.minimum(magnitude_value, self.mag_clip_value)
+            values = tf.where(direction >= self.direction_threshold, magnitude_value, -magnitude_value)
+            return values, magnitude
+        scaled = self.models['model'](window, training=self.mc_dropout)[:, :self.per_call]
+        return (tf.cast(scaled, tf.float64) - self.offset) / self.scale, scaled
+
+    def _perturb(self, values, scaled, noise):
+        # Monte Carlo noise in price units, on both the recorded values and the ones fed back
+        return values + noise, scaled + tf.cast(noise * self.scale, scaled.dtype)
+
+    def _feedback(self, close, values, scaled):
+        # the per_call values fed back to the model, as scaled inputs of shape (batch, per_call, 1)
+        fed = []
+        for index in range(self.per_call):
+            if self.feedback_close:
+                close = close + values[:, index]
+                fed.append(tf.cast(close * self.input_scale + self.input_offset, tf.float32))
+            else:
+                fed.append(tf.cast(scaled[:, index], tf.float32))
+        return tf.expand_dims(tf.stack(fed, axis=1), -1), close
+
+    def _advance(self, window, fed):
+        # slide the window: drop the oldest steps and append the fed-back ones; the model sees the
+        # whole window again
+        window = tf.concat([window[:, self.per_call:, :], fed], axis=1)
+        return window, window
+
+    def _rollout(self, window, close, noise):
+        # noise is (calls, batch, per_call), zeros for a deterministic forecast
+        calls = tf.shape(noise)[0]
+        predictions = tf.TensorArray(tf.float64, size=calls)
+        values, scaled = self._perturb(*self._predict(window), noise[0])
+        predictions = predictions.write(0, values)
+        for call in tf.range(1, calls):
+            fed, close = self._feedback(close, values, scaled)
+            window, inputs = self._advance(window, fed)
+            values, scaled = self._perturb(*self._predict(inputs), noise[call])
+            predictions = predictions.write(call, values)
+        # (calls, batch, per_call) -> (batch, calls * per_call)
+        return tf.reshape(tf.transpose(predictions.stack(), [1, 0, 2]), (tf.shape(window)[0], -1))
+
+    def run(self, window, close, steps, noise=None):
+        # window (batch, time_steps, 1) scaled, close the last close of each row, noise (batch, steps)
+        # added to each predicted value before it is fed back; returns (batch, steps)
+        if steps <= 0:
+            return np.zeros((len(window), 0))
+        batch_size = len(window)
+        calls = -(-steps // self.per_call)
+        step_noise = np.zeros((batch_size, calls * self.per_call))
+        if noise is not None:
+            step_noise[:, :steps] = noise
+        step_noise = step_noise.reshape(batch_size, calls, self.per_call).transpose(1, 0, 2)
+        predictions = self._compiled(
+            tf.constant(np.asarray(window, dtype=np.float32)),
+            tf.constant(np.broadcast_to(np.asarray(close, dtype=np.float64), (batch_size,))),
+            tf.constant(step_noise),
+        )
+        return predictions.numpy()[:, :steps]
+
+
+# Same rollout with the hidden state carried between steps: the first call runs the history window
+# through stateful copies of the models, every later call feeds only the per_call new values. Per-step
+# cost no longer grows with time_steps. The first prediction is identical to the windowed one; later
+# ones see the whole history since the warm-up window instead of a window of time_steps values.
+class StatefulRollout(GraphRollout):
+    def __init__(self, models, model_version, scaler, **kwargs):
+        super().__init__(models, model_version, scaler, **kwargs)
+        self.trained_models = models
+        # stateful layers have a fixed batch size, one set of models and one graph per batch size
+        self._per_batch = {}
+        self._use_batch(1)
+
+    def _use_batch(self, batch_size):
+        if batch_size not in self._per_batch:
+            stateful_models = {name: to_stateful(model, batch_size) for name, model in self.trained_models.items()}
+            self._per_batch[batch_size] = (stateful_models, tf.function(self._rollout))
+        self.models, self._compiled = self._per_batch[batch_size]
+
+    def _advance(self, window, fed):
+        # the hidden state already holds everything seen so far, only the new steps are fed
+        return window, fed
+
+    def run(self, window, close, steps, noise=None):
+        self._use_batch(len(window))
+        reset_states(self.models)
+        return super().run(window, close, steps, noise)
@@ -0,0 +1,512 @@
+# Copyright 2020-2026 Jordi Corbilla. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import os
+import json
+import math
+import time
+import random
+import sqlite3
+import argparse
+import itertools
+import traceback
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+
+from stock_prediction_class import StockPrediction
+from stock_prediction_data_provider import FrameProvider, create_provider
+from stock_prediction_deep_learning import build_models, get_data_modes, load_training_data, model_file_name, select_targets
+from stock_prediction_feature_store import FeatureStore
+from stock_prediction_lstm import LongShortTermMemory
+from stock_prediction_numpy import StockData
+from stock_prediction_universe_training import split_threads, _init_worker
+
+SEARCH_PARAMETERS = ('model_version', 'time_steps', 'batch_size', 'trend_window', 'forecast_horizon')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sweeps (
+    sweep_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    created_at TEXT,
+    ticker TEXT,
+    strategy TEXT,
+    config TEXT
+);
+CREATE TABLE IF NOT EXISTS trials (
+    trial_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    sweep_id INTEGER REFERENCES sweeps(sweep_id),
+    model_version TEXT,
+    time_steps INTEGER,
+    batch_size INTEGER,
+    trend_window INTEGER,
+    forecast_horizon INTEGER,
+    status TEXT,
+    rung INTEGER,
+    epochs_run INTEGER,
+    best_val_loss REAL,
+    seconds REAL,
+    run_folder TEXT,
+    error TEXT,
+    updated_at TEXT
+);
+CREATE TABLE IF NOT EXISTS epochs (
+    trial_id INTEGER REFERENCES trials(trial_id),
+    stage TEXT,
+    epoch INTEGER,
+    loss REAL,
+    val_loss REAL,
+    PRIMARY KEY (trial_id, stage, epoch)
+);
+"""
+
+
+def effective_params(params):
+    # trend_window only changes v6 and forecast_horizon only v5/v6, drop them elsewhere so the same
+    # model is not trained twice under different names
+    params = dict(params)
+    _, use_trend_residual = get_data_modes(params['model_version'])
+    if not use_trend_residual:
+        params['trend_window'] = None
+    if params['model_version'] not in ('v5', 'v6'):
+        params['forecast_horizon'] = None
+    return params
+
+
+def grid_trials(space):
+    trials = []
+    for values in itertools.product(*(space[name] for name in SEARCH_PARAMETERS)):
+        params = effective_params(dict(zip(SEARCH_PARAMETERS, values)))
+        if params not in trials:
+            trials.append(params)
+    return trials
+
+
+def random_trials(space, n_trials, seed=None):
+    trials = grid_trials(space)
+    random.Random(seed).shuffle(trials)
+    return trials[:n_trials]
+
+
+class SweepDatabase:
+    # Every process opens its own connection, WAL lets the workers write while others read.
+    def __init__(self, path=None):
+        if path is None:
+            path = os.path.join(os.getcwd(), 'sweeps', 'sweeps.db')
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.path = path
+        with self._connect() as connection:
+            connection.executescript(_SCHEMA)
+
+    @contextlib.contextmanager
+    def _connect(self):
+        connection = sqlite3.connect(self.path, timeout=60)
+        try:
+            connection.execute('PRAGMA journal_mode=WAL')
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def create_sweep(self, ticker, strategy, config):
+        with self._connect() as connection:
+            cursor = connection.execute(
+                'INSERT INTO sweeps (created_at, ticker, strategy, config) VALUES (?, ?, ?, ?)',
+                (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), ticker, strategy, json.dumps(config, default=str)),
+            )
+            return cursor.lastrowid
+
+    def add_trial(self, sweep_id, params):
+        with self._connect() as connection:
+            cursor = connection.execute(
+                'INSERT INTO trials (sweep_id, model_version, time_steps, batch_size, trend_window, forecast_horizon, status, rung, epochs_run, updated_at) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (sweep_id, params['model_version'], params['time_steps'], params['batch_size'], params['trend_window'], params['forecast_horizon'],
+                 'queued', 0, 0, datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+            )
+            return cursor.lastrowid
+
+    def update_trial(self, trial_id, **fields):
+        fields['updated_at'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        assignments = ', '.join(name + ' = ?' for name in fields)
+        with self._connect() as connection:
+            connection.execute('UPDATE trials SET ' + assignments + ' WHERE trial_id = ?', tuple(fields.values()) + (trial_id,))
+
+    def log_epoch(self, trial_id, stage, epoch, loss, val_loss):
+        with self._connect() as connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO epochs (trial_id, stage, epoch, loss, val_loss) VALUES (?, ?, ?, ?, ?)',
+                (trial_id, stage, epoch, loss, val_loss),
+            )
+
+    def stage_best(self, trial_id, stage):
+        with self._connect() as connection:
+            row = connection.execute('SELECT MIN(val_loss) FROM epochs WHERE trial_id = ? AND stage = ?', (trial_id, stage)).fetchone()
+        return row[0]
+
+    def peer_val_losses(self, trial_id, stage, epoch):
+        # best val_loss up to this epoch of every other trial of the sweep with the same model
+        # version (losses of different versions are not comparable) that reached the epoch
+        with self._connect() as connection:
+            rows = connection.execute(
+                'SELECT MIN(e.val_loss) FROM epochs e JOIN trials t ON t.trial_id = e.trial_id '
+                'WHERE t.sweep_id = (SELECT sweep_id FROM trials WHERE trial_id = ?) '
+                'AND t.model_version = (SELECT model_version FROM trials WHERE trial_id = ?) '
+                'AND e.stage = ? AND e.epoch <= ? AND e.trial_id != ? '
+                'GROUP BY e.trial_id HAVING MAX(e.epoch) = ?',
+                (trial_id, trial_id, stage, epoch, trial_id, epoch),
+            ).fetchall()
+        return [row[0] for row in rows if row[0] is not None]
+
+    def trials(self, sweep_id):
+        with self._connect() as connection:
+            return pd.read_sql_query('SELECT * FROM trials WHERE sweep_id = ? ORDER BY best_val_loss IS NULL, best_val_loss', connection, params=(sweep_id,))
+
+    def query(self, sql, params=()):
+        with self._connect() as connection:
+            return pd.read_sql_query(sql, connection, params=params)
+
+
+class MedianPruner:
+    def __init__(self, grace_epochs=3, min_peers=3, percentile=50.0):
+        self.grace_epochs = grace_epochs
+        self.min_peers = min_peers
+        self.percentile = percentile
+
+    def should_prune(self, database, trial_id, stage, epoch, best_val_loss):
+        if epoch < self.grace_epochs:
+            return False
+        peers = database.peer_val_losses(trial_id, stage, epoch)
+        if len(peers) < self.min_peers:
+            return False
+        return best_val_loss > np.percentile(peers, self.percentile)
+
+
+class PruningCallback(tf.keras.callbacks.Callback):
+    def __init__(self, database, trial_id, stage, pruner=None):
+        super().__init__()
+        self.database = database
+        self.trial_id = trial_id
+        self.stage = stage
+        self.pruner = pruner
+        self.pruned = False
+
+    def on_epoch_end(self, epoch, logs=None):
+        logs = logs or {}
+        val_loss = logs.get('val_loss')
+        self.database.log_epoch(self.trial_id, self.stage, epoch + 1, logs.get('loss'), val_loss)
+        if self.pruner is None or val_loss is None:
+            return
+        best_val_loss = self.database.stage_best(self.trial_id, self.stage)
+        if best_val_loss is None:
+            # every val_loss so far was NaN, stored as NULL
+            return
+        if self.pruner.should_prune(self.database, self.trial_id, self.stage, epoch + 1, best_val_loss):
+            print('Pruning trial ' + str(self.trial_id) + ' at epoch ' + str(epoch + 1) + ', val_loss ' + f"{best_val_loss:.6f}")
+            self.pruned = True
+            self.model.stop_training = True
+
+
+def _trial_stock(task, project_folder, params):
+    return StockPrediction(
+        task['ticker'],
+        pd.to_datetime(task['start_date']),
+        pd.to_datetime(task['validation_date']),
+        project_folder,
+        '',
+        task['epochs'],
+        params['time_steps'],
+        os.path.basename(project_folder),
+        params['batch_size'],
+        task['interval'],
+    )
+
+
+def _trial_data(task, project_folder, params):
+    stock = _trial_stock(task, project_folder, params)
+    # the prices the parent downloaded once: workers never touch the provider or the price cache
+    provider = FrameProvider(task['close'].to_frame(task['ticker']), info={task['ticker']: task['info']})
+    data = StockData(stock, provider=provider, feature_store=FeatureStore(task['feature_store_folder']))
+    return load_training_data(
+        data, stock, params['model_version'],
+        forecast_horizon=params['forecast_horizon'] or 1,
+        trend_window=params['trend_window'] or 60,
+    )
+
+
+def _run_trial(task):
+    database = SweepDatabase(task['db_path'])
+    params = task['params']
+    trial_id = task['trial_id']
+    trial_folder = task['trial_folder']
+    os.makedirs(trial_folder, exist_ok=True)
+    pruner = MedianPruner(**task['pruner']) if task['pruner'] is not None else None
+    database.update_trial(trial_id, status='running', rung=task['rung'], run_folder=trial_folder)
+    result = {'trial_id': trial_id, 'status': 'failed', 'epochs_run': 0, 'best_val_loss': None, 'error': None}
+    started = time.perf_counter()
+    with open(os.path.join(trial_folder, 'trial.log'), 'a', encoding='utf-8') as log_file:
+        with contextlib.redirect_stdout(log_file), contextlib.redirect_stderr(log_file):
+            try:
+                # same prices as the parent, so the fingerprint matches and the feature store entry it
+                # filled is only mapped here
+                (x_train, y_train), (x_test, y_test), _ = _trial_data(task, trial_folder, params)
+                lstm = LongShortTermMemory(trial_folder)
+                best_val_loss = 0.0
+                pruned = False
+                for name, model, callbacks_version, target in build_models(lstm, params['model_version'], x_train, params['forecast_horizon'] or 1):
+                    model_path = os.path.join(trial_folder, model_file_name(name))
+                    if task['initial_epoch'] > 0 and os.path.exists(model_path):
+                        # successive halving continues the model of the previous rung
+                        model = tf.keras.models.load_model(model_path)
+                    callback = PruningCallback(database, trial_id, name, pruner)
+                    history = model.fit(
+                        x_train,
+                        select_targets(y_train, target),
+                        epochs=task['epochs'],
+                        initial_epoch=task['initial_epoch'],
+                        batch_size=params['batch_size'],
+                        validation_data=(x_test, select_targets(y_test, target)),
+                        callbacks=lstm.get_callbacks(callbacks_version, stage=name, batch_size=params['batch_size'], samples=len(x_train)) + [callback],
+                        verbose=2,
+                    )
+                    model.save(model_path)
+                    result['epochs_run'] = max(result['epochs_run'], task['initial_epoch'] + len(history.history['loss']))
+                    stage_best = database.stage_best(trial_id, name)
+                    # NULL when every val_loss of the stage was NaN, the trial then has no score
+                    best_val_loss = None if stage_best is None or best_val_loss is None else best_val_loss + stage_best
+                    if callback.pruned:
+                        pruned = True
+                        break
+                result['status'] = 'pruned' if pruned else 'complete'
+                result['best_val_loss'] = float(best_val_loss) if best_val_loss is not None else None
+            except Exception as error:
+                result['error'] = str(error)
+                traceback.print_exc()
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    database.update_trial(
+        trial_id, status=result['status'], epochs_run=result['epochs_run'], best_val_loss=result['best_val_loss'],
+        seconds=result['seconds'], error=result['error'],
+    )
+    return result
+
+
+class SweepRunner:
+    def __init__(self, ticker, start_date, validation_date, interval='1d', data_provider='yahoo', db_path=None, sweep_folder=None,
+                 feature_store_folder=None, workers=2, cores=None):
+        self.ticker = ticker
+        self.start_date = start_date
+        self.validation_date = validation_date
+        self.interval = interval
+        self.data_provider = data_provider
+        self.sweep_folder = sweep_folder if sweep_folder is not None else os.path.join(os.getcwd(), 'sweeps')
+        self.database = SweepDatabase(db_path if db_path is not None else os.path.join(self.sweep_folder, 'sweeps.db'))
+        self.feature_store_folder = feature_store_folder if feature_store_folder is not None else os.path.join(os.getcwd(), 'feature_store')
+        self.workers, self.intra_op, self.inter_op = split_threads(workers, cores)
+        self._close = None
+        self._info = None
+
+    def _task(self, sweep_id, trial_id, params, epochs, initial_epoch=0, rung=0, pruner=None):
+        return {
+            'db_path': self.database.path,
+            'trial_id': trial_id,
+            'params': params,
+            'trial_folder': os.path.join(self.sweep_folder, 'sweep_' + str(sweep_id), 'trial_' + str(trial_id)),
+            'ticker': self.ticker,
+            'start_date': str(self.start_date),
+            'validation_date': str(self.validation_date),
+            'interval': self.interval,
+            'close': self._close,
+            'info': self._info,
+            'feature_store_folder': self.feature_store_folder,
+            'epochs': epochs,
+            'initial_epoch': initial_epoch,
+            'rung': rung,
+            'pruner': pruner,
+        }
+
+    def _download(self):
+        # one download for every trial, handed to the workers with their task
+        stock = StockPrediction(
+            self.ticker, pd.to_datetime(self.start_date), pd.to_datetime(self.validation_date), self.sweep_folder, '', 1, 1, '', 1,
+            self.interval,
+        )
+        data = StockData(stock, provider=create_provider(self.data_provider))
+        close = data.download_raw_data()['Close']
+        if isinstance(close, pd.DataFrame):
+            close = close.iloc[:, 0]
+        info = {'shortName': data.get_stock_short_name(), 'currency': data.get_stock_currency()}
+        return close.astype(np.float64), info
+
+    def _prepare_datasets(self, sweep_id, tasks):
+        # preprocess each distinct dataset once so every worker maps the same feature store entry
+        folder = os.path.join(self.sweep_folder, 'sweep_' + str(sweep_id))
+        os.makedirs(folder, exist_ok=True)
+        prepared = set()
+        for task in tasks:
+            params = task['params']
+            use_deltas, use_trend_residual = get_data_modes(params['model_version'])
+            key = (params['model_version'] in ('v7', 'v8'), use_deltas, use_trend_residual, params['time_steps'], params['trend_window'], params['forecast_horizon'])
+            if key not in prepared:
+                _trial_data(task, folder, params)
+                prepared.add(key)
+        print('Sweep ' + str(sweep_id) + ': ' + str(len(prepared)) + ' preprocessed datasets shared by ' + str(len(tasks)) + ' trials')
+
+    def _run_tasks(self, executor, tasks):
+        futures = {executor.submit(_run_trial, task): task['trial_id'] for task in tasks}
+        results = {}
+        for future in as_completed(futures):
+            trial_id = futures[future]
+            try:
+                results[trial_id] = future.result()
+            except Exception as error:
+                results[trial_id] = {'trial_id': trial_id, 'status': 'failed', 'best_val_loss': None, 'error': str(error)}
+                self.database.update_trial(trial_id, status='failed', error=str(error))
+            result = results[trial_id]
+            print('Trial ' + str(trial_id) + ': ' + result['status'] + ', best val_loss ' + str(result['best_val_loss']))
+        return results
+
+    def _executor(self):
+        # spawn, not fork: TensorFlow's runtime does not survive being forked
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_init_worker, initargs=(self.intra_op, self.inter_op))
+
+    def run(self, space, strategy='random', n_trials=10, epochs=30, min_epochs=3, eta=3, grace_epochs=3, min_peers=3, seed=None):
+        if strategy == 'grid':
+            trials = grid_trials(space)
+        else:
+            trials = random_trials(space, n_trials, seed)
+        config = {'space': space, 'n_trials': n_trials, 'epochs': epochs, 'min_epochs': min_epochs, 'eta': eta, 'grace_epochs': grace_epochs,
+                  'min_peers': min_peers, 'seed': seed, 'start_date': str(self.start_date), 'validation_date': str(self.validation_date), 'interval': self.interval}
+        sweep_id = self.database.create_sweep(self.ticker, strategy, config)
+        self._close, self._info = self._download()
+        trial_ids = [self.database.add_trial(sweep_id, params) for params in trials]
+        print('Sweep ' + str(sweep_id) + ': ' + strategy + ' search over ' + str(len(trials)) + ' trials on ' + str(self.workers) + ' workers')
+        started = time.perf_counter()
+        with self._executor() as executor:
+            if strategy == 'halving':
+                self._successive_halving(executor, sweep_id, list(zip(trial_ids, trials)), epochs, min_epochs, eta)
+            else:
+                pruner = {'grace_epochs': grace_epochs, 'min_peers': min_peers}
+                tasks = [self._task(sweep_id, trial_id, params, epochs, pruner=pruner) for trial_id, params in zip(trial_ids, trials)]
+                self._prepare_datasets(sweep_id, tasks)
+                self._run_tasks(executor, tasks)
+        print('Sweep ' + str(sweep_id) + ' finished in ' + f"{time.perf_counter() - started:.1f}" + 's')
+        leaderboard = self.database.trials(sweep_id)
+        print_leaderboard(leaderboard)
+        return sweep_id, leaderboard
+
+    def _successive_halving(self, executor, sweep_id, candidates, epochs, min_epochs, eta):
+        # Train every candidate for min_epochs, keep the best 1/eta of each model version, multiply the
+        # budget by eta and continue the survivors from where they stopped until epochs is reached.
+        budget = min(min_epochs, epochs)
+        initial_epoch = 0
+        rung = 0
+        prepared = False
+        while candidates:
+            tasks = [self._task(sweep_id, trial_id, params, budget, initial_epoch=initial_epoch, rung=rung) for trial_id, params in candidates]
+            if not prepared:
+                self._prepare_datasets(sweep_id, tasks)
+                prepared = True
+            print('Rung ' + str(rung) + ': ' + str(len(tasks)) + ' trials to epoch ' + str(budget))
+            results = self._run_tasks(executor, tasks)
+            if budget >= epochs:
+                break
+            survivors = []
+            versions = sorted({params['model_version'] for _, params in candidates})
+            for version in versions:
+                group = [(trial_id, params) for trial_id, params in candidates
+                         if params['model_version'] == version and results[trial_id]['best_val_loss'] is not None]
+                group.sort(key=lambda candidate: results[candidate[0]]['best_val_loss'])
+                keep = max(1, math.ceil(len(group) / eta)) if group else 0
+                survivors.extend(group[:keep])
+                for trial_id, _ in group[keep:]:
+                    self.database.update_trial(trial_id, status='pruned')
+            candidates = survivors
+            initial_epoch = budget
+            budget = min(budget * eta, epochs)
+            rung += 1
+
+
+def print_leaderboard(leaderboard, limit=10):
+    columns = ['trial_id'] + list(SEARCH_PARAMETERS) + ['status', 'epochs_run', 'best_val_loss', 'seconds']
+    print(leaderboard[columns].head(limit).to_string(index=False))
+
+
+def _parse_list(value, cast=str):
+    return [cast(item.strip()) for item in str(value).split(',') if item.strip()]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=("parsing arguments"))
+    parser.add_argument("-ticker", default="^FTSE")
+    parser.add_argument("-start_date", default="2017-11-01")
+    parser.add_argument("-validation_date", default="2021-09-01")
+    parser.add_argument("-interval", default="1d")
+    parser.add_argument("-data_provider", default="yahoo", choices=["yahoo", "replay", "synthetic"])
+    parser.add_argument("-strategy", default="random", choices=["grid", "random", "halving"])
+    parser.add_argument("-n_trials", default="10")
+    parser.add_argument("-model_version", default="v7,v8")
+    parser.add_argument("-time_steps", default="3,10,30")
+    parser.add_argument("-batch_size", default="10,32")
+    parser.add_argument("-trend_window", default="60")
+    parser.add_argument("-forecast_horizon", default="1")
+    parser.add_argument("-epochs", default="30")
+    parser.add_argument("-min_epochs", default="3")
+    parser.add_argument("-eta", default="3")
+    parser.add_argument("-grace_epochs", default="3")
+    parser.add_argument("-min_peers", default="3")
+    parser.add_argument("-workers", default="2")
+    parser.add_argument("-cores", default=None)
+    parser.add_argument("-seed", default="42")
+    parser.add_argument("-db", default=None)
+    parser.add_argument("-show", default=None)
+
+    args = parser.parse_args()
+
+    if args.show is not None:
+        # print a stored sweep without running anything
+        print_leaderboard(SweepDatabase(args.db).trials(int(args.show)), limit=None)
+    else:
+        SPACE = {
+            'model_version': _parse_list(args.model_version),
+            'time_steps': _parse_list(args.time_steps, int),
+            'batch_size': _parse_list(args.batch_size, int),
+            'trend_window': _parse_list(args.trend_window, int),
+            'forecast_horizon': _parse_list(args.forecast_horizon, int),
+        }
+        runner = SweepRunner(
+            args.ticker,
+            pd.to_datetime(args.start_date),
+            pd.to_datetime(args.validation_date),
+            interval=args.interval,
+            data_provider=args.data_provider,
+            db_path=args.db,
+            workers=int(args.workers),
+            cores=int(args.cores) if args.cores else None,
+        )
+        runner.run(
+            SPACE,
+            strategy=args.strategy,
+            n_trials=int(args.n_trials),
+            epochs=int(args.epochs),
+            min_epochs=int(args.min_epochs),
+            eta=int(args.eta),
+            grace_epochs=int(args.grace_epochs),
+            min_peers=int(args.min_peers),
+            seed=int(args.seed),
+        )
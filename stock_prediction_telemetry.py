@@ -0,0 +1,138 @@
+# Copyright 2020-2026 Jordi Corbilla. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import os
+import sys
+import json
+import time
+import platform
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, peak RSS is then left out
+    resource = None
+
+TELEMETRY_FILE = 'telemetry.jsonl'
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(peak / (1024.0 * 1024.0 if sys.platform == 'darwin' else 1024.0), 1)
+
+
+def load_telemetry(run_folder):
+    return pd.read_json(os.path.join(run_folder, TELEMETRY_FILE), lines=True)
+
+
+def latency_ms(call, window, repeats=50):
+    # median wall time of one single-window call, after a few warm-up calls
+    for _ in range(3):
+        call(window)
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        call(window)
+        timings.append((time.perf_counter() - started) * 1000.0)
+    return float(np.median(timings))
+
+
+# Appends one JSON line per epoch to telemetry.jsonl in the run folder: wall time split into
+# training and validation, training throughput, step latency percentiles, peak RSS, learning rate and the losses, tagged with the machine and
+# library versions so runs can be compared across hosts and releases.
+class TelemetryCallback(tf.keras.callbacks.Callback):
+    def __init__(self, project_folder, model_version='v1', stage=None, batch_size=None, samples=None, training_mode=None):
+        super().__init__()
+        self.path = os.path.join(project_folder, TELEMETRY_FILE)
+        self.model_version = model_version
+        self.stage = stage
+        self.batch_size = batch_size
+        self.samples = samples
+        self.training_mode = training_mode
+
+    def on_train_begin(self, logs=None):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._run = {
+            'host': platform.node(),
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'python': platform.python_version(),
+            'tensorflow': tf.version.VERSION,
+            'model_version': self.model_version,
+            'stage': self.stage,
+            'training_mode': self.training_mode,
+            'batch_size': self.batch_size,
+            'steps_per_execution': int(getattr(self.model, 'steps_per_execution', 1) or 1),
+        }
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._step_seconds = []
+        self._epoch_started = time.perf_counter()
+        self._train_ended = None
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self._batch_begin = batch
+        self._batch_started = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        # with steps_per_execution > 1 the hooks fire once per execution with its first and last
+        # step, the last one not clipped to the end of the epoch
+        seconds = time.perf_counter() - self._batch_started
+        steps = self.params.get('steps')
+        last = min(batch, steps - 1) if steps else batch
+        self._step_seconds.extend([seconds / max(1, last - self._batch_begin + 1)] * max(1, last - self._batch_begin + 1))
+        # everything after the last training batch is the validation pass
+        self._train_ended = time.perf_counter()
+
+    def _learning_rate(self):
+        optimizer = getattr(self.model, 'optimizer', None)
+        if optimizer is None:
+            return None
+        return float(np.asarray(optimizer.learning_rate))
+
+    def on_epoch_end(self, epoch, logs=None):
+        ended = time.perf_counter()
+        seconds = ended - self._epoch_started
+        train_ended = self._train_ended if self._train_ended is not None else ended
+        train_seconds = train_ended - self._epoch_started
+        steps = self.params.get('steps') or len(self._step_seconds)
+        samples = self.samples if self.samples is not None else steps * (self.batch_size or 1)
+        step_ms = np.asarray(self._step_seconds) * 1000.0
+        record = dict(self._run)
+        record.update({
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'epoch': epoch + 1,
+            'seconds': round(seconds, 4),
+            'train_seconds': round(train_seconds, 4),
+            'validation_seconds': round(ended - train_ended, 4),
+            'steps': steps,
+            'samples': samples,
+            'samples_per_second': round(samples / train_seconds, 1) if train_seconds > 0 else None,
+            'step_ms_p50': round(float(np.percentile(step_ms, 50)), 3) if len(step_ms) else None,
+            'step_ms_p90': round(float(np.percentile(step_ms, 90)), 3) if len(step_ms) else None,
+            'step_ms_p99': round(float(np.percentile(step_ms, 99)), 3) if len(step_ms) else None,
+            'peak_rss_mb': peak_rss_mb(),
+            'learning_rate': self._learning_rate(),
+        })
+        record.update({name: float(value) for name, value in (logs or {}).items() if name != 'learning_rate'})
+        with open(self.path, 'a', encoding='utf-8') as telemetry_file:
+            telemetry_file.write(json.dumps(record) + '\n')
@@ -0,0 +1,189 @@
+# Copyright 2020-2026 Jordi Corbilla. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import os
+import json
+import argparse
+import tempfile
+
+import numpy as np
+import tensorflow as tf
+
+from stock_prediction_telemetry import latency_ms
+
+TFLITE_QUANTIZATIONS = ('float16', 'int8')
+TFLITE_REPORT = 'tflite_report.json'
+
+
+def tflite_file_name(name, quantization):
+    # model_float16.tflite, model_direction_int8.tflite, ...
+    return ('model' if name == 'model' else 'model_' + name) + '_' + quantization + '.tflite'
+
+
+def convert_model(model, quantization='float16'):
+    # A fixed batch of one window: with a dynamic batch the LSTM's tensor lists have no static
+    # shape and cannot be lowered to builtin TFLite ops.
+    inputs = tf.keras.Input(shape=model.input_shape[1:], batch_size=1)
+    converter = tf.lite.TFLiteConverter.from_keras_model(tf.keras.Model(inputs, model(inputs)))
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization != 'int8':
+        raise ValueError('Unknown TFLite quantization: ' + str(quantization))
+    # 'int8' is dynamic-range quantization: int8 weights, float32 activations, no calibration data
+    return converter.convert()
+
+
+# Runs a converted model through the TFLite interpreter behind the two calls inference uses from a
+# Keras model: input_shape and predict(x, verbose=0), a list for the two-headed v8 model.
+class TFLiteModel:
+    def __init__(self, path):
+        self.path = path
+        self._interpreter = tf.lite.Interpreter(model_path=path)
+        signature = self._interpreter.get_signature_list()['serving_default']
+        self._input_name = signature['inputs'][0]
+        # output_0, output_1, ... follow the order of the Keras model's outputs
+        self._output_names = sorted(signature['outputs'], key=lambda output: int(output.rsplit('_', 1)[1]))
+        self._runner = self._interpreter.get_signature_runner()
+        self.input_shape = (None,) + tuple(int(size) for size in self._interpreter.get_input_details()[0]['shape'][1:])
+
+    def __call__(self, window):
+        outputs = self._runner(**{self._input_name: np.asarray(window, dtype=np.float32)})
+        if len(self._output_names) == 1:
+            return outputs[self._output_names[0]]
+        return [outputs[name] for name in self._output_names]
+
+    def predict(self, x, verbose=0):
+        # the interpreter was converted for one window per call
+        rows = [self(x[row:row + 1]) for row in range(len(x))]
+        if len(self._output_names) == 1:
+            return np.concatenate(rows, axis=0)
+        return [np.concatenate([row[output] for row in rows], axis=0) for output in range(len(self._output_names))]
+
+
+def load_tflite_models(run_folder, names, quantization):
+    return {name: TFLiteModel(os.path.join(run_folder, tflite_file_name(name, quantization))) for name in names}
+
+
+def _outputs(values):
+    return [np.asarray(value) for value in values] if isinstance(values, (list, tuple)) else [np.asarray(values)]
+
+
+def parity(model, lite_model, x):
+    keras_outputs = _outputs(model.predict(x, verbose=0))
+    lite_outputs = _outputs(lite_model.predict(x))
+    differences = np.concatenate([np.abs(keras - lite).ravel() for keras, lite in zip(keras_outputs, lite_outputs)])
+    return float(differences.max()), float(differences.mean())
+
+
+def export_tflite(project_folder, models, x_check, quantizations=TFLITE_QUANTIZATIONS, check_windows=64, check_data='test'):
+    # writes the TFLite files next to the .keras ones and tflite_report.json with, per model and
+    # quantization, the file size, the largest and mean output difference from Keras on the last
+    # check_windows windows of x_check and the per-window latency against Keras; check_data names
+    # what x_check holds
+    x_check = np.ascontiguousarray(x_check[-check_windows:], dtype=np.float32)
+    window = x_check[-1:]
+    report = []
+    for name, model in models.items():
+        keras_predict_ms = latency_ms(lambda batch: model.predict(batch, verbose=0), window)
+        keras_call_ms = latency_ms(lambda batch: model(batch, training=False), window)
+        for quantization in quantizations:
+            path = os.path.join(project_folder, tflite_file_name(name, quantization))
+            entry = {'model': name, 'quantization': quantization, 'file': os.path.basename(path), 'check_data': check_data}
+            try:
+                with open(path, 'wb') as tflite_file:
+                    tflite_file.write(convert_model(model, quantization))
+                lite_model = TFLiteModel(path)
+                max_abs_diff, mean_abs_diff = parity(model, lite_model, x_check)
+                entry.update({
+                    'size_kb': round(os.path.getsize(path) / 1024.0, 1),
+                    'max_abs_diff': max_abs_diff,
+                    'mean_abs_diff': mean_abs_diff,
+                    'keras_predict_ms': keras_predict_ms,
+                    'keras_call_ms': keras_call_ms,
+                    'tflite_ms': latency_ms(lite_model, window),
+                })
+                print('TFLite ' + entry['file'] + ': ' + str(entry['size_kb']) + ' KB, max diff '
+                      + f"{max_abs_diff:.2e}" + ', ' + f"{entry['tflite_ms']:.3f}" + ' ms per window against '
+                      + f"{keras_predict_ms:.2f}" + ' ms predict / ' + f"{keras_call_ms:.2f}" + ' ms call')
+            except Exception as error:
+                # an export problem must not fail the training run that produced the model
+                print('Warning: TFLite ' + quantization + ' export of ' + name + ' failed: ' + str(error))
+                entry['error'] = str(error)
+            report.append(entry)
+    with open(os.path.join(project_folder, TFLITE_REPORT), 'w', encoding='utf-8') as report_file:
+        json.dump(report, report_file, indent=2)
+    return report
+
+
+def load_run_test_windows(run_folder, previous, provider=None):
+    # the run's x_test, rebuilt with its stored scalers as train_LSTM_network built it before exporting
+    import pandas as pd
+    from stock_prediction_class import StockPrediction
+    from stock_prediction_data_provider import ReplayProvider, is_intraday
+    from stock_prediction_deep_learning import load_training_data
+    from stock_prediction_numpy import StockData
+
+    config = previous['config']
+    downloaded_path = os.path.join(run_folder, 'downloaded_data_' + config['ticker'] + '.csv')
+    if os.path.exists(downloaded_path) and not is_intraday(config.get('interval', '1d')):
+        run_folder = os.path.abspath(run_folder)
+        provider = ReplayProvider(search_folder=os.path.dirname(run_folder), run_folder=os.path.basename(run_folder))
+    with tempfile.TemporaryDirectory() as folder:
+        stock = StockPrediction(
+            config['ticker'],
+            pd.to_datetime(config['start_date']),
+            pd.to_datetime(config['validation_date']),
+            folder,
+            '',
+            1,
+            int(config['time_steps']),
+            '',
+            32,
+            config.get('interval', '1d'),
+        )
+        data = StockData(stock, provider=provider, min_max=previous['min_max'], input_scaler=previous['input_scaler'])
+        _, (x_test, _), _ = load_training_data(
+            data, stock, config.get('model_version', 'v1'),
+            use_returns=bool(config.get('use_returns', False)),
+            forecast_horizon=int(config.get('forecast_horizon', 1)),
+            trend_window=int(config.get('trend_window', 60)),
+        )
+        return np.array(x_test, dtype=np.float32)
+
+
+if __name__ == '__main__':
+    # export a run trained before the export step existed
+    from stock_prediction_data_provider import create_provider
+    from stock_prediction_deep_learning import load_previous_run
+
+    parser = argparse.ArgumentParser(description=("parsing arguments"))
+    parser.add_argument("-run_folder", required=True)
+    parser.add_argument("-quantization", default=",".join(TFLITE_QUANTIZATIONS))
+    parser.add_argument("-check_windows", default="64")
+    parser.add_argument("-data_provider", default=None, choices=["yahoo", "replay", "synthetic"])
+
+    args = parser.parse_args()
+
+    PREVIOUS = load_previous_run(args.run_folder)
+    CHECK_WINDOWS = int(args.check_windows)
+    try:
+        X_CHECK = load_run_test_windows(args.run_folder, PREVIOUS, create_provider(args.data_provider) if args.data_provider else None)
+        CHECK_DATA = 'test'
+    except Exception as error:
+        INPUT_SHAPE = tuple(next(iter(PREVIOUS['models'].values())).input_shape[1:])
+        print('Warning: could not rebuild the test windows of ' + args.run_folder + ', checking parity on random windows. ' + str(error))
+        X_CHECK = np.random.default_rng(42).uniform(0.0, 1.0, (CHECK_WINDOWS,) + INPUT_SHAPE).astype(np.float32)
+        CHECK_DATA = 'random'
+    export_tflite(args.run_folder, PREVIOUS['models'], X_CHECK, [quantization.strip() for quantization in args.quantization.split(',')], CHECK_WINDOWS, CHECK_DATA)
@@ -0,0 +1,172 @@
+# Copyright 2020-2026 Jordi Corbilla. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import os
+import time
+import argparse
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+import tensorflow as tf
+
+from stock_prediction_class import StockPrediction
+from stock_prediction_data_provider import create_provider
+from stock_prediction_deep_learning import build_models, get_data_modes, load_training_data, select_targets
+from stock_prediction_feature_store import FeatureStore
+from stock_prediction_lstm import LongShortTermMemory, TRAINING_MODES
+from stock_prediction_numpy import StockData
+
+
+class EpochTimer(tf.keras.callbacks.Callback):
+    # training time of each epoch, up to the end of its last batch: the validation pass that
+    # follows does not depend on the training mode and would dilute the comparison
+    def on_train_begin(self, logs=None):
+        self.seconds = []
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self._started = time.perf_counter()
+        self._train_ended = None
+
+    def on_train_batch_end(self, batch, logs=None):
+        self._train_ended = time.perf_counter()
+
+    def on_epoch_end(self, epoch, logs=None):
+        ended = self._train_ended if self._train_ended is not None else time.perf_counter()
+        self.seconds.append(ended - self._started)
+
+
+def steady_epoch_seconds(seconds):
+    # the first epoch pays for tracing and XLA compilation, the rest show the steady state
+    return float(np.median(seconds[1:])) if len(seconds) > 1 else float(seconds[0])
+
+
+class TrainingBenchmark:
+    def __init__(self, stock, provider=None, feature_store=None, forecast_horizon=1, trend_window=60, seed=42):
+        self.stock = stock
+        self.provider = provider
+        self.feature_store = feature_store
+        self.forecast_horizon = forecast_horizon
+        self.trend_window = trend_window
+        self.seed = seed
+        self._datasets = {}
+
+    def _training_data(self, model_version):
+        # versions sharing a preprocessing mode share the arrays
+        key = get_data_modes(model_version) + (model_version in ('v5', 'v6'), model_version in ('v7', 'v8'))
+        if key not in self._datasets:
+            data = StockData(self.stock, provider=self.provider, feature_store=self.feature_store)
+            (x_train, y_train), (x_test, y_test), _ = load_training_data(
+                data, self.stock, model_version, forecast_horizon=self.forecast_horizon, trend_window=self.trend_window,
+            )
+            self._datasets[key] = (x_train, y_train, x_test, y_test)
+        return self._datasets[key]
+
+    def run_one(self, model_version, training_mode='default', batch_size=None):
+        batch_size = batch_size if batch_size is not None else self.stock.get_batch_size()
+        x_train, y_train, x_test, y_test = self._training_data(model_version)
+        tf.keras.utils.set_random_seed(self.seed)
+        lstm = LongShortTermMemory(self.stock.get_project_folder(), training_mode=training_mode)
+        samples = 0
+        seconds = 0.0
+        first_epoch_seconds = 0.0
+        val_loss = None
+        for name, model, _, target in build_models(lstm, model_version, x_train, self.forecast_horizon):
+            timer = EpochTimer()
+            history = model.fit(
+                x_train,
+                select_targets(y_train, target),
+                epochs=self.stock.get_epochs(),
+                batch_size=batch_size,
+                validation_data=(x_test, select_targets(y_test, target)),
+                callbacks=[timer],
+                verbose=0,
+            )
+            samples += len(x_train)
+            seconds += steady_epoch_seconds(timer.seconds)
+            first_epoch_seconds += timer.seconds[0]
+            # v7 reports the magnitude model, as train_LSTM_network does
+            val_loss = float(history.history['val_loss'][-1])
+        return {
+            'model_version': model_version,
+            'training_mode': training_mode,
+            'batch_size': batch_size,
+            'mixed_precision': lstm.mode['mixed_precision'],
+            'samples_per_second': round(samples / seconds, 1),
+            'first_epoch_seconds': round(first_epoch_seconds, 3),
+            'epoch_seconds': round(seconds, 3),
+            'val_loss': val_loss,
+        }
+
+    def run(self, model_versions, training_modes):
+        results = []
+        for model_version in model_versions:
+            for training_mode in training_modes:
+                print('Benchmarking ' + model_version + ' / ' + training_mode)
+                results.append(self.run_one(model_version, training_mode))
+        summary = pd.DataFrame(results)
+        # speed-up against the default mode of the same version
+        baseline = summary[summary['training_mode'] == 'default'].set_index('model_version')['samples_per_second']
+        summary['speedup'] = (summary['samples_per_second'] / summary['model_version'].map(baseline)).round(2)
+        return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=("parsing arguments"))
+    parser.add_argument("-ticker", default="^FTSE")
+    parser.add_argument("-start_date", default="2017-11-01")
+    parser.add_argument("-validation_date", default="2021-09-01")
+    parser.add_argument("-epochs", default="3")
+    parser.add_argument("-batch_size", default="32")
+    parser.add_argument("-time_steps", default="10")
+    parser.add_argument("-forecast_horizon", default="10")
+    parser.add_argument("-trend_window", default="60")
+    parser.add_argument("-interval", default="1d")
+    parser.add_argument("-model_version", default="v1,v2,v3,v4,v5,v6,v7,v8")
+    parser.add_argument("-training_mode", default=",".join(TRAINING_MODES))
+    parser.add_argument("-data_provider", default="yahoo", choices=["yahoo", "replay", "synthetic"])
+    parser.add_argument("-feature_store", default="false")
+    parser.add_argument("-seed", default="42")
+
+    args = parser.parse_args()
+
+    PROJECT_FOLDER = os.path.join(os.getcwd(), 'training_benchmark')
+    os.makedirs(PROJECT_FOLDER, exist_ok=True)
+    stock_prediction = StockPrediction(args.ticker,
+                                       pd.to_datetime(args.start_date),
+                                       pd.to_datetime(args.validation_date),
+                                       PROJECT_FOLDER,
+                                       '',
+                                       int(args.epochs),
+                                       int(args.time_steps),
+                                       'training_benchmark',
+                                       int(args.batch_size),
+                                       args.interval)
+    MODES = [mode.strip() for mode in args.training_mode.split(',') if mode.strip()]
+    if 'default' not in MODES:
+        MODES.insert(0, 'default')
+    benchmark = TrainingBenchmark(
+        stock_prediction,
+        provider=create_provider(args.data_provider),
+        feature_store=FeatureStore() if str(args.feature_store).lower() in ("1", "true", "yes", "y") else None,
+        forecast_horizon=int(args.forecast_horizon),
+        trend_window=int(args.trend_window),
+        seed=int(args.seed),
+    )
+    SUMMARY = benchmark.run([version.strip() for version in args.model_version.split(',') if version.strip()], MODES)
+    with pd.option_context('display.max_columns', None, 'display.width', 200):
+        print(SUMMARY)
+    SUMMARY_PATH = os.path.join(PROJECT_FOLDER, 'training_benchmark_' + datetime.today().strftime("%Y%m%d_%H%M%S") + '.csv')
+    SUMMARY.to_csv(SUMMARY_PATH, index=False)
+    print('Benchmark written to ' + SUMMARY_PATH)
@@ -0,0 +1,76 @@
+# Copyright 2020-2026 Jordi Corbilla. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import numpy as np
+
+
+def _trend_next(m, sum_y, sum_xy):
+    # Least-squares line through (0, y_0) .. (m - 1, y_m-1) evaluated at x = m
+    sum_x = m * (m - 1) / 2.0
+    sum_xx = (m - 1) * m * (2 * m - 1) / 6.0
+    denominator = m * sum_xx - sum_x * sum_x
+    safe_denominator = np.where(denominator == 0, 1.0, denominator)
+    slope = (m * sum_xy - sum_x * sum_y) / safe_denominator
+    intercept = (sum_y - slope * sum_x) / m
+    return intercept + slope * m
+
+
+def rolling_trend_residuals(values, window, chunk_size=None):
+    # Residual of bar i against the linear trend fitted on values[max(0, i - window):i], the same
+    # quantity np.polyfit gives per bar, from running sums. The sums are rebuilt per chunk so
+    # their magnitude, and the cancellation error when differencing them, stays bounded.
+    if chunk_size is None:
+        chunk_size = max(256, 4 * window)
+    values = np.asarray(values, dtype=np.float64)
+    n = len(values)
+    residuals = np.empty(max(n - 1, 0), dtype=np.float64)
+    for chunk_start in range(1, n, chunk_size):
+        chunk_stop = min(chunk_start + chunk_size, n)
+        offset = max(0, chunk_start - window)
+        local = values[offset:chunk_stop] - values[offset]
+        prefix_y = np.concatenate(([0.0], np.cumsum(local)))
+        prefix_jy = np.concatenate(([0.0], np.cumsum(np.arange(len(local)) * local)))
+
+        i = np.arange(chunk_start, chunk_stop) - offset
+        s = np.maximum(np.arange(chunk_start, chunk_stop) - window, 0) - offset
+        m = (i - s).astype(np.float64)
+        sum_y = prefix_y[i] - prefix_y[s]
+        sum_xy = (prefix_jy[i] - prefix_jy[s]) - s * sum_y
+        trend = _trend_next(m, sum_y, sum_xy)
+        chunk_residuals = local[i] - trend
+        # with a single point there is no trend, fall back to the plain delta
+        single = m < 2
+        chunk_residuals[single] = local[i[single]] - local[i[single] - 1]
+        residuals[chunk_start - 1:chunk_stop - 1] = chunk_residuals
+    return residuals
+
+
+
+class TrendResiduals:
+    # Incremental form of rolling_trend_residuals for bars that arrive later: only the last window
+    # bars are kept, and extend returns the residuals of the new bars as the computation over the
+    # whole series would give them (to rounding), without revisiting the history.
+    def __init__(self, window):
+        self.window = window
+        self._tail = np.empty(0, dtype=np.float64)
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) == 0:
+            return np.empty(0, dtype=np.float64)
+        series = np.concatenate([self._tail, values])
+        # residual k belongs to bar k + 1, the very first bar of a series has none
+        residuals = rolling_trend_residuals(series, self.window)[max(len(self._tail) - 1, 0):]
+        self._tail = series[-self.window:]
+        return residuals
@@ -0,0 +1,267 @@
+# Copyright 2020-2026 Jordi Corbilla. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import os
+import sys
+import json
+import time
+import secrets
+import argparse
+import traceback
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from stock_prediction_bulk_download import BulkDownloader
+from stock_prediction_data_provider import FrameProvider, create_provider
+from stock_prediction_metadata_cache import MetadataCache
+
+
+def split_threads(workers, cores=None):
+    # Each worker gets an equal share of the cores for intra-op parallelism and a couple of
+    # inter-op threads, so workers * threads never exceeds the machine.
+    if cores is None:
+        cores = os.cpu_count() or 1
+    workers = max(1, min(workers, cores))
+    intra_op = max(1, cores // workers)
+    inter_op = 2 if intra_op >= 4 else 1
+    return workers, intra_op, inter_op
+
+
+def load_universe(universe):
+    # universe is a comma separated list of tickers, a text file with one ticker per line or a JSON
+    # file {"tickers": [...], "start_date": ..., "validation_date": ...}. JSON tickers may also be
+    # objects with their own start_date/validation_date.
+    defaults = {}
+    if os.path.exists(universe):
+        if universe.lower().endswith('.json'):
+            with open(universe, 'r', encoding='utf-8') as universe_file:
+                config = json.load(universe_file)
+            defaults = {key: value for key, value in config.items() if key != 'tickers'}
+            entries = config['tickers']
+        else:
+            with open(universe, 'r', encoding='utf-8') as universe_file:
+                entries = [line.strip() for line in universe_file if line.strip() and not line.startswith('#')]
+    else:
+        entries = [ticker.strip() for ticker in universe.split(',') if ticker.strip()]
+    jobs = []
+    for entry in entries:
+        job = dict(defaults)
+        job.update(entry if isinstance(entry, dict) else {'ticker': entry})
+        jobs.append(job)
+    return jobs
+
+
+def _init_worker(intra_op, inter_op):
+    # runs in the fresh worker process before TensorFlow is imported
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(intra_op)
+    os.environ['TF_NUM_INTEROP_THREADS'] = str(inter_op)
+    os.environ['OMP_NUM_THREADS'] = str(intra_op)
+    os.environ['MPLBACKEND'] = 'Agg'
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(intra_op)
+    tf.config.threading.set_inter_op_parallelism_threads(inter_op)
+
+
+def interrupted_run(output_folder, ticker):
+    # the latest run folder of the ticker that still holds training checkpoints
+    runs = [
+        os.path.join(output_folder, name) for name in os.listdir(output_folder)
+        if name.startswith(ticker + '_') and os.path.isdir(os.path.join(output_folder, name, 'checkpoints'))
+    ]
+    return max(runs, key=os.path.getmtime) if runs else None
+
+
+def _train_ticker(job):
+    from stock_prediction_class import StockPrediction
+    from stock_prediction_deep_learning import train_LSTM_network
+    from stock_prediction_feature_store import FeatureStore
+
+    ticker = job['ticker']
+    project_folder = interrupted_run(job['output_folder'], ticker) if job.get('resume') else None
+    resume = project_folder is not None
+    if resume:
+        token = os.path.basename(project_folder)
+    else:
+        token = ticker + '_' + datetime.today().strftime("%Y%m%d") + '_' + secrets.token_hex(16)
+        project_folder = os.path.join(job['output_folder'], token)
+    os.makedirs(project_folder, exist_ok=True)
+    result = {'ticker': ticker, 'status': 'failed', 'seconds': 0.0, 'epochs_run': 0, 'best_val_loss': None, 'run_folder': project_folder, 'error': None}
+    started = time.perf_counter()
+    with open(os.path.join(project_folder, 'train.log'), 'a' if resume else 'w', encoding='utf-8') as log_file:
+        with contextlib.redirect_stdout(log_file), contextlib.redirect_stderr(log_file):
+            try:
+                stock = StockPrediction(
+                    ticker,
+                    pd.to_datetime(job['start_date']),
+                    pd.to_datetime(job['validation_date']),
+                    project_folder,
+                    job['github_url'],
+                    int(job['epochs']),
+                    int(job['time_steps']),
+                    token,
+                    int(job['batch_size']),
+                    job['interval'],
+                )
+                if 'close' in job:
+                    provider = FrameProvider(job['close'].to_frame(ticker), info={ticker: job['info']})
+                else:
+                    provider = create_provider(job['data_provider'])
+                history = train_LSTM_network(
+                    stock,
+                    use_returns=job['use_returns'],
+                    model_version=job['model_version'],
+                    forecast_horizon=int(job['forecast_horizon']),
+                    trend_window=int(job['trend_window']),
+                    provider=provider,
+                    feature_store=FeatureStore() if job['feature_store'] else None,
+                    resume=resume,
+                    training_mode=job.get('training_mode', 'default'),
+                    plot_mode=job.get('plot_mode', 'background'),
+                )
+                if history is None:
+                    result['error'] = 'training did not run, see train.log'
+                else:
+                    val_loss = history.history.get('val_loss', [])
+                    result['status'] = 'ok'
+                    result['epochs_run'] = len(history.history.get('loss', []))
+                    result['best_val_loss'] = float(min(val_loss)) if val_loss else None
+            except Exception as error:
+                result['error'] = str(error)
+                traceback.print_exc()
+    result['seconds'] = round(time.perf_counter() - started, 3)
+    return result
+
+
+class UniverseTrainer:
+    def __init__(self, workers=2, cores=None, data_provider='yahoo', output_folder=None):
+        self.workers, self.intra_op, self.inter_op = split_threads(workers, cores)
+        self.data_provider = data_provider
+        self.output_folder = output_folder if output_folder is not None else os.getcwd()
+
+    def _warm_caches(self, jobs):
+        # download prices and metadata once, concurrently and rate limited, and hand every job its
+        # close series: the workers serve it through FrameProvider and never call the provider
+        provider = create_provider(self.data_provider)
+        if not provider.cacheable:
+            return jobs
+        start = min(pd.to_datetime(job['start_date']) for job in jobs)
+        intervals = sorted({job['interval'] for job in jobs})
+        tickers = sorted({job['ticker'] for job in jobs})
+        downloader = BulkDownloader(provider=provider)
+        frames = {interval: downloader.download(tickers, start, interval=interval)[0] for interval in intervals}
+        metadata = MetadataCache(provider=provider)
+        metadata.fill(tickers)
+        prepared = []
+        for job in jobs:
+            frame = frames[job['interval']]
+            if job['ticker'] in frame.columns:
+                info = {'shortName': metadata.get_short_name(job['ticker']), 'currency': metadata.get_currency(job['ticker'])}
+                job = dict(job, close=frame[job['ticker']].dropna().astype(np.float64), info=info)
+            # a ticker the bulk download could not fetch is left to the worker's own provider
+            prepared.append(job)
+        return prepared
+
+    def run(self, jobs):
+        jobs = [dict(job, data_provider=self.data_provider, output_folder=self.output_folder) for job in jobs]
+        jobs = self._warm_caches(jobs)
+        print('Training ' + str(len(jobs)) + ' tickers on ' + str(self.workers) + ' workers, '
+              + str(self.intra_op) + ' intra-op / ' + str(self.inter_op) + ' inter-op threads each')
+        started = time.perf_counter()
+        results = {}
+        # spawn, not fork: TensorFlow's runtime does not survive being forked
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=_init_worker,
+                                 initargs=(self.intra_op, self.inter_op)) as executor:
+            # keyed by position, a universe may list the same ticker with different settings
+            futures = {executor.submit(_train_ticker, job): index for index, job in enumerate(jobs)}
+            for future in as_completed(futures):
+                index = futures[future]
+                ticker = jobs[index]['ticker']
+                try:
+                    results[index] = future.result()
+                except Exception as error:
+                    # the worker process itself died
+                    results[index] = {'ticker': ticker, 'status': 'failed', 'seconds': 0.0, 'epochs_run': 0, 'best_val_loss': None, 'run_folder': None, 'error': str(error)}
+                print(ticker + ': ' + results[index]['status'] + ' in ' + str(results[index]['seconds']) + 's')
+        summary = pd.DataFrame([results[index] for index in range(len(jobs))])
+        summary.index.name = 'job'
+        self.print_summary(summary, time.perf_counter() - started)
+        summary_path = os.path.join(self.output_folder, 'universe_summary_' + datetime.today().strftime("%Y%m%d_%H%M%S") + '.csv')
+        summary.to_csv(summary_path)
+        print('Summary written to ' + summary_path)
+        return summary
+
+    def print_summary(self, summary, wall_seconds):
+        ok = int((summary['status'] == 'ok').sum())
+        print('Universe training: ' + str(ok) + '/' + str(len(summary)) + ' tickers ok, wall time '
+              + f"{wall_seconds:.1f}" + 's, summed job time ' + f"{summary['seconds'].sum():.1f}" + 's')
+        with pd.option_context('display.max_columns', None, 'display.width', 200):
+            print(summary[['ticker', 'status', 'seconds', 'epochs_run', 'best_val_loss', 'error']])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=("parsing arguments"))
+    parser.add_argument("-universe", default="GOOG,TSLA,^FTSE")
+    parser.add_argument("-start_date", default="2017-11-01")
+    parser.add_argument("-validation_date", default="2021-09-01")
+    parser.add_argument("-epochs", default="100")
+    parser.add_argument("-batch_size", default="10")
+    parser.add_argument("-time_steps", default="3")
+    parser.add_argument("-github_url", default="https://github.com/JordiCorbilla/stock-prediction-deep-neural-learning/raw/master/")
+    parser.add_argument("-use_returns", default="false")
+    parser.add_argument("-model_version", default="v7")
+    parser.add_argument("-forecast_horizon", default="10")
+    parser.add_argument("-trend_window", default="60")
+    parser.add_argument("-interval", default="1d")
+    parser.add_argument("-data_provider", default="yahoo", choices=["yahoo", "replay", "synthetic"])
+    parser.add_argument("-feature_store", default="false")
+    parser.add_argument("-workers", default="2")
+    parser.add_argument("-cores", default=None)
+    parser.add_argument("-resume", default="false")
+    parser.add_argument("-training_mode", default="default", choices=["default", "jit", "steps", "compiled", "bf16"])
+    parser.add_argument("-plot_mode", default="background", choices=["background", "none"])
+
+    args = parser.parse_args()
+
+    # command line values are the defaults, a JSON universe can override them per ticker
+    DEFAULTS = {
+        'start_date': args.start_date,
+        'validation_date': args.validation_date,
+        'epochs': int(args.epochs),
+        'batch_size': int(args.batch_size),
+        'time_steps': int(args.time_steps),
+        'github_url': args.github_url,
+        'use_returns': str(args.use_returns).lower() in ("1", "true", "yes", "y"),
+        'model_version': args.model_version,
+        'forecast_horizon': int(args.forecast_horizon),
+        'trend_window': int(args.trend_window),
+        'interval': args.interval,
+        'feature_store': str(args.feature_store).lower() in ("1", "true", "yes", "y"),
+        'resume': str(args.resume).lower() in ("1", "true", "yes", "y"),
+        'training_mode': args.training_mode,
+        'plot_mode': args.plot_mode,
+    }
+    JOBS = [dict(DEFAULTS, **job) for job in load_universe(args.universe)]
+    trainer = UniverseTrainer(
+        workers=int(args.workers),
+        cores=int(args.cores) if args.cores else None,
+        data_provider=args.data_provider,
+    )
+    SUMMARY = trainer.run(JOBS)
+    sys.exit(0 if (SUMMARY['status'] == 'ok').all() else 1)
@@ -0,0 +1,120 @@
+# Copyright 2020-2026 Jordi Corbilla. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+
+def _as_column(values):
+    values = np.asarray(values)
+    if values.ndim == 1:
+        values = values.reshape(-1, 1)
+    return values
+
+
+def input_windows(values, time_steps, start, stop):
+    # Row k holds values[i - time_steps:i] for i = start + k, i in [start, stop). The result is a
+    # strided view over values with shape (rows, time_steps, features), nothing is copied.
+    values = _as_column(values)
+    if start < time_steps:
+        raise ValueError('start must be at least time_steps')
+    stop = min(max(stop, start), values.shape[0] + 1)
+    if values.shape[0] < time_steps:
+        return np.empty((0, time_steps, values.shape[1]), dtype=values.dtype)
+    windows = sliding_window_view(values, time_steps, axis=0)
+    return windows[start - time_steps:stop - time_steps].transpose(0, 2, 1)
+
+
+def target_windows(values, start, stop, horizon=None):
+    # With horizon=None row k is values[start + k, 0]. With a horizon row k is
+    # values[start + k:start + k + horizon, 0], again as a view.
+    column = _as_column(values)[:, 0]
+    stop = max(stop, start)
+    if horizon is None:
+        return column[start:stop]
+    if column.shape[0] < horizon:
+        return np.empty((0, horizon), dtype=column.dtype)
+    return sliding_window_view(column, horizon)[start:stop]
+
+
+def _owner(array):
+    while getattr(array, 'base', None) is not None:
+        array = array.base
+    return array
+
+
+def window_memory(arrays):
+    materialised = 0
+    owners = {}
+    for array in arrays:
+        materialised += array.size * array.itemsize
+        owner = _owner(array)
+        if isinstance(owner, np.ndarray):
+            owners[id(owner)] = owner.nbytes
+        else:
+            owners[id(array)] = array.nbytes if array.flags.owndata else 0
+    referenced = sum(owners.values())
+    return {
+        'materialised_bytes': int(materialised),
+        'referenced_bytes': int(referenced),
+        'saved_bytes': int(max(materialised - referenced, 0)),
+    }
+
+
+def print_window_memory(label, arrays):
+    report = window_memory(arrays)
+    print(
+        label + ' windows: ' + f"{report['materialised_bytes'] / 1e6:.2f}" + ' MB if materialised, '
+        + f"{report['referenced_bytes'] / 1e6:.2f}" + ' MB referenced, '
+        + f"{report['saved_bytes'] / 1e6:.2f}" + ' MB saved'
+    )
+    return report
+
+
+def array_bytes(array):
+    # pandas objects are measured with their index, NumPy arrays by their own buffer
+    if hasattr(array, 'memory_usage'):
+        return int(np.sum(array.memory_usage(index=True, deep=True)))
+    return int(np.asarray(array).nbytes)
+
+
+def _dtype_names(array):
+    if isinstance(array, pd.DataFrame):
+        return [str(dtype) for dtype in array.dtypes]
+    return [str(array.dtype)]
+
+
+def print_stage_memory(stage, arrays):
+    total = sum(array_bytes(array) for array in arrays)
+    dtypes = sorted({name for array in arrays for name in _dtype_names(array)})
+    print('Stage ' + stage + ': ' + f"{total / 1e6:.2f}" + ' MB allocated (' + ', '.join(dtypes) + ')')
+    return total
+
+
+def window_series(windows, chunk_rows=65536):
+    # Inverse of input_windows/target_windows: collapses step-one windows of shape (rows, width, ...)
+    # back to the series they were cut from, (rows + width - 1, ...).
+    windows = np.asarray(windows)
+    if windows.shape[0] == 0:
+        return np.empty((0,) + windows.shape[2:], dtype=windows.dtype)
+    # every row must be the previous one shifted by one step, otherwise the series would silently
+    # drop the bars of any row that does not follow; compared in blocks to bound the temporaries
+    equal_nan = np.issubdtype(windows.dtype, np.inexact)
+    for block_start in range(1, windows.shape[0], chunk_rows):
+        block_stop = min(block_start + chunk_rows, windows.shape[0])
+        shifted = windows[block_start - 1:block_stop - 1, 1:]
+        if not np.array_equal(windows[block_start:block_stop, :-1], shifted, equal_nan=equal_nan):
+            raise ValueError('windows do not overlap with a step of one')
+    return np.concatenate([windows[0], windows[1:, -1]], axis=0)
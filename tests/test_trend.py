@@ -0,0 +1,54 @@
+# Copyright 2020-2026 Jordi Corbilla. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import numpy as np
+import pytest
+
+from stock_prediction_trend import TrendResiduals, rolling_trend_residuals
+
+
+def polyfit_residuals(values, window):
+    # the per-bar np.polyfit loop rolling_trend_residuals replaced
+    residuals = []
+    for i in range(1, len(values)):
+        start = max(0, i - window)
+        y = values[start:i]
+        if len(y) < 2:
+            residuals.append(values[i] - values[i - 1])
+            continue
+        x = np.arange(len(y))
+        slope, intercept = np.polyfit(x, y, 1)
+        residuals.append(values[i] - (slope * len(y) + intercept))
+    return np.asarray(residuals)
+
+
+def random_walk(bars, seed=7):
+    return 100.0 * np.exp(np.cumsum(np.random.default_rng(seed).normal(0.0, 0.01, bars)))
+
+
+@pytest.mark.parametrize('window', [1, 2, 3, 60, 250])
+def test_matches_polyfit(window):
+    values = random_walk(1500)
+    expected = polyfit_residuals(values, window)
+    # small chunks so the per-chunk rebuild of the running sums is exercised as well
+    np.testing.assert_allclose(rolling_trend_residuals(values, window), expected, rtol=0, atol=1e-8)
+    np.testing.assert_allclose(rolling_trend_residuals(values, window, chunk_size=97), expected, rtol=0, atol=1e-8)
+
+
+@pytest.mark.parametrize('window', [2, 60])
+def test_incremental_matches_batch(window):
+    values = random_walk(700)
+    trend = TrendResiduals(window)
+    pieces = [trend.extend(values[start:stop]) for start, stop in ((0, 1), (1, 45), (45, 46), (46, 400), (400, 700))]
+    np.testing.assert_allclose(np.concatenate(pieces), polyfit_residuals(values, window), rtol=0, atol=1e-8)
@@ -0,0 +1,140 @@
+# Copyright 2020-2026 Jordi Corbilla. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.preprocessing import MinMaxScaler
+
+from stock_prediction_class import StockPrediction
+from stock_prediction_data_provider import FrameProvider
+from stock_prediction_numpy import StockData
+from stock_prediction_trend import rolling_trend_residuals
+
+TICKER = 'TEST'
+VALIDATION_DATE = pd.Timestamp('2021-03-01')
+
+
+def price_frame(bars=420, seed=11):
+    index = pd.bdate_range('2020-01-01', periods=bars, name='Date')
+    close = 100.0 * np.exp(np.cumsum(np.random.default_rng(seed).normal(0.0, 0.01, bars)))
+    return pd.DataFrame({TICKER: close}, index=index)
+
+
+def stock_data(frame):
+    stock = StockPrediction(TICKER, frame.index[0], VALIDATION_DATE, None, '', 1, 3, '', 32)
+    return StockData(stock, provider=FrameProvider(frame), dtype=np.float64)
+
+
+def loop_transform(data, time_steps, use_returns, use_deltas, use_trend_residual, trend_window, forecast_horizon):
+    # the per-row loops download_transform_to_numpy used before input_windows/target_windows
+    min_max = MinMaxScaler(feature_range=(0, 1))
+    input_scaler = MinMaxScaler(feature_range=(0, 1))
+    training_data = data[data['Date'] < VALIDATION_DATE].set_index('Date')
+    test_data = data[data['Date'] >= VALIDATION_DATE].set_index('Date')
+    full_series = data.set_index('Date')['Close']
+    if use_returns:
+        target = np.log(full_series).diff().dropna()
+    elif use_deltas:
+        target = full_series.diff().dropna()
+    elif use_trend_residual:
+        target = pd.Series(rolling_trend_residuals(full_series.to_numpy(), trend_window), index=full_series.index[1:], name='Close')
+
+    x_train, y_train, x_test, y_test = [], [], [], []
+    if use_deltas or use_trend_residual:
+        training_target = target[target.index < VALIDATION_DATE]
+        close_scaled = input_scaler.fit_transform(training_data)
+        target_scaled = min_max.fit_transform(training_target.to_frame())
+        close_scaled_aligned = close_scaled[1:]
+        for i in range(time_steps, close_scaled_aligned.shape[0] - forecast_horizon + 1):
+            x_train.append(close_scaled_aligned[i - time_steps:i])
+            y_train.append(target_scaled[i:i + forecast_horizon, 0])
+        inputs_x = input_scaler.transform(pd.concat((training_data, test_data), axis=0))[1:]
+        inputs_y = min_max.transform(target.to_frame())
+        for i in range(len(training_target), inputs_y.shape[0] - forecast_horizon + 1):
+            x_test.append(inputs_x[i - time_steps:i])
+            y_test.append(inputs_y[i:i + forecast_horizon, 0])
+    else:
+        if use_returns:
+            training_returns = target[target.index < VALIDATION_DATE]
+            train_scaled = min_max.fit_transform(training_returns.to_frame())
+            inputs = target[len(training_returns) - time_steps:].to_frame()
+        else:
+            train_scaled = min_max.fit_transform(training_data)
+            total_data = pd.concat((training_data, test_data), axis=0)
+            inputs = total_data[len(total_data) - len(test_data) - time_steps:]
+        for i in range(time_steps, train_scaled.shape[0]):
+            x_train.append(train_scaled[i - time_steps:i])
+            y_train.append(train_scaled[i, 0])
+        test_scaled = min_max.transform(inputs)
+        for i in range(time_steps, test_scaled.shape[0]):
+            x_test.append(test_scaled[i - time_steps:i])
+            y_test.append(test_scaled[i, 0])
+    return np.array(x_train), np.array(y_train), np.array(x_test), np.array(y_test)
+
+
+def loop_direction(data, time_steps):
+    # the per-row loops prepare_delta_direction_data (v7/v8) used before the views
+    min_max = MinMaxScaler(feature_range=(0, 1))
+    input_scaler = MinMaxScaler(feature_range=(0, 1))
+    training_data = data[data.index < VALIDATION_DATE]
+    deltas = data['Close'].diff().dropna()
+    training_deltas = deltas[deltas.index < VALIDATION_DATE]
+    input_scaler.fit(training_data)
+    close_scaled_aligned = input_scaler.transform(data)[1:]
+    mag_scaled = min_max.fit_transform(training_deltas.abs().to_frame())
+    total_mag_scaled = min_max.transform(deltas.abs().to_frame())
+    direction = (deltas > 0).astype(np.float64)
+
+    x_train, y_dir_train, y_mag_train = [], [], []
+    for i in range(time_steps, len(training_deltas)):
+        x_train.append(close_scaled_aligned[i - time_steps:i])
+        y_dir_train.append(direction.iloc[i])
+        y_mag_train.append(mag_scaled[i, 0])
+    x_test, y_dir_test, y_mag_test = [], [], []
+    for i in range(len(training_deltas), len(deltas)):
+        x_test.append(close_scaled_aligned[i - time_steps:i])
+        y_dir_test.append(direction.iloc[i])
+        y_mag_test.append(total_mag_scaled[i, 0])
+    return [np.array(values) for values in (x_train, y_dir_train, y_mag_train, x_test, y_dir_test, y_mag_test)]
+
+
+@pytest.mark.parametrize('mode, time_steps, forecast_horizon', [
+    ('plain', 3, 1), ('plain', 20, 1), ('returns', 20, 1),
+    ('deltas', 3, 1), ('deltas', 20, 5), ('trend_residual', 20, 1), ('trend_residual', 20, 5),
+])
+def test_transform_matches_loops(tmp_path, mode, time_steps, forecast_horizon):
+    flags = {'use_returns': mode == 'returns', 'use_deltas': mode == 'deltas', 'use_trend_residual': mode == 'trend_residual'}
+    frame = price_frame()
+    data = stock_data(frame)
+    (x_train, y_train), (x_test, y_test), _ = data.download_transform_to_numpy(
+        time_steps, str(tmp_path), trend_window=30, forecast_horizon=forecast_horizon, **flags)
+
+    raw = frame.rename(columns={TICKER: 'Close'}).reset_index()
+    expected = loop_transform(raw, time_steps, trend_window=30, forecast_horizon=forecast_horizon, **flags)
+    for actual, baseline in zip((x_train, y_train, x_test, y_test), expected):
+        assert actual.shape == baseline.shape
+        np.testing.assert_array_equal(actual, baseline)
+
+
+@pytest.mark.parametrize('time_steps', [3, 20])
+def test_direction_data_matches_loops(time_steps):
+    frame = price_frame()
+    data = stock_data(frame)
+    (x_train, y_dir_train, y_mag_train), (x_test, y_dir_test, y_mag_test), _ = data.prepare_delta_direction_data(time_steps, VALIDATION_DATE)
+
+    expected = loop_direction(frame.rename(columns={TICKER: 'Close'}), time_steps)
+    for actual, baseline in zip((x_train, y_dir_train, y_mag_train, x_test, y_dir_test, y_mag_test), expected):
+        assert actual.shape == baseline.shape
+        np.testing.assert_array_equal(actual, baseline)